@@ -0,0 +1,375 @@
+"""
+Batch mode for generate_rhino_script.py: generates a script for every prompt
+in a file.
+
+Prompts (one per line; blank lines and lines starting with # are skipped)
+are sent through generate_rhino_script.generate_script_content by a pool of
+worker threads. A RateLimiter keeps the requests within the account's
+requests-per-minute and tokens-per-minute limits. A 429 answer pauses every
+worker for the server's Retry-After (or an exponential backoff when there is
+none), with random jitter so the workers do not all retry at the same
+moment. Each script is added to the session as soon as it arrives.
+
+    python batch_generate.py prompts.txt [--workers 4] [--rpm 500] [--tpm 30000] [--session NAME]
+
+Without --session a new session is started. Prompts that still fail after
+the retries are listed at the end and are not added to the session.
+benchmark_batch.py measures the throughput against fake_openai_server.py.
+"""
+import io
+import os
+import random
+import sys
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import chat_history
+import generate_rhino_script
+import openai_client
+import response_cache
+import session_store
+
+# time.perf_counter is not available on IronPython 2.7
+_clock = getattr(time, "perf_counter", time.time)
+
+WORKERS = int(os.getenv("RHINO_AI_BATCH_WORKERS", "4"))
+
+# Account limits (requests and tokens per minute); 0 turns a limit off
+RPM = int(os.getenv("RHINO_AI_RPM", "500"))
+TPM = int(os.getenv("RHINO_AI_TPM", "30000"))
+
+MAX_RETRIES = int(os.getenv("RHINO_AI_MAX_RETRIES", "6"))
+
+# The limiter lets at most this many seconds' worth of requests through at
+# once (the API enforces per-minute limits over shorter windows)
+BURST_SECONDS = 1.0
+
+# max_tokens of the requests, which the API counts against the TPM limit up front
+REPLY_TOKENS = 1000
+
+# Exponential backoff (seconds) when the server sends no Retry-After, and the
+# largest random fraction added to every delay
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+JITTER = 0.5
+
+RETRY_STATUSES = (408, 409, 429, 500, 502, 503, 504)
+
+
+class TokenBucket(object):
+    """
+    Holds up to `capacity` units and refills at `per_minute` units a minute.
+    A request larger than the bucket waits for a full bucket and leaves it in
+    debt, so the long-run rate still holds.
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = float(capacity or per_minute)
+        self.level = self.capacity
+        self.updated = _clock()
+
+    def wait_time(self, amount, now):
+        """
+        Seconds until `amount` units are available.
+        """
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= amount
+
+
+class RateLimiter(object):
+    """
+    Requests-per-minute and tokens-per-minute buckets shared by all workers,
+    plus a pause that a rate-limited worker imposes on the others.
+    """
+
+    def __init__(self, rpm=RPM, tpm=TPM, burst_seconds=BURST_SECONDS):
+        fraction = burst_seconds / 60.0
+        self.requests = TokenBucket(rpm, max(rpm * fraction, 1)) if rpm else None
+        self.tokens = TokenBucket(tpm, max(tpm * fraction, 1)) if tpm else None
+        self.paused_until = 0.0
+        self.waited = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self, tokens=0):
+        """
+        Blocks until one request of `tokens` tokens fits both limits, then
+        takes it. Returns the seconds waited.
+        """
+        start = _clock()
+        with self._condition:
+            while True:
+                now = _clock()
+                wait = self.paused_until - now
+                if self.requests is not None:
+                    wait = max(wait, self.requests.wait_time(1, now))
+                if self.tokens is not None:
+                    wait = max(wait, self.tokens.wait_time(tokens, now))
+                if wait <= 0:
+                    break
+                self._condition.wait(wait)
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None:
+                self.tokens.take(tokens)
+            waited = _clock() - start
+            self.waited += waited
+        return waited
+
+    def pause(self, seconds):
+        """
+        Holds back every request for `seconds` (the limits are per account,
+        so one 429 applies to all workers).
+        """
+        with self._condition:
+            self.paused_until = max(self.paused_until, _clock() + seconds)
+
+
+def parse_retry_after(value):
+    """
+    Seconds from a Retry-After header; None if missing or given as an HTTP date.
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, retry_after=None, rng=random):
+    """
+    Seconds to wait before retry number `attempt` (1 for the first): the
+    server's Retry-After if it sent one, otherwise exponential backoff, plus
+    up to JITTER of that at random.
+    """
+    delay = parse_retry_after(retry_after)
+    if delay is None:
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+    return delay * (1.0 + JITTER * rng.random())
+
+
+def read_prompts(path):
+    prompts = []
+    with io.open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                prompts.append(line)
+    return prompts
+
+
+def prompt_messages(prompt):
+    # Batch prompts are independent: no history, only the system prompt
+    return chat_history.ChatHistory(generate_rhino_script.SYSTEM_PROMPT).messages(prompt)
+
+
+def request_tokens(messages):
+    return sum(chat_history.estimate_tokens(m["content"]) for m in messages) + REPLY_TOKENS
+
+
+class PromptResult(object):
+    """
+    Outcome of one prompt: the script or the last error, and what it took.
+    """
+
+    def __init__(self, number, prompt):
+        self.number = number
+        self.prompt = prompt
+        self.code = None
+        self.error = None
+        self.attempts = 0
+        self.rate_limited = 0
+        self.seconds = 0.0
+        self.waited = 0.0
+        self.index = None
+        self.path = None
+
+    @property
+    def ok(self):
+        return self.code is not None
+
+
+class BatchRunner(object):
+    """
+    Runs prompts on `workers` threads under one RateLimiter. `generate` is
+    called with the messages and returns the reply text or raises
+    openai_client.APIError; it defaults to generate_script_content.
+    """
+
+    def __init__(self, workers=WORKERS, rpm=RPM, tpm=TPM, max_retries=MAX_RETRIES, cache=None,
+                 generate=None, rng=None):
+        if generate is None:
+            def generate(messages):
+                return generate_rhino_script.generate_script_content(messages, cache=cache, raise_errors=True)
+        self.generate = generate
+        self.workers = max(1, workers)
+        self.max_retries = max_retries
+        self.limiter = RateLimiter(rpm, tpm)
+        self.rng = rng or random.Random()
+
+    def run_prompt(self, number, prompt):
+        result = PromptResult(number, prompt)
+        messages = prompt_messages(prompt)
+        tokens = request_tokens(messages)
+        start = _clock()
+        for attempt in range(self.max_retries + 1):
+            result.waited += self.limiter.acquire(tokens)
+            result.attempts += 1
+            retry_after = None
+            try:
+                result.code = generate_rhino_script.extract_code(self.generate(messages))
+                result.error = None
+                break
+            except openai_client.APIError as e:
+                result.error = "API Error: {} {}".format(e.status, e.body)
+                if e.status not in RETRY_STATUSES:
+                    break
+                if e.status == 429:
+                    result.rate_limited += 1
+                retry_after = e.retry_after
+            except Exception as e:
+                # Connection errors and timeouts are retried like server errors
+                result.error = "Error getting response: " + str(e)
+            if attempt == self.max_retries:
+                break
+            delay = backoff_delay(attempt + 1, retry_after, self.rng)
+            if retry_after is not None or result.rate_limited:
+                self.limiter.pause(delay)
+            else:
+                time.sleep(delay)
+        result.seconds = _clock() - start
+        return result
+
+    def run(self, prompts, session=None, on_result=None):
+        """
+        Runs all prompts and returns a BatchStats. Each successful script is
+        added to `session` (a session_store.Session) as it arrives, from the
+        calling thread; on_result(result) is called for every prompt.
+        """
+        tasks = queue.Queue()
+        for number, prompt in enumerate(prompts, 1):
+            tasks.put((number, prompt))
+        results = queue.Queue()
+
+        def worker():
+            while True:
+                try:
+                    number, prompt = tasks.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    results.put(self.run_prompt(number, prompt))
+                except Exception as e:
+                    result = PromptResult(number, prompt)
+                    result.error = "Error: " + str(e)
+                    results.put(result)
+
+        start = _clock()
+        for _ in range(min(self.workers, len(prompts))):
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+
+        done = []
+        for _ in range(len(prompts)):
+            result = results.get()
+            if result.ok and session is not None:
+                result.index = session.allocate_index()
+                result.path = session.add_turn(result.index, result.prompt, result.code)
+            done.append(result)
+            if on_result:
+                on_result(result)
+        return BatchStats(done, _clock() - start, self.limiter.waited)
+
+
+class BatchStats(object):
+    def __init__(self, results, seconds, waited):
+        self.results = sorted(results, key=lambda r: r.number)
+        self.seconds = seconds
+        self.waited = waited
+
+    @property
+    def failed(self):
+        return [r for r in self.results if not r.ok]
+
+    def stats(self):
+        done = len(self.results) - len(self.failed)
+        return {
+            "prompts": len(self.results),
+            "succeeded": done,
+            "failed": len(self.failed),
+            "requests": sum(r.attempts for r in self.results),
+            "rate_limited": sum(r.rate_limited for r in self.results),
+            "seconds": self.seconds,
+            "waited": self.waited,
+            "per_minute": done * 60.0 / self.seconds if self.seconds else 0.0,
+        }
+
+    def format_stats(self):
+        s = self.stats()
+        return ("{} of {} prompts in {:.1f} s ({:.1f} per minute), {} requests, {} rate limited, "
+                "{:.1f} s waiting for the limiter").format(
+            s["succeeded"], s["prompts"], s["seconds"], s["per_minute"], s["requests"],
+            s["rate_limited"], s["waited"])
+
+
+def print_result(total):
+    def on_result(result):
+        if result.ok:
+            status = "ok " + os.path.basename(result.path) if result.path else "ok"
+        else:
+            status = "failed: " + result.error
+        print("[{}/{}] {} ({:.1f} s, {} attempts) {}".format(
+            result.number, total, result.prompt[:50], result.seconds, result.attempts, status))
+    return on_result
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+
+    def option(name, default=None):
+        if name in args:
+            i = args.index(name)
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        return default
+
+    workers = int(option("--workers", WORKERS))
+    rpm = int(option("--rpm", RPM))
+    tpm = int(option("--tpm", TPM))
+    session_name = option("--session")
+    if len(args) != 1:
+        print("usage: python batch_generate.py PROMPTS.txt [--workers N] [--rpm N] [--tpm N] [--session NAME]")
+        sys.exit(1)
+    if not generate_rhino_script.API_KEY:
+        print("Error: OPENAI_API_KEY not found. Please ensure .env file exists and is loaded.")
+        sys.exit(1)
+
+    prompts = read_prompts(args[0])
+    store = session_store.SessionStore(dedup=generate_rhino_script.DEDUP_SESSIONS)
+    session = store.open_session(session_name) if session_name else store.create_session()
+    cache = response_cache.ResponseCache() if generate_rhino_script.USE_RESPONSE_CACHE else None
+    print("Generating {} scripts into session {} with {} workers".format(len(prompts), session.name, workers))
+
+    runner = BatchRunner(workers, rpm, tpm, cache=cache)
+    batch = runner.run(prompts, session, on_result=print_result(len(prompts)))
+    print(batch.format_stats())
+    if batch.failed:
+        print("Failed prompts:")
+        for result in batch.failed:
+            print("  {}: {}".format(result.number, result.prompt))
+        sys.exit(1)
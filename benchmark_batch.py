@@ -0,0 +1,61 @@
+"""
+Measures batch_generate.py throughput against fake_openai_server.py.
+
+The fake server takes response_delay seconds per request, answers a random
+share of requests with 429 and also enforces an rpm_limit (per second, as
+the real API does), sending Retry-After with each 429. The same prompts are
+run with one worker, with a pool of workers and no client-side limiter, and
+with the pool under a limiter set a little under the server's limit.
+Scripts are written to a temporary sessions folder.
+
+    python benchmark_batch.py [prompts] [workers] [rpm_limit]
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+import fake_openai_server
+import session_store
+
+PROMPTS = ["make a sphere of radius {}".format(i) for i in range(1, 1000)]
+
+
+def run(count=40, workers=8, rpm_limit=600, response_delay=0.2, rate_limit_rate=0.05, retry_after=0.5):
+    with fake_openai_server.FakeOpenAIServer(response_delay=response_delay, rate_limit_rate=rate_limit_rate,
+                                             rpm_limit=rpm_limit, retry_after=retry_after,
+                                             seed=1) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "test")
+        import batch_generate
+        import generate_rhino_script
+        generate_rhino_script.API_KEY = generate_rhino_script.API_KEY or "test"
+
+        modes = [
+            ("1 worker", 1, rpm_limit),
+            ("{} workers, no limiter".format(workers), workers, 0),
+            # A little under the server's limit, as one would configure it
+            ("{} workers, {} rpm limiter".format(workers, int(rpm_limit * 0.9)), workers, int(rpm_limit * 0.9)),
+        ]
+        print("{} prompts, {:.0f} ms per request, {:.0%} random 429s, server limit {} rpm".format(
+            count, response_delay * 1000, rate_limit_rate, rpm_limit))
+        print("{:<30} {:>8} {:>10} {:>9} {:>6} {:>7}".format(
+            "mode", "seconds", "per min", "requests", "429s", "failed"))
+        sessions_dir = tempfile.mkdtemp()
+        try:
+            store = session_store.SessionStore(sessions_dir)
+            for name, mode_workers, rpm in modes:
+                runner = batch_generate.BatchRunner(mode_workers, rpm=rpm, tpm=0, rng=random.Random(0))
+                stats = runner.run(PROMPTS[:count], store.create_session()).stats()
+                print("{:<30} {:>8.2f} {:>10.1f} {:>9} {:>6} {:>7}".format(
+                    name, stats["seconds"], stats["per_minute"], stats["requests"],
+                    stats["rate_limited"], stats["failed"]))
+        finally:
+            shutil.rmtree(sessions_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 40,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 8,
+        int(sys.argv[3]) if len(sys.argv) > 3 else 600)
@@ -0,0 +1,94 @@
+"""
+Measures wall-clock time until a script that passes validation is available.
+
+fake_openai_server.py answers with a working script with probability
+`success_rate` and with a broken one (syntax error, missing import or a
+runtime error) otherwise. The single-candidate loop asks again after every
+failed script, like a user who runs it and reports the error; the candidate
+modes ask for K scripts per round, with "n" or with parallel requests.
+
+    python benchmark_candidates.py [success_rate] [candidates]
+"""
+import os
+import random
+import sys
+import time
+
+import fake_openai_server
+import script_validation
+
+# time.perf_counter is not available on IronPython 2.7
+_clock = getattr(time, "perf_counter", time.time)
+
+GOOD_REPLY = fake_openai_server.DEFAULT_REPLY
+BAD_REPLIES = [
+    "import rhinoscriptsyntax as rs\nrs.AddSphere([0, 0, 0], 10\n",
+    "rs.AddSphere([0, 0, 0], 10)\n",
+    "import rhinoscriptsyntax as rs\npts = rs.GetPoints('Pick points')\nrs.AddPolyline(pts[5])\n",
+]
+MESSAGES = [{"role": "user", "content": "make a sphere"}]
+MAX_ROUNDS = 10
+
+
+def make_reply(success_rate, seed):
+    rng = random.Random(seed)
+
+    def reply(request):
+        if rng.random() < success_rate:
+            return GOOD_REPLY
+        return rng.choice(BAD_REPLIES)
+
+    return reply
+
+
+def single_candidate(generate_rhino_script):
+    for attempt in range(1, MAX_ROUNDS + 1):
+        code = generate_rhino_script.extract_code(generate_rhino_script.generate_script_content(MESSAGES))
+        if script_validation.validate_script(code).ok:
+            return attempt
+    return None
+
+
+def multi_candidate(generate_rhino_script, count, parallel):
+    for attempt in range(1, MAX_ROUNDS + 1):
+        code, result = generate_rhino_script.generate_validated_script(MESSAGES, count, parallel)
+        if result is not None and result.ok:
+            return attempt
+    return None
+
+
+def measure(server, success_rate, trials, attempt):
+    times = []
+    rounds = 0
+    for trial in range(trials):
+        server.reply = make_reply(success_rate, trial)
+        start = _clock()
+        rounds += attempt() or MAX_ROUNDS
+        times.append(_clock() - start)
+    times.sort()
+    return sum(times) / len(times), times[len(times) // 2], float(rounds) / trials
+
+
+def run(success_rate=0.4, count=3, trials=20, response_delay=0.3):
+    with fake_openai_server.FakeOpenAIServer(response_delay=response_delay) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "test")
+        import generate_rhino_script
+        generate_rhino_script.API_KEY = generate_rhino_script.API_KEY or "test"
+
+        modes = [
+            ("1 candidate, retry", lambda: single_candidate(generate_rhino_script)),
+            ("{} candidates, n".format(count), lambda: multi_candidate(generate_rhino_script, count, False)),
+            ("{} candidates, parallel".format(count), lambda: multi_candidate(generate_rhino_script, count, True)),
+        ]
+        print("success rate {:.0%}, {:.0f} ms per request, {} trials".format(
+            success_rate, response_delay * 1000, trials))
+        print("{:<26} {:>10} {:>10} {:>8}".format("mode", "mean ms", "median ms", "rounds"))
+        for name, attempt in modes:
+            mean, median, rounds = measure(server, success_rate, trials, attempt)
+            print("{:<26} {:>10.0f} {:>10.0f} {:>8.2f}".format(name, mean * 1000, median * 1000, rounds))
+
+
+if __name__ == "__main__":
+    run(float(sys.argv[1]) if len(sys.argv) > 1 else 0.4,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 3)
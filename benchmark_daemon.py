@@ -0,0 +1,123 @@
+"""
+Measures how long generate_rhino_script.py takes from launch to its first
+script, in-process and through generation_daemon.py.
+
+Each run is a fresh Python process, like a press of the Rhino toolbar
+button: it imports the command, opens the latest session (which already
+holds `turns` turns) and generates one script from fake_openai_server.py,
+which sleeps connect_delay for every new connection to stand in for the TCP
+and TLS handshake. The daemon is started once and warmed up by one command
+before the timed runs. The response cache is off in both modes and the
+session lives in a temporary folder.
+
+    python benchmark_daemon.py [runs] [turns]
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import fake_openai_server
+import session_store
+
+# time.perf_counter is not available on IronPython 2.7
+_clock = getattr(time, "perf_counter", time.time)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Run in the child: prints seconds to import, to open the session and to the first script
+COMMAND = """
+import json, sys, time
+clock = getattr(time, "perf_counter", time.time)
+start = clock()
+import generate_rhino_script, generation_daemon
+imported = clock()
+generator = None
+if sys.argv[1] == "daemon":
+    generator = generation_daemon.connect()
+    if generator is None:
+        sys.exit("no daemon")
+else:
+    import session_store
+    generator = generate_rhino_script.LocalGenerator(session_store.SessionStore(sys.argv[2]))
+generator.open()
+opened = clock()
+generator.generate(sys.argv[3])
+done = clock()
+print(json.dumps([imported - start, opened - start, done - start]))
+"""
+
+
+def _fill_session(sessions_dir, turns):
+    session = session_store.SessionStore(sessions_dir).create_session()
+    for i in range(turns):
+        index = session.allocate_index()
+        session.add_turn(index, "make a sphere of radius {}".format(i),
+                         "import rhinoscriptsyntax as rs\nrs.AddSphere((0, 0, 0), {})\n".format(i))
+
+
+def _run_command(mode, sessions_dir, prompt, env):
+    start = _clock()
+    output = subprocess.check_output([sys.executable, "-c", COMMAND, mode, sessions_dir, prompt],
+                                     cwd=SCRIPT_DIR, env=env)
+    total = _clock() - start
+    imported, opened, done = json.loads(output.decode("utf-8").strip().splitlines()[-1])
+    return total, imported, opened, done
+
+
+def _wait_for(path, timeout=30.0):
+    deadline = _clock() + timeout
+    while not os.path.exists(path):
+        if _clock() > deadline:
+            raise RuntimeError("the daemon did not start")
+        time.sleep(0.05)
+
+
+def run(runs=5, turns=200, connect_delay=0.1):
+    tmp = tempfile.mkdtemp()
+    daemon = None
+    try:
+        sessions_dir = os.path.join(tmp, "sessions")
+        _fill_session(sessions_dir, turns)
+        with fake_openai_server.FakeOpenAIServer(connect_delay=connect_delay) as server:
+            env = dict(os.environ)
+            env.update({
+                "OPENAI_BASE_URL": server.base_url,
+                "OPENAI_API_KEY": env.get("OPENAI_API_KEY") or "test",
+                "RHINO_AI_NO_CACHE": "1",
+                "RHINO_AI_DAEMON_FILE": os.path.join(tmp, "daemon.json"),
+            })
+            daemon = subprocess.Popen([sys.executable, "generation_daemon.py", "serve",
+                                       "--sessions", sessions_dir],
+                                      cwd=SCRIPT_DIR, env=env, stdout=subprocess.PIPE)
+            _wait_for(env["RHINO_AI_DAEMON_FILE"])
+            _run_command("daemon", sessions_dir, "warm up", env)
+
+            print("{} runs, session of {} turns, {:.0f} ms connection set-up".format(
+                runs, turns, connect_delay * 1000))
+            print("{:<12} {:>10} {:>10} {:>10} {:>14}".format(
+                "mode", "import ms", "open ms", "script ms", "process ms"))
+            for mode in ("in-process", "daemon"):
+                rows = [_run_command(mode, sessions_dir, "{} prompt {}".format(mode, i), env)
+                        for i in range(runs)]
+                total, imported, opened, done = [sum(column) / len(rows) for column in zip(*rows)]
+                print("{:<12} {:>10.1f} {:>10.1f} {:>10.1f} {:>14.1f}".format(
+                    mode, imported * 1000, opened * 1000, done * 1000, total * 1000))
+
+            subprocess.check_call([sys.executable, "generation_daemon.py", "stop"],
+                                  cwd=SCRIPT_DIR, env=env, stdout=subprocess.PIPE)
+            daemon.wait()
+            daemon = None
+    finally:
+        if daemon is not None:
+            daemon.kill()
+            daemon.wait()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 5,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 200)
@@ -0,0 +1,98 @@
+"""
+Times the geodesic mesh kernel against frequency.
+
+Runs under plain CPython (no Rhino needed):
+    python benchmark_geodesic.py [max_frequency]
+
+The "legacy" column is a Rhino-free port of the old per-point algorithm
+(one vector call per operation, dedup on rounded coordinates) for comparison.
+"""
+import math
+import sys
+import time
+
+import geodesic_mesh
+
+
+def _unitize(v):
+    length = math.sqrt(v[0] * v[0] + v[1] * v[1] + v[2] * v[2])
+    return [v[0] / length, v[1] / length, v[2] / length]
+
+
+def _scale(v, s):
+    return [v[0] * s, v[1] * s, v[2] * s]
+
+
+def _sub(a, b):
+    return [a[0] - b[0], a[1] - b[1], a[2] - b[2]]
+
+
+def _add(a, b):
+    return [a[0] + b[0], a[1] + b[1], a[2] + b[2]]
+
+
+def legacy_geodesic_sphere(radius, frequency):
+    base_verts, faces = geodesic_mesh.icosahedron()
+    mesh_vertices = []
+    mesh_face_indices = []
+    vert_map = {}
+
+    def get_vert_index(v):
+        v_scaled = _scale(_unitize(v), radius)
+        key = (round(v_scaled[0], 4), round(v_scaled[1], 4), round(v_scaled[2], 4))
+        if key in vert_map:
+            return vert_map[key]
+        idx = len(mesh_vertices)
+        mesh_vertices.append(v_scaled)
+        vert_map[key] = idx
+        return idx
+
+    for face in faces:
+        v1, v2, v3 = base_verts[face[0]], base_verts[face[1]], base_verts[face[2]]
+        grid_indices = {}
+        for row in range(frequency + 1):
+            for col in range(frequency - row + 1):
+                vec_col = _scale(_sub(v2, v1), float(col) / frequency)
+                vec_row = _scale(_sub(v3, v1), float(row) / frequency)
+                grid_indices[(row, col)] = get_vert_index(_add(v1, _add(vec_col, vec_row)))
+        for row in range(frequency):
+            for col in range(frequency - row):
+                mesh_face_indices.append([grid_indices[(row, col)], grid_indices[(row, col + 1)], grid_indices[(row + 1, col)]])
+                if col < frequency - row - 1:
+                    mesh_face_indices.append([grid_indices[(row, col + 1)], grid_indices[(row + 1, col + 1)], grid_indices[(row + 1, col)]])
+    return mesh_vertices, mesh_face_indices
+
+
+# time.perf_counter is not available on IronPython 2.7
+_clock = getattr(time, "perf_counter", time.time)
+
+
+def time_call(func, *args):
+    start = _clock()
+    func(*args)
+    return _clock() - start
+
+
+def run(max_frequency=128, radius=10.0):
+    frequencies = []
+    f = 1
+    while f <= max_frequency:
+        frequencies.append(f)
+        f *= 2
+
+    print("{:>6} {:>9} {:>9} {:>12} {:>12} {:>12}".format(
+        "freq", "verts", "faces", "legacy (s)", "python (s)", "numpy (s)"))
+    for f in frequencies:
+        legacy = time_call(legacy_geodesic_sphere, radius, f)
+        python = time_call(geodesic_mesh.geodesic_sphere, radius, f, False)
+        if geodesic_mesh.np is not None:
+            numpy_time = "{:12.4f}".format(time_call(geodesic_mesh.geodesic_sphere, radius, f, True))
+        else:
+            numpy_time = "{:>12}".format("n/a")
+        print("{:6d} {:9d} {:9d} {:12.4f} {:12.4f} {}".format(
+            f, 10 * f * f + 2, 20 * f * f, legacy, python, numpy_time))
+
+
+if __name__ == "__main__":
+    max_f = int(sys.argv[1]) if len(sys.argv) > 1 else 128
+    run(max_f)
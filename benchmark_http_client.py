@@ -0,0 +1,54 @@
+"""
+Measures the latency saved by reusing connections in openai_client.
+
+Runs the same sequence of requests against fake_openai_server.py once with a
+new connection per request (the old behaviour) and once with the pooled
+client. connect_delay stands in for the TCP+TLS handshake of the real API.
+
+    python benchmark_http_client.py [requests] [connect_delay_seconds]
+"""
+import sys
+import time
+
+import fake_openai_server
+import openai_client
+
+# time.perf_counter is not available on IronPython 2.7
+_clock = getattr(time, "perf_counter", time.time)
+
+REQUEST = {
+    "model": "gpt-4o",
+    "messages": [{"role": "user", "content": "make a sphere"}],
+    "temperature": 0.7,
+    "max_tokens": 1000,
+}
+
+
+def time_requests(client, count):
+    start = _clock()
+    for _ in range(count):
+        client.chat_completion(REQUEST)
+    return (_clock() - start) / count
+
+
+def run(count=50, connect_delay=0.05):
+    with fake_openai_server.FakeOpenAIServer(connect_delay=connect_delay) as server:
+        fresh = openai_client.OpenAIClient("test", base_url=server.base_url, keep_alive=False)
+        pooled = openai_client.OpenAIClient("test", base_url=server.base_url)
+        fresh_latency = time_requests(fresh, count)
+        pooled_latency = time_requests(pooled, count)
+        pooled.close()
+
+    print("requests per client:     {}".format(count))
+    print("simulated handshake:     {:.1f} ms".format(connect_delay * 1000))
+    print("new connection each:     {:.2f} ms/request ({} connections)".format(
+        fresh_latency * 1000, fresh.connections_opened))
+    print("pooled keep-alive:       {:.2f} ms/request ({} connections)".format(
+        pooled_latency * 1000, pooled.connections_opened))
+    print("saved per request:       {:.2f} ms".format((fresh_latency - pooled_latency) * 1000))
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    run(n, delay)
@@ -0,0 +1,53 @@
+"""
+Compares time to first visible output with and without streaming.
+
+Runs generate_script_content against fake_openai_server.py, which emits one
+token every token_delay seconds, and reports when the first character of
+script text (fences stripped) would reach the console.
+
+    python benchmark_streaming.py [token_delay_seconds]
+"""
+import os
+import sys
+import time
+
+import fake_openai_server
+
+# time.perf_counter is not available on IronPython 2.7
+_clock = getattr(time, "perf_counter", time.time)
+
+REPLY = "```python\n" + fake_openai_server.DEFAULT_REPLY * 20 + "```\n"
+
+
+def measure(generate, stream):
+    first = []
+    start = _clock()
+
+    def on_token(text):
+        if not first:
+            first.append(_clock() - start)
+
+    text = generate([{"role": "user", "content": "make spheres"}], stream=stream, on_token=on_token)
+    total = _clock() - start
+    return (first[0] if first else total), total, text
+
+
+def run(token_delay=0.01):
+    with fake_openai_server.FakeOpenAIServer(reply=REPLY, token_delay=token_delay) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "test")
+        import generate_rhino_script
+        generate_rhino_script.API_KEY = generate_rhino_script.API_KEY or "test"
+
+        tokens = len(fake_openai_server.split_tokens(REPLY))
+        blocking_first, blocking_total, blocking_text = measure(generate_rhino_script.generate_script_content, False)
+        stream_first, stream_total, stream_text = measure(generate_rhino_script.generate_script_content, True)
+
+    print("reply tokens:            {} ({:.0f} ms apart)".format(tokens, token_delay * 1000))
+    print("blocking first output:   {:.0f} ms (total {:.0f} ms)".format(blocking_first * 1000, blocking_total * 1000))
+    print("streaming first output:  {:.0f} ms (total {:.0f} ms)".format(stream_first * 1000, stream_total * 1000))
+    print("same text returned:      {}".format(blocking_text == stream_text))
+
+
+if __name__ == "__main__":
+    run(float(sys.argv[1]) if len(sys.argv) > 1 else 0.01)
@@ -0,0 +1,251 @@
+"""
+Headless benchmark suite for the Rhino generators.
+
+Imports geodesic_dome.py, doric_column.py and rhino_script_test.py with
+rhino_stub in place of rhinoscriptsyntax, so they run under plain CPython.
+Rhino itself does no work here (booleans, pipes and meshes are no-ops), so
+each case reports the Python-side time plus the rs calls it made and their
+recorded cost units (mesh vertices, boolean inputs, ...), which is what
+Rhino would have to process.
+
+    python benchmark_suite.py [--quick] [--output results.json] [--compare previous.json]
+
+Results are written as JSON. With --compare, cases that got slower than
+the threshold or make more rs calls or units than before are listed, and the
+exit status is 1.
+"""
+import json
+import os
+import platform
+import sys
+import time
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import rhino_stub
+
+# time.perf_counter is not available on IronPython 2.7
+_clock = getattr(time, "perf_counter", time.time)
+
+FREQUENCIES = [1, 2, 4, 8, 16, 32, 64, 100, 150, 200]
+FLUTE_COUNTS = [8, 12, 16, 20, 24, 32, 48, 64]
+QUICK_FREQUENCIES = [1, 2, 4, 8, 16, 32]
+QUICK_FLUTE_COUNTS = [8, 16, 32, 64]
+
+DOME_ENGINES = ("single", "chunked", "hemisphere")
+
+# Engines that build in RhinoCommon, which the stub sees as one opaque call,
+# so their rs calls and units are not comparable with the other engines
+OPAQUE_ENGINES = ("rhinocommon",)
+
+# Slowdown (fraction) and absolute minimum (seconds) counted as a regression
+THRESHOLD = 0.25
+MIN_DELTA = 0.002
+
+
+class Suite(object):
+    """
+    Runs cases against one stub document and collects result dicts.
+    """
+
+    def __init__(self, repeat=3):
+        self.repeat = repeat
+        self.results = []
+        self._stubs = rhino_stub.installed()
+        self.doc = self._stubs.__enter__()
+        # The generators bind the stub modules at import time
+        import doric_column
+        import geodesic_dome
+        import geodesic_mesh
+        self.doric_column = doric_column
+        self.geodesic_dome = geodesic_dome
+        self.geodesic_mesh = geodesic_mesh
+
+    def close(self):
+        self._stubs.__exit__(None, None, None)
+
+    def run_case(self, suite, engine, param, func, repeat=None, **extra):
+        """
+        Times func() (best of `repeat` runs) and records the rs calls of the last run.
+        """
+        best = None
+        error = None
+        for _ in range(repeat or self.repeat):
+            self.doc.reset()
+            start = _clock()
+            try:
+                func()
+            except Exception as e:
+                error = "{}: {}".format(type(e).__name__, e)
+                break
+            elapsed = _clock() - start
+            best = elapsed if best is None else min(best, elapsed)
+        costs = dict((name, {"calls": c[0], "units": c[1]}) for name, c in self.doc.costs.items())
+        result = {
+            "suite": suite,
+            "engine": engine,
+            "param": param,
+            "seconds": best,
+            "rs_calls": sum(c["calls"] for c in costs.values()),
+            "rs_units": sum(c["units"] for c in costs.values()),
+            "costs": costs,
+            "error": error,
+        }
+        result.update(extra)
+        self.results.append(result)
+        return result
+
+    def mesh_counts(self):
+        """
+        (vertices, faces) of the meshes the last run added, or None.
+        """
+        meshes = [data for kind, data in self.doc.objects.values() if kind == "AddMesh" and data]
+        if not meshes:
+            return None
+        return sum(m[0] for m in meshes), sum(m[1] for m in meshes)
+
+    def geodesic(self, frequencies):
+        for frequency in frequencies:
+            for engine in DOME_ENGINES:
+                chunked = engine == "chunked"
+                fraction = 0.5 if engine == "hemisphere" else None
+                result = self.run_case("geodesic_dome", engine, frequency,
+                                       lambda: self.geodesic_dome.create_geodesic_dome(
+                                           10.0, frequency, chunked=chunked, fraction=fraction),
+                                       repeat=1 if frequency >= 64 else None)
+                counts = None if chunked else self.mesh_counts()
+                if counts is None:
+                    # Chunked patches repeat their border vertices until joined
+                    counts = self.geodesic_mesh.vertex_count(frequency), 20 * frequency * frequency
+                result["vertices"], result["faces"] = counts
+
+    def doric(self, flute_counts):
+        params = self.doric_column.DEFAULT_COLUMN_PARAMS
+        for flute_count in flute_counts:
+            for engine in self.doric_column.ENGINES:
+                result = self.run_case("doric_column", engine, flute_count,
+                                       lambda: self.doric_column.build_doric_column(
+                                           params["height"], params["base_radius"],
+                                           params["top_radius"], flute_count, engine=engine))
+                if engine in OPAQUE_ENGINES:
+                    result["rs_calls"] = result["rs_units"] = None
+
+    def spheres(self):
+        with open(_script_path("rhino_script_test.py")) as f:
+            code = compile(f.read(), "rhino_script_test.py", "exec")
+
+        def run():
+            # Keep the script's own messages out of the table
+            stdout = sys.stdout
+            sys.stdout = StringIO()
+            try:
+                exec(code, {"__name__": "__main__"})
+            finally:
+                sys.stdout = stdout
+
+        self.run_case("rhino_script_test", "rs", 1, run)
+
+
+def _script_path(name):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+
+
+def _case_key(result):
+    return (result["suite"], result["engine"], result["param"])
+
+
+def run(quick=False, repeat=3):
+    """
+    Runs the whole sweep and returns the results document.
+    """
+    suite = Suite(repeat)
+    try:
+        suite.geodesic(QUICK_FREQUENCIES if quick else FREQUENCIES)
+        suite.doric(QUICK_FLUTE_COUNTS if quick else FLUTE_COUNTS)
+        suite.spheres()
+    finally:
+        suite.close()
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    return {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "numpy": numpy_version,
+            "quick": quick,
+        },
+        "results": suite.results,
+    }
+
+
+def compare(previous, current, threshold=THRESHOLD, min_delta=MIN_DELTA):
+    """
+    Regressions of `current` against `previous` (both results documents) as
+    a list of messages.
+    """
+    before = dict((_case_key(r), r) for r in previous["results"])
+    messages = []
+    for result in current["results"]:
+        old = before.get(_case_key(result))
+        if old is None:
+            continue
+        name = "{} {} {}".format(*_case_key(result))
+        if result["error"] and not old["error"]:
+            messages.append("{}: now fails ({})".format(name, result["error"]))
+            continue
+        if old["seconds"] and result["seconds"]:
+            delta = result["seconds"] - old["seconds"]
+            if delta > min_delta and delta > threshold * old["seconds"]:
+                messages.append("{}: {:.1f} ms -> {:.1f} ms".format(
+                    name, old["seconds"] * 1000, result["seconds"] * 1000))
+        for field in ("rs_calls", "rs_units"):
+            if result[field] is not None and old[field] is not None and result[field] > old[field]:
+                messages.append("{}: {} {} -> {}".format(name, field, old[field], result[field]))
+    return messages
+
+
+def format_results(document):
+    lines = ["{:<18} {:<11} {:>6} {:>11} {:>9} {:>10}".format(
+        "suite", "engine", "param", "ms", "rs calls", "rs units")]
+    for r in document["results"]:
+        ms = "error" if r["error"] else "{:.2f}".format(r["seconds"] * 1000)
+        calls, units = [("n/a" if r[f] is None else r[f]) for f in ("rs_calls", "rs_units")]
+        lines.append("{:<18} {:<11} {:>6} {:>11} {:>9} {:>10}".format(
+            r["suite"], r["engine"], r["param"], ms, calls, units))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+
+    def option(name, default=None):
+        if name in args:
+            i = args.index(name)
+            return args[i + 1]
+        return default
+
+    document = run(quick="--quick" in args)
+    print(format_results(document))
+    output = option("--output", "benchmark_results.json")
+    with open(output, "w") as f:
+        json.dump(document, f, indent=1, sort_keys=True)
+    print("Results written to " + output)
+
+    previous_path = option("--compare")
+    if previous_path:
+        with open(previous_path) as f:
+            regressions = compare(json.load(f), document)
+        if regressions:
+            print("Regressions against " + previous_path + ":")
+            for message in regressions:
+                print("  " + message)
+            sys.exit(1)
+        print("No regressions against " + previous_path)
@@ -0,0 +1,373 @@
+"""
+Content-addressed blob store for session scripts and .ghx archives.
+
+Blobs are addressed by the SHA-1 of their content, so a file that is saved
+twice (a retried script, a copied archive) is stored once. Two ways to keep
+a file in the store:
+
+  link_file / write_file    the file stays where it is but becomes a hardlink
+                            to the store's single copy under files/ (files
+                            must not be edited in place afterwards; write_file
+                            replaces the link rather than writing through
+                            it, and verify lists copies that were); where
+                            hardlinks are unavailable the content is put()
+                            instead, so the digest always resolves
+  to_pointer / from_pointer the file is replaced by a small <name>.blob
+                            pointer and its content is kept zlib-compressed
+                            under objects/
+
+With chunked=True (the default for .ghx and .xml files) the compressed
+content is split into line-aligned, content-defined chunks that are stored
+separately, so archives that differ in a few slider values share all their
+other chunks.
+
+    store = blob_store.BlobStore()
+    store.link_file("Tangent circles2.ghx")
+    pointer = store.to_pointer("big.ghx")
+    data = store.read_file(pointer)
+
+    python blob_store.py link|pack|unpack FILE... ; python blob_store.py stats|prune|verify
+"""
+import hashlib
+import json
+import os
+import sys
+import zlib
+
+POINTER_SUFFIX = ".blob"
+
+# Object kinds: the first byte of a stored object
+BLOB = b"B"
+MANIFEST = b"M"
+
+# Chunks end after a line whose CRC has these bits clear (~64 lines per
+# chunk), within the size bounds below
+CHUNK_MASK = 0x3F
+MIN_CHUNK = 1024
+MAX_CHUNK = 64 * 1024
+
+CHUNKED_EXTENSIONS = (".ghx", ".xml")
+
+
+def get_blobs_dir():
+    try:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+    except:
+        script_dir = os.getcwd()
+    return os.path.join(script_dir, "blobs")
+
+
+def _bytes(data):
+    if not isinstance(data, bytes):
+        data = data.encode("utf-8")
+    return data
+
+
+def digest_of(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def file_digest(path, block_size=1024 * 1024):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def split_chunks(data, mask=CHUNK_MASK, min_size=MIN_CHUNK, max_size=MAX_CHUNK):
+    """
+    Splits `data` after lines picked by their CRC, so an edit only changes
+    the chunk it falls in and chunk boundaries elsewhere stay put.
+    """
+    chunks = []
+    current = []
+    size = 0
+    for line in data.splitlines(True):
+        current.append(line)
+        size += len(line)
+        if size >= max_size or (size >= min_size and zlib.crc32(line) & mask == 0):
+            chunks.append(b"".join(current))
+            current = []
+            size = 0
+    if current:
+        chunks.append(b"".join(current))
+    return chunks
+
+
+def _replace(tmp_path, path):
+    # os.rename does not overwrite on Windows and os.replace is missing on IronPython 2.7
+    if hasattr(os, "replace"):
+        os.replace(tmp_path, path)
+        return
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp_path, path)
+
+
+class BlobStore(object):
+    """
+    objects/xx/<sha1>: compressed blobs and chunk manifests.
+    files/xx/<sha1>:   raw copies that session and archive files hardlink to.
+    """
+
+    def __init__(self, directory=None, level=6):
+        self.directory = directory or get_blobs_dir()
+        self.level = level
+        self.objects_dir = os.path.join(self.directory, "objects")
+        self.files_dir = os.path.join(self.directory, "files")
+
+    @staticmethod
+    def _path(base, digest):
+        return os.path.join(base, digest[:2], digest[2:])
+
+    @staticmethod
+    def _write_new(path, data):
+        # Content-addressed: an existing file already holds these bytes
+        if os.path.exists(path):
+            return False
+        folder = os.path.dirname(path)
+        if not os.path.exists(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                pass
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        _replace(tmp_path, path)
+        return True
+
+    def _put_object(self, digest, kind, payload):
+        path = self._path(self.objects_dir, digest)
+        if not os.path.exists(path):
+            self._write_new(path, kind + zlib.compress(payload, self.level))
+
+    def has(self, digest):
+        return (os.path.exists(self._path(self.objects_dir, digest)) or
+                os.path.exists(self._path(self.files_dir, digest)))
+
+    def put(self, data, chunked=False):
+        """
+        Stores `data` compressed and returns its digest. Chunked blobs are
+        stored as a manifest of chunk digests.
+        """
+        data = _bytes(data)
+        digest = digest_of(data)
+        if os.path.exists(self._path(self.objects_dir, digest)):
+            return digest
+        if chunked:
+            chunk_digests = []
+            for chunk in split_chunks(data):
+                chunk_digest = digest_of(chunk)
+                self._put_object(chunk_digest, BLOB, chunk)
+                chunk_digests.append(chunk_digest)
+            manifest = json.dumps({"size": len(data), "chunks": chunk_digests})
+            self._put_object(digest, MANIFEST, manifest.encode("utf-8"))
+        else:
+            self._put_object(digest, BLOB, data)
+        return digest
+
+    def get(self, digest):
+        """
+        Content of a blob; KeyError if it is not in the store.
+        """
+        path = self._path(self.objects_dir, digest)
+        if not os.path.exists(path):
+            raw_path = self._path(self.files_dir, digest)
+            if os.path.exists(raw_path):
+                with open(raw_path, "rb") as f:
+                    data = f.read()
+                # A linked file edited in place changes this copy too
+                if digest_of(data) != digest:
+                    raise ValueError("Blob {} is corrupt".format(digest))
+                return data
+            raise KeyError("No blob " + digest)
+        with open(path, "rb") as f:
+            stored = f.read()
+        payload = zlib.decompress(stored[1:])
+        if stored[:1] == MANIFEST:
+            manifest = json.loads(payload.decode("utf-8"))
+            payload = b"".join(self.get(d) for d in manifest["chunks"])
+        if digest_of(payload) != digest:
+            raise ValueError("Blob {} is corrupt".format(digest))
+        return payload
+
+    def put_file(self, path, chunked=None):
+        if chunked is None:
+            chunked = path.lower().endswith(CHUNKED_EXTENSIONS)
+        with open(path, "rb") as f:
+            return self.put(f.read(), chunked)
+
+    def link_file(self, path):
+        """
+        Makes `path` a hardlink to the store's copy of its content (the file
+        itself becomes that copy if the content is new). Returns the digest.
+        Where hardlinks are not supported the file is left alone and its
+        content is stored compressed (see put) instead.
+        """
+        digest = file_digest(path)
+        target = self._path(self.files_dir, digest)
+        link = getattr(os, "link", None)
+        if link is None:
+            return self.put_file(path)
+        try:
+            if not os.path.exists(target):
+                folder = os.path.dirname(target)
+                if not os.path.exists(folder):
+                    os.makedirs(folder)
+                link(path, target)
+            elif not os.path.samefile(path, target):
+                tmp_path = path + ".tmp"
+                link(target, tmp_path)
+                _replace(tmp_path, path)
+        except OSError:
+            # Different volume or a filesystem without hardlinks: keep the copy
+            return self.put_file(path)
+        return digest
+
+    def write_file(self, path, data):
+        """
+        Writes `data` to `path` as a hardlink to the stored copy. Returns the digest.
+        """
+        data = _bytes(data)
+        digest = digest_of(data)
+        target = self._path(self.files_dir, digest)
+        if os.path.exists(target) and hasattr(os, "link"):
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+                os.link(target, path)
+                return digest
+            except OSError:
+                pass
+        # `path` may be a link to another stored copy: never write it in place
+        tmp_path = path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        _replace(tmp_path, path)
+        return self.link_file(path)
+
+    def to_pointer(self, path, chunked=None):
+        """
+        Stores the file compressed and replaces it with a pointer file.
+        Returns the pointer's path.
+        """
+        digest = self.put_file(path, chunked)
+        pointer_path = path + POINTER_SUFFIX
+        with open(pointer_path + ".tmp", "w") as f:
+            json.dump({"blob": digest, "size": os.path.getsize(path), "name": os.path.basename(path)}, f)
+        _replace(pointer_path + ".tmp", pointer_path)
+        os.remove(path)
+        return pointer_path
+
+    @staticmethod
+    def read_pointer(pointer_path):
+        with open(pointer_path, "r") as f:
+            return json.load(f)
+
+    def from_pointer(self, pointer_path):
+        """
+        Writes the file a pointer stands for back in its place and removes the pointer.
+        """
+        pointer = self.read_pointer(pointer_path)
+        path = pointer_path[:-len(POINTER_SUFFIX)]
+        with open(path + ".tmp", "wb") as f:
+            f.write(self.get(pointer["blob"]))
+        _replace(path + ".tmp", path)
+        os.remove(pointer_path)
+        return path
+
+    def read_file(self, path):
+        """
+        Content of `path`, following a pointer file when the file itself is
+        not there.
+        """
+        if path.endswith(POINTER_SUFFIX):
+            return self.get(self.read_pointer(path)["blob"])
+        if not os.path.exists(path) and os.path.exists(path + POINTER_SUFFIX):
+            return self.get(self.read_pointer(path + POINTER_SUFFIX)["blob"])
+        with open(path, "rb") as f:
+            return f.read()
+
+    def _walk(self, base):
+        if not os.path.isdir(base):
+            return
+        for prefix in os.listdir(base):
+            folder = os.path.join(base, prefix)
+            if os.path.isdir(folder):
+                for name in os.listdir(folder):
+                    if not name.endswith(".tmp"):
+                        yield prefix + name, os.path.join(folder, name)
+
+    def verify(self):
+        """
+        Digests of stored copies whose content no longer matches (a linked
+        file was written in place).
+        """
+        corrupt = []
+        for digest, path in self._walk(self.files_dir):
+            if file_digest(path) != digest:
+                corrupt.append(digest)
+        return corrupt
+
+    def prune(self):
+        """
+        Removes stored copies no file links to any more. Returns the bytes freed.
+        """
+        freed = 0
+        for digest, path in self._walk(self.files_dir):
+            stat = os.stat(path)
+            if stat.st_nlink <= 1:
+                os.remove(path)
+                freed += stat.st_size
+        return freed
+
+    def stats(self):
+        objects = [os.path.getsize(path) for _, path in self._walk(self.objects_dir)]
+        files = [os.stat(path) for _, path in self._walk(self.files_dir)]
+        return {
+            "objects": len(objects),
+            "object_bytes": sum(objects),
+            "files": len(files),
+            "file_bytes": sum(s.st_size for s in files),
+            "links": sum(max(s.st_nlink - 1, 0) for s in files),
+            # Bytes the extra links would take as separate copies
+            "saved_bytes": sum(max(s.st_nlink - 2, 0) * s.st_size for s in files),
+        }
+
+    def format_stats(self):
+        s = self.stats()
+        return ("{} compressed objects ({:.1f} KB), {} linked files ({:.1f} KB) with {} links, "
+                "{:.1f} KB saved by links").format(
+            s["objects"], s["object_bytes"] / 1024.0, s["files"], s["file_bytes"] / 1024.0,
+            s["links"], s["saved_bytes"] / 1024.0)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python blob_store.py link|pack|unpack FILE... | stats | prune | verify")
+        sys.exit(1)
+    store = BlobStore()
+    command = sys.argv[1]
+    for file_path in sys.argv[2:]:
+        if command == "link":
+            print("{} -> {}".format(file_path, store.link_file(file_path)))
+        elif command == "pack":
+            print("{} -> {}".format(file_path, store.to_pointer(file_path)))
+        elif command == "unpack":
+            print("{} -> {}".format(file_path, store.from_pointer(file_path)))
+    if command == "prune":
+        print("Freed {:.1f} KB".format(store.prune() / 1024.0))
+    elif command == "verify":
+        corrupt = store.verify()
+        for digest in corrupt:
+            print("Corrupt: " + digest)
+        if corrupt:
+            sys.exit(1)
+    print(store.format_stats())
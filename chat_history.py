@@ -0,0 +1,164 @@
+"""
+In-memory chat history for generate_rhino_script.py.
+
+The session log is read once when a session is opened; after that each
+turn is appended in memory. messages() keeps the request within a token
+budget by leaving out the oldest turns (replaced by a one-line summary of
+their prompts), while always sending the latest script and its error.
+"""
+import session_store
+
+# Default context budget in (estimated) tokens for one request
+DEFAULT_CONTEXT_TOKENS = 8000
+
+ERROR_PREFIX = "The previous script caused an error: "
+
+
+def estimate_tokens(text):
+    """
+    Rough token count (about 4 characters per token, plus per-message overhead).
+    """
+    return len(text) // 4 + 4
+
+
+class Turn(object):
+    """
+    One prompt, the script generated for it and the error it caused or other
+    feedback on it, if any.
+    """
+
+    def __init__(self, index, prompt, script=None, error=None, note=None):
+        self.index = index
+        self.prompt = prompt
+        self.script = script
+        self.error = error
+        self.note = note
+        self.tokens = 0
+        self._update_tokens()
+
+    def _update_tokens(self):
+        self.tokens = sum(estimate_tokens(m["content"]) for m in self.messages())
+
+    def messages(self):
+        messages = [{"role": "user", "content": self.prompt}]
+        if self.script is not None:
+            messages.append({"role": "assistant", "content": self.script})
+        if self.error is not None:
+            messages.append({"role": "user", "content": ERROR_PREFIX + self.error})
+        if self.note is not None:
+            messages.append({"role": "user", "content": self.note})
+        return messages
+
+
+class ChatHistory(object):
+    """
+    Turns of one session plus the system prompt. max_tokens=None disables the
+    budget and always sends every turn.
+    """
+
+    def __init__(self, system_prompt, max_tokens=DEFAULT_CONTEXT_TOKENS):
+        self.system_prompt = system_prompt
+        self.max_tokens = max_tokens
+        self.turns = []
+        self._by_index = {}
+
+    @classmethod
+    def from_session(cls, session, system_prompt, max_tokens=DEFAULT_CONTEXT_TOKENS):
+        """
+        Builds the history from the turns of a session_store.Session.
+        """
+        history = cls(system_prompt, max_tokens)
+        for turn in session.turns():
+            history.add_turn(turn["index"], turn["prompt"], turn["script"])
+            if turn["error"] is not None:
+                history.set_error(turn["index"], turn["error"])
+            if turn.get("note") is not None:
+                history.set_note(turn["index"], turn["note"])
+        return history
+
+    @classmethod
+    def load(cls, session_folder, system_prompt, max_tokens=DEFAULT_CONTEXT_TOKENS):
+        """
+        Reads the log of the session in `session_folder` once.
+        """
+        return cls.from_session(session_store.Session(session_folder), system_prompt, max_tokens)
+
+    def add_turn(self, index, prompt, script=None):
+        turn = Turn(index, prompt, script)
+        self.turns.append(turn)
+        self._by_index[index] = turn
+        return turn
+
+    def set_error(self, index, error):
+        turn = self._by_index[index]
+        turn.error = error
+        turn._update_tokens()
+
+    def set_note(self, index, note):
+        """
+        Feedback on a script that ran (e.g. that it was slow), sent as a user message.
+        """
+        turn = self._by_index[index]
+        turn.note = note
+        turn._update_tokens()
+
+    def _summary(self, dropped, budget):
+        """
+        One user message listing the prompts of the omitted turns, newest
+        first, cut to fit the remaining budget.
+        """
+        header = "Earlier in this session (omitted to save context) I asked for: "
+        items = []
+        used = estimate_tokens(header)
+        for turn in reversed(dropped):
+            item = turn.prompt.strip().replace("\n", " ")
+            if len(item) > 80:
+                item = item[:77] + "..."
+            cost = estimate_tokens(item) - 2
+            if used + cost > budget:
+                break
+            items.append(item)
+            used += cost
+        if not items:
+            return None
+        items.reverse()
+        return {"role": "user", "content": header + "; ".join(items)}
+
+    def messages(self, new_request=None):
+        """
+        Messages for the next request: system prompt, as many of the most
+        recent turns as fit the budget, and the new request.
+        """
+        system = {"role": "system", "content": self.system_prompt}
+        tail = []
+        if new_request is not None:
+            tail.append({"role": "user", "content": new_request})
+
+        if self.max_tokens is None:
+            kept = self.turns
+            dropped = []
+        else:
+            budget = self.max_tokens - estimate_tokens(self.system_prompt)
+            budget -= sum(estimate_tokens(m["content"]) for m in tail)
+            # The latest turn (script and error) is always kept
+            kept = self.turns[-1:]
+            budget -= sum(t.tokens for t in kept)
+            start = len(self.turns) - len(kept)
+            while start > 0 and self.turns[start - 1].tokens <= budget:
+                start -= 1
+                budget -= self.turns[start].tokens
+            kept = self.turns[start:]
+            dropped = self.turns[:start]
+
+        messages = [system]
+        if dropped:
+            summary = self._summary(dropped, budget)
+            if summary is not None:
+                messages.append(summary)
+        for turn in kept:
+            messages.extend(turn.messages())
+        messages.extend(tail)
+        return messages
+
+    def token_count(self, new_request=None):
+        return sum(estimate_tokens(m["content"]) for m in self.messages(new_request))
@@ -0,0 +1,142 @@
+"""
+Content-addressed on-disk cache with size-bounded LRU eviction.
+
+Entries are opaque byte strings stored under a hash of the inputs that
+produced them. Used to skip recomputing geometry for parameters that have
+already been generated.
+"""
+import hashlib
+import json
+import os
+
+
+def get_cache_dir(name):
+    try:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+    except:
+        script_dir = os.getcwd()
+    cache_dir = os.path.join(script_dir, "cache", name)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    return cache_dir
+
+
+def cache_key(*parts):
+    """
+    Hash of a tuple of JSON-serializable inputs. Floats and ints that compare
+    equal (10 vs 10.0) give the same key.
+    """
+    normalized = [float(p) if isinstance(p, (int, float)) and not isinstance(p, bool) else p
+                  for p in parts]
+    text = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class DiskCache(object):
+    """
+    Stores byte strings in one file per key. The least recently used entries
+    (by file modification time, refreshed on every hit) are removed once the
+    total size exceeds max_bytes.
+    """
+
+    def __init__(self, name="geometry", max_bytes=256 * 1024 * 1024, directory=None):
+        self.directory = directory or get_cache_dir(name)
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._size = None
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".bin")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        try:
+            # Mark as recently used
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        if self._size is None:
+            self._size = sum(e[1] for e in self._entries())
+        path = self._path(key)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        if os.path.exists(path):
+            self._size -= os.path.getsize(path)
+            os.remove(path)
+        os.rename(tmp_path, path)
+        self.writes += 1
+        self._size += len(data)
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".bin"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache fits max_bytes.
+        """
+        entries = sorted(self._entries())
+        total = sum(e[1] for e in entries)
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+        self._size = total
+
+    def clear(self):
+        for mtime, size, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._size = 0
+
+    def stats(self):
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": float(self.hits) / lookups if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "bytes": sum(e[1] for e in entries),
+        }
+
+    def format_stats(self):
+        s = self.stats()
+        return "Cache: {} hits, {} misses, {} entries ({} bytes)".format(
+            s["hits"], s["misses"], s["entries"], s["bytes"])
@@ -1,31 +1,156 @@
 import rhinoscriptsyntax as rs
+import scriptcontext as sc
 import math
+import numbers
 
-def create_doric_column():
-    # 1. Get User Parameters
-    height = rs.GetReal("Column Height", 10.0)
-    if height is None: return
+import disk_cache
+
+# Bump when the generated geometry changes so stale cache entries are ignored
+COLUMN_VERSION = 1
+
+# Ways of building the column, see build_doric_column
+ENGINES = ("loft", "boolean", "rhinocommon")
+DEFAULT_ENGINE = "loft"
+
+# Parameters accepted by column_from_params / create_colonnade
+DEFAULT_COLUMN_PARAMS = {
+    "height": 10.0,
+    "base_radius": 1.0,
+    "top_radius": 0.8,
+    "flute_count": 20,
+    "engine": DEFAULT_ENGINE,
+}
+
+def _column_to_blob(column_id):
+    # Serialize the solid as an in-memory .3dm file; None if that fails
+    # (e.g. under rhino_stub), so nothing unreadable is cached
+    try:
+        import Rhino
+        brep = rs.coercebrep(column_id)
+        if brep is None:
+            return None
+        model = Rhino.FileIO.File3dm()
+        model.Objects.AddBrep(brep)
+        data = bytes(bytearray(model.ToByteArray()))
+    except Exception:
+        return None
+    return data or None
+
+def _add_column_from_blob(data):
+    # None for an empty or unreadable entry, which the caller rebuilds
+    if not data:
+        return None
+    try:
+        import Rhino
+        import System
+        model = Rhino.FileIO.File3dm.FromByteArray(System.Array[System.Byte](bytearray(data)))
+    except Exception:
+        return None
+    if model is None:
+        return None
+    for obj in model.Objects:
+        column_id = sc.doc.Objects.AddBrep(obj.Geometry)
+        if column_id != System.Guid.Empty:
+            return column_id
+    return None
+
+def fluted_profile_arcs(radius, flute_count, z=0.0):
+    """
+    Computes the fluted cross-section of the shaft at one height analytically.
     
-    base_radius = rs.GetReal("Base Radius", 1.0)
-    if base_radius is None: return
+    Each flute is the arc of a cutter circle of radius radius*sin(pi/n)
+    centred on the shaft circle (the same cutters the boolean engine uses),
+    and each arris is the short arc of the shaft circle left between two
+    neighbouring flutes. Returns the arcs in order around the axis as
+    (start, end, point_on_arc) triples, ready for rs.AddArc3Pt.
+    """
+    step = 2 * math.pi / flute_count
+    flute_radius = radius * math.sin(math.pi / flute_count)
+    # Half the angle a flute spans on the shaft circle (its chord equals flute_radius)
+    half_span = 2 * math.asin(flute_radius / (2 * radius))
     
-    top_radius = rs.GetReal("Top Radius", 0.8)
-    if top_radius is None: return
+    def on_circle(r, angle):
+        return [r * math.cos(angle), r * math.sin(angle), z]
     
-    flute_count = rs.GetInteger("Number of Flutes", 20)
-    if flute_count is None: return
+    arcs = []
+    for i in range(flute_count):
+        angle = step * i
+        # Flute: concave arc, deepest point on the radial line through its centre
+        arcs.append((on_circle(radius, angle - half_span),
+                     on_circle(radius, angle + half_span),
+                     on_circle(radius - flute_radius, angle)))
+        # Arris: the piece of the shaft circle left before the next flute
+        arcs.append((on_circle(radius, angle + half_span),
+                     on_circle(radius, angle + step - half_span),
+                     on_circle(radius, angle + step / 2.0)))
+    return arcs
+
+def _add_fluted_profile(radius, flute_count, z):
+    pieces = [rs.AddArc3Pt(start, end, mid) for start, end, mid in fluted_profile_arcs(radius, flute_count, z)]
+    pieces = [c for c in pieces if c]
+    joined = rs.JoinCurves(pieces, True)
+    if not joined:
+        rs.DeleteObjects(pieces)
+        return None
+    return joined[0]
+
+def _build_shaft_loft(height, base_radius, top_radius, flute_count):
+    # Loft the fluted base section straight up to the fluted top section,
+    # so the shaft is built in one step whatever the flute count.
+    base_curve = _add_fluted_profile(base_radius, flute_count, 0)
+    top_curve = _add_fluted_profile(top_radius, flute_count, height)
+    shaft = None
+    if base_curve and top_curve:
+        # loft_type=2: straight sections
+        loft = rs.AddLoftSrf([base_curve, top_curve], loft_type=2)
+        if loft:
+            if rs.CapPlanarHoles(loft[0]):
+                shaft = loft[0]
+            else:
+                rs.DeleteObjects(loft)
+    rs.DeleteObjects([c for c in (base_curve, top_curve) if c])
+    return shaft
+
+def build_doric_column(height, base_radius, top_radius, flute_count, engine=DEFAULT_ENGINE, cache=None):
+    """
+    Builds a fluted Doric column and returns the ID of the final solid, or
+    None if the boolean operations failed. If a disk_cache.DiskCache is given,
+    a column built before with the same parameters is loaded from it instead.
     
-    # Disable redraw for speed
-    rs.EnableRedraw(False)
+    engine="loft" lofts between analytic fluted sections (see
+    fluted_profile_arcs); engine="boolean" subtracts one pipe per flute from a
+    plain shaft, which is slower and is kept as a fallback. engine="rhinocommon"
+    does the boolean construction on in-memory Rhino.Geometry breps and only
+    adds the finished solid to the document, bypassing the command line, the
+    temporary objects and their undo records.
+    """
+    if engine not in ENGINES:
+        raise ValueError("Unknown column engine: " + str(engine))
+    key = None
+    if cache is not None:
+        key = disk_cache.cache_key("doric_column", COLUMN_VERSION, engine, height, base_radius, top_radius, flute_count)
+        data = cache.get(key)
+        if data is not None:
+            column_id = _add_column_from_blob(data)
+            if column_id:
+                return column_id
+            # Empty or unreadable entry: rebuild below and overwrite it
     
-    # 2. Create the Shaft (Truncated Cone)
-    # Base plane is WorldXY
-    # plane = rs.WorldXYPlane()
-    # AddTruncatedCone(plane, height, radius1, radius2, cap=True)
-    rs.Command("_-TruncatedCone 0,0,0 " + str(base_radius) + " 0,0," + str(height) + " " + str(top_radius))
-    shaft = rs.LastCreatedObjects()[0]
-    
-    # 3. Create Flutes (Boolean Subtraction)
+    if engine == "rhinocommon":
+        column_id = _build_doric_column_rhinocommon(height, base_radius, top_radius, flute_count)
+    else:
+        column_id = _build_doric_column(height, base_radius, top_radius, flute_count, engine)
+    if column_id and cache is not None:
+        data = _column_to_blob(column_id)
+        if data:
+            cache.put(key, data)
+    return column_id
+
+def flute_cutters(height, base_radius, top_radius, flute_count):
+    """
+    Axis and radii of the tapered pipe that cuts each flute, as
+    (start, end, start_radius, end_radius) with points as [x, y, z].
+    """
     cutters = []
     
     # Calculate flute dimensions
@@ -37,56 +162,67 @@ def create_doric_column():
         
         # Calculate start and end points for the flute axis (following the taper)
         # We place the center of the cutter pipe exactly on the surface of the column
-        
-        # Bottom point
-        x1 = base_radius * math.cos(angle)
-        y1 = base_radius * math.sin(angle)
-        z1 = 0
-        
-        # Top point
-        x2 = top_radius * math.cos(angle)
-        y2 = top_radius * math.sin(angle)
-        z2 = height
+        p1 = [base_radius * math.cos(angle), base_radius * math.sin(angle), 0.0]
+        p2 = [top_radius * math.cos(angle), top_radius * math.sin(angle), float(height)]
         
         # Calculate appropriate radius for the cutter pipe
-        # Chord length at bottom
-        chord_bottom = 2 * base_radius * math.sin(math.pi / flute_count)
-        # Use slightly more than half chord for a reasonably deep flute, 
-        # or exactly half for semi-circle if flat.
-        # For Doric, we want sharp arrises (ridges), so the cuts must meet.
-        # If radius = chord/2 and centered on chord, they meet.
-        # If centered on surface (arc), we need to adjust.
-        # Let's use a factor.
-        flute_radius_bottom = chord_bottom * 0.5
-        
-        # Chord length at top
-        chord_top = 2 * top_radius * math.sin(math.pi / flute_count)
-        flute_radius_top = chord_top * 0.5
+        # For Doric, we want sharp arrises (ridges), so the cuts must meet:
+        # half the chord between neighbouring flute centres, at both ends.
+        flute_radius_bottom = base_radius * math.sin(math.pi / flute_count)
+        flute_radius_top = top_radius * math.sin(math.pi / flute_count)
         
         # Extend the cutter axis to avoid coincident faces at top and bottom
-        p1 = rs.coerce3dpoint([x1, y1, z1])
-        p2 = rs.coerce3dpoint([x2, y2, z2])
-        vector = p2 - p1
-        length = vector.Length
-        unit_vector = vector / length
+        vector = [b - a for a, b in zip(p1, p2)]
+        length = math.sqrt(sum(c * c for c in vector))
+        unit_vector = [c / length for c in vector]
         
         extension = length * 0.1 # Extend by 10%
         
-        p1_ext = p1 - unit_vector * extension
-        p2_ext = p2 + unit_vector * extension
+        p1_ext = [a - u * extension for a, u in zip(p1, unit_vector)]
+        p2_ext = [b + u * extension for b, u in zip(p2, unit_vector)]
         
         # Adjust radii for the extended pipe
         radius_slope = (flute_radius_top - flute_radius_bottom) / length
         r1_ext = flute_radius_bottom - radius_slope * extension
         r2_ext = flute_radius_top + radius_slope * extension
-        
+        cutters.append((p1_ext, p2_ext, r1_ext, r2_ext))
+    return cutters
+
+def capital_dimensions(height, top_radius):
+    """
+    Sizes of the capital: the echinus (cushion) as a truncated cone from
+    (z0, r0) to (z1, r1) and the square abacus slab on top of it.
+    """
+    echinus_height = top_radius * 0.5
+    echinus_top_r = top_radius * 1.5
+    return {
+        "echinus_z0": height,
+        "echinus_r0": top_radius,
+        "echinus_z1": height + echinus_height,
+        "echinus_r1": echinus_top_r,
+        "abacus_width": echinus_top_r * 1.4,
+        "abacus_height": top_radius * 0.4,
+        "abacus_z": height + echinus_height,
+    }
+
+def _build_shaft_boolean(height, base_radius, top_radius, flute_count):
+    # 2. Create the Shaft (Truncated Cone)
+    # Base plane is WorldXY
+    # plane = rs.WorldXYPlane()
+    # AddTruncatedCone(plane, height, radius1, radius2, cap=True)
+    rs.Command("_-TruncatedCone 0,0,0 " + str(base_radius) + " 0,0," + str(height) + " " + str(top_radius))
+    shaft = rs.LastCreatedObjects()[0]
+    
+    # 3. Create Flutes (Boolean Subtraction)
+    cutters = []
+    for start, end, r_start, r_end in flute_cutters(height, base_radius, top_radius, flute_count):
         # Create the axis line for the pipe
-        line = rs.AddLine(p1_ext, p2_ext)
+        line = rs.AddLine(start, end)
         
         # Create the tapered pipe cutter
         # params=[0,1] (start, end), radii=[r_bot, r_top], cap=1 (flat)
         domain = rs.CurveDomain(line)
-        cutter = rs.AddPipe(line, [domain[0], domain[1]], [r1_ext, r2_ext], 1, 1)
+        cutter = rs.AddPipe(line, [domain[0], domain[1]], [r_start, r_end], 1, 1)
         
         rs.DeleteObject(line)
         if cutter:
@@ -104,25 +240,28 @@ def create_doric_column():
             # Fallback if boolean fails (e.g. geometry issues), clean up cutters
             rs.DeleteObjects(cutters)
 
+    return shaft
+
+def _build_doric_column(height, base_radius, top_radius, flute_count, engine):
+    shaft = None
+    if engine == "loft":
+        shaft = _build_shaft_loft(height, base_radius, top_radius, flute_count)
+    if not shaft:
+        # Boolean engine, also used if the loft fails
+        shaft = _build_shaft_boolean(height, base_radius, top_radius, flute_count)
+    
     # 4. Create Capital
     # The capital consists of the Echinus (cushion) and Abacus (flat slab).
     
-    # Echinus parameters
-    echinus_height = top_radius * 0.5
-    echinus_base_r = top_radius
-    echinus_top_r = top_radius * 1.5
-    
-    # base_plane = rs.WorldXYPlane()
-    # echinus_origin = rs.PointAdd(base_plane[0], rs.VectorScale(base_plane[3], height))
-    # echinus_plane = rs.PlaneFromFrame(echinus_origin, base_plane[1], base_plane[2])
-    
-    rs.Command("_-TruncatedCone 0,0," + str(height) + " " + str(echinus_base_r) + " 0,0," + str(height + echinus_height) + " " + str(echinus_top_r))
+    capital = capital_dimensions(height, top_radius)
+    rs.Command("_-TruncatedCone 0,0," + str(capital["echinus_z0"]) + " " + str(capital["echinus_r0"]) +
+               " 0,0," + str(capital["echinus_z1"]) + " " + str(capital["echinus_r1"]))
     echinus = rs.LastCreatedObjects()[0]
     
     # Abacus parameters
-    abacus_width = echinus_top_r * 1.4 # Square width
-    abacus_height = top_radius * 0.4
-    abacus_z = height + echinus_height
+    abacus_width = capital["abacus_width"] # Square width
+    abacus_height = capital["abacus_height"]
+    abacus_z = capital["abacus_z"]
     
     # Create Abacus Box
     # Corners
@@ -146,10 +285,139 @@ def create_doric_column():
         # Union Shaft and Capital
         final_column = rs.BooleanUnion([shaft, capital])
         if final_column:
-            rs.SelectObject(final_column[0])
+            return final_column[0]
+    return None
+
+def _truncated_cone_brep(z0, r0, z1, r1):
+    # Closed solid revolved from its half cross-section
+    import Rhino.Geometry as rg
+    profile = rg.PolylineCurve([rg.Point3d(0, 0, z0), rg.Point3d(r0, 0, z0),
+                                rg.Point3d(r1, 0, z1), rg.Point3d(0, 0, z1)])
+    axis = rg.Line(rg.Point3d(0, 0, z0), rg.Point3d(0, 0, z1))
+    return rg.Brep.CreateFromRevSurface(rg.RevSurface.Create(profile, axis), False, False)
+
+def _build_doric_column_rhinocommon(height, base_radius, top_radius, flute_count):
+    import Rhino.Geometry as rg
+    import System
+    tolerance = sc.doc.ModelAbsoluteTolerance
+    angle_tolerance = sc.doc.ModelAngleToleranceRadians
+    
+    # Every piece stays in memory until the finished solid is added
+    shaft = _truncated_cone_brep(0, base_radius, height, top_radius)
+    cutters = []
+    for start, end, r_start, r_end in flute_cutters(height, base_radius, top_radius, flute_count):
+        rail = rg.LineCurve(rg.Point3d(*start), rg.Point3d(*end))
+        pipes = rg.Brep.CreatePipe(rail, [rail.Domain.T0, rail.Domain.T1], [r_start, r_end], True,
+                                   rg.PipeCapMode.Flat, True, tolerance, angle_tolerance)
+        if pipes:
+            cutters.extend(pipes)
+    if cutters:
+        fluted = rg.Brep.CreateBooleanDifference([shaft], cutters, tolerance)
+        # As in the boolean engine, a failed difference leaves a plain shaft
+        if fluted:
+            shaft = fluted[0]
+    
+    capital = capital_dimensions(height, top_radius)
+    echinus = _truncated_cone_brep(capital["echinus_z0"], capital["echinus_r0"],
+                                   capital["echinus_z1"], capital["echinus_r1"])
+    half_w = capital["abacus_width"] / 2.0
+    abacus = rg.Box(rg.Plane.WorldXY, rg.Interval(-half_w, half_w), rg.Interval(-half_w, half_w),
+                    rg.Interval(capital["abacus_z"], capital["abacus_z"] + capital["abacus_height"])).ToBrep()
+    
+    column = rg.Brep.CreateBooleanUnion([shaft, echinus, abacus], tolerance)
+    if not column:
+        return None
+    column_id = sc.doc.Objects.AddBrep(column[0])
+    if column_id == System.Guid.Empty:
+        return None
+    return column_id
+
+def _column_params(params):
+    merged = dict(DEFAULT_COLUMN_PARAMS)
+    if params:
+        unknown = set(params) - set(DEFAULT_COLUMN_PARAMS)
+        if unknown:
+            raise ValueError("Unknown column parameters: " + ", ".join(sorted(unknown)))
+        merged.update(params)
+    return merged
+
+def column_from_params(params=None, cache=None):
+    """
+    Non-interactive entry point: builds a column from a dict of parameters
+    (missing keys use DEFAULT_COLUMN_PARAMS) and returns its ID.
+    """
+    p = _column_params(params)
+    return build_doric_column(p["height"], p["base_radius"], p["top_radius"], p["flute_count"],
+                              engine=p["engine"], cache=cache)
+
+def linear_placements(count, spacing, start=(0, 0, 0), direction=(1, 0, 0)):
+    """
+    Evenly spaced placement points along a line, for create_colonnade.
+    """
+    length = math.sqrt(sum(c * c for c in direction))
+    unit = [c / length for c in direction]
+    return [[start[k] + unit[k] * spacing * i for k in range(3)] for i in range(count)]
+
+def create_colonnade(params, placements, cache=None):
+    """
+    Places identical columns at each placement without rebuilding the solid.
+    
+    The column is built once (or loaded from the cache) as a block
+    definition named after its parameters, and every placement becomes a
+    block instance. A placement is a point ((x, y), (x, y, z), a list or a
+    Point3d), or a (point, rotation_degrees) pair whose first item is itself
+    a point. Returns the IDs of the inserted instances.
+    """
+    p = _column_params(params)
+    block_name = "DoricColumn_" + disk_cache.cache_key(
+        "doric_column", COLUMN_VERSION, p["engine"], p["height"], p["base_radius"],
+        p["top_radius"], p["flute_count"])[:12]
+    
+    # The same parameters reuse an existing definition in the document
+    if not rs.IsBlock(block_name):
+        column = column_from_params(p, cache=cache)
+        if not column:
+            return []
+        rs.AddBlock([column], [0, 0, 0], block_name, True)
+    
+    instances = []
+    for placement in placements:
+        angle = 0
+        # (x, y) is a point too: only a pair that starts with a point carries an angle
+        if (isinstance(placement, (tuple, list)) and len(placement) == 2
+                and not isinstance(placement[0], numbers.Number)):
+            placement, angle = placement
+        instance = rs.InsertBlock(block_name, placement, angle_degrees=angle)
+        if instance:
+            instances.append(instance)
+    return instances
+
+def create_doric_column():
+    # 1. Get User Parameters
+    height = rs.GetReal("Column Height", DEFAULT_COLUMN_PARAMS["height"])
+    if height is None: return
+    
+    base_radius = rs.GetReal("Base Radius", DEFAULT_COLUMN_PARAMS["base_radius"])
+    if base_radius is None: return
+    
+    top_radius = rs.GetReal("Top Radius", DEFAULT_COLUMN_PARAMS["top_radius"])
+    if top_radius is None: return
+    
+    flute_count = rs.GetInteger("Number of Flutes", DEFAULT_COLUMN_PARAMS["flute_count"])
+    if flute_count is None: return
+    
+    cache = disk_cache.DiskCache("geometry")
+    
+    # Disable redraw for speed
+    rs.EnableRedraw(False)
+    column = build_doric_column(height, base_radius, top_radius, flute_count, cache=cache)
+    if column:
+        rs.SelectObject(column)
     
     rs.EnableRedraw(True)
     print("Doric column generated.")
+    print(cache.format_stats())
+    return column
 
 if __name__ == "__main__":
     create_doric_column()
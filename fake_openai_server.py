@@ -0,0 +1,222 @@
+"""
+Local stand-in for the OpenAI chat-completions API, for benchmarks.
+
+Serves canned completions over plain HTTP/1.1 with keep-alive. connect_delay
+is slept once per new connection to mimic the TCP+TLS handshake of the real
+API, and response_delay once per request to mimic generation time. Requests
+with "stream": true get server-sent events, one small token every
+token_delay seconds; without streaming the whole reply is sent once all of
+its tokens would have been generated. Requests with "n" get that many choices.
+
+Rate limiting can be simulated: rate_limit_rate answers that fraction of
+requests (picked at random) with 429, and rpm_limit answers 429 to requests
+beyond rpm_limit / 60 in any one second. Both send a Retry-After of
+retry_after seconds.
+
+    with FakeOpenAIServer(connect_delay=0.05) as server:
+        client = openai_client.OpenAIClient("test", base_url=server.base_url)
+"""
+import json
+import random
+import re
+import socket
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+DEFAULT_REPLY = (
+    "import rhinoscriptsyntax as rs\n"
+    "rs.AddSphere([0, 0, 0], 10)\n"
+)
+
+
+def split_tokens(text):
+    """
+    Splits text into small pieces roughly the size of model tokens.
+    """
+    return re.findall(r"\s*\S{1,4}|\s+", text)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        # Headers and body are written separately; avoid Nagle/delayed-ACK stalls
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        server = self.server.owner
+        with server.lock:
+            server.connections += 1
+        if server.connect_delay:
+            time.sleep(server.connect_delay)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(("%x\r\n" % len(data)).encode("ascii") + data + b"\r\n")
+
+    def _send_stream(self, request, tokens):
+        server = self.server.owner
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for token in tokens:
+            if server.token_delay:
+                time.sleep(server.token_delay)
+            event = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "model": request.get("model", "fake"),
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }
+            self._write_chunk("data: " + json.dumps(event) + "\n\n")
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_POST(self):
+        server = self.server.owner
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+        with server.lock:
+            server.requests += 1
+            server.last_request = request
+        if server.rate_limited_now():
+            self._send_json(429, {"error": {
+                "message": "Rate limit reached (fake server)",
+                "type": "requests",
+                "code": "rate_limit_exceeded",
+            }}, {"Retry-After": str(server.retry_after)})
+            return
+        if server.response_delay:
+            time.sleep(server.response_delay)
+        if request.get("stream"):
+            self._send_stream(request, split_tokens(server.reply_for(request)))
+            return
+        # "n" choices are generated side by side: the reply takes as long as the longest
+        replies = [server.reply_for(request) for _ in range(int(request.get("n") or 1))]
+        if server.token_delay:
+            time.sleep(server.token_delay * max(len(split_tokens(r)) for r in replies))
+        self._send_json(200, {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "model": request.get("model", "fake"),
+            "choices": [{
+                "index": i,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop",
+            } for i, reply in enumerate(replies)],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeOpenAIServer(object):
+    """
+    Runs the stand-in server on a background thread (port 0 picks a free port).
+    `reply` is the assistant text returned, a list of texts handed out in
+    turn (one per choice), or a function of the request dict.
+    """
+
+    def __init__(self, reply=DEFAULT_REPLY, connect_delay=0.0, response_delay=0.0,
+                 token_delay=0.0, rate_limit_rate=0.0, rpm_limit=None, retry_after=1,
+                 seed=None, host="127.0.0.1", port=0):
+        self.reply = reply
+        self.connect_delay = connect_delay
+        self.response_delay = response_delay
+        self.token_delay = token_delay
+        self.connections = 0
+        self.requests = 0
+        self.last_request = None
+        self.replies_served = 0
+        self.rate_limit_rate = rate_limit_rate
+        self.rpm_limit = rpm_limit
+        self.retry_after = retry_after
+        self.rate_limited = 0
+        self._random = random.Random(seed)
+        self._second = None
+        self._second_count = 0
+        self.lock = threading.Lock()
+        self._httpd = _ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.owner = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return "http://{}:{}/v1".format(host, port)
+
+    def rate_limited_now(self):
+        """
+        Decides (and counts) whether the current request gets a 429.
+        """
+        with self.lock:
+            limited = bool(self.rate_limit_rate) and self._random.random() < self.rate_limit_rate
+            if self.rpm_limit:
+                second = int(time.time())
+                if second != self._second:
+                    self._second, self._second_count = second, 0
+                if self._second_count >= max(self.rpm_limit / 60.0, 1):
+                    limited = True
+                elif not limited:
+                    self._second_count += 1
+            if limited:
+                self.rate_limited += 1
+            return limited
+
+    def reply_for(self, request):
+        with self.lock:
+            served = self.replies_served
+            self.replies_served += 1
+        if callable(self.reply):
+            return self.reply(request)
+        if isinstance(self.reply, (list, tuple)):
+            return self.reply[served % len(self.reply)]
+        return self.reply
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    server = FakeOpenAIServer(port=8765).start()
+    print("Fake OpenAI API on " + server.base_url + " (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
@@ -1,29 +1,18 @@
-try:
-    import urllib2
-except ImportError:
-    import urllib.request as urllib2
-    import urllib.error
-import json
 import re
 import os
 import sys
-import datetime
+import threading
 import time
 
-# Check for IronPython/Rhino environment and setup .NET imports
 try:
-    import System
-    from System.Net import WebRequest, ServicePointManager, SecurityProtocolType
-    from System.IO import StreamReader
-    from System.Text import Encoding
-    # Ensure TLS 1.2 is enabled for OpenAI API
-    try:
-        ServicePointManager.SecurityProtocol = SecurityProtocolType.Tls12
-    except:
-        pass
-    IS_IRONPYTHON = True
+    import queue
 except ImportError:
-    IS_IRONPYTHON = False
+    import Queue as queue
+
+# The project modules (chat_history, openai_client, response_cache,
+# rs_profiler, script_runner, script_validation, session_store) are imported
+# where they are used: when a generation_daemon.py is running, a Rhino
+# command only needs this file and generation_daemon to start
 
 # Function to manually load .env file since python-dotenv is not standard in IronPython
 def load_env(filepath):
@@ -56,138 +45,222 @@ except:
 
 API_KEY = os.getenv("OPENAI_API_KEY")
 
+# Echo the script token by token while it is generated (set to 0 to wait for the whole reply)
+STREAM_OUTPUT = os.getenv("RHINO_AI_STREAM", "1") != "0"
+
+# Reuse replies to requests seen before (set RHINO_AI_NO_CACHE=1 to always ask the model)
+USE_RESPONSE_CACHE = os.getenv("RHINO_AI_NO_CACHE", "0") in ("", "0")
+
+# Token budget for the history sent with each request
+# (0 = chat_history.DEFAULT_CONTEXT_TOKENS)
+CONTEXT_TOKENS = int(os.getenv("RHINO_AI_CONTEXT_TOKENS", "0"))
+
+# Ask for several scripts at once and offer the first that passes script_validation (1 = off)
+CANDIDATES = int(os.getenv("RHINO_AI_CANDIDATES", "1"))
+
+# Request candidates one per request in parallel instead of with a single "n" request
+PARALLEL_CANDIDATES = os.getenv("RHINO_AI_PARALLEL_CANDIDATES", "0") not in ("", "0")
+
+# Limits for running a generated script (seconds, megabytes; 0 = script_runner's defaults)
+RUN_TIMEOUT = float(os.getenv("RHINO_AI_RUN_TIMEOUT", "0"))
+MEMORY_LIMIT_MB = int(os.getenv("RHINO_AI_MEMORY_LIMIT_MB", "0"))
+
+# Scripts that run longer than this (seconds) are reported back to the model as slow
+SLOW_SCRIPT_SECONDS = float(os.getenv("RHINO_AI_SLOW_SCRIPT_SECONDS", "10"))
+
+# Profile rs calls of each run and save profile_N.json next to the script
+PROFILE_SCRIPTS = os.getenv("RHINO_AI_PROFILE", "0") not in ("", "0")
+
+# Save scripts through the session blob store so identical retries share one file
+DEDUP_SESSIONS = os.getenv("RHINO_AI_DEDUP", "0") not in ("", "0")
+
 def get_sessions_dir():
-    try:
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-    except:
-        script_dir = os.getcwd()
-    sessions_dir = os.path.join(script_dir, "sessions")
-    if not os.path.exists(sessions_dir):
-        os.makedirs(sessions_dir)
-    return sessions_dir
+    import session_store
+    return session_store.get_sessions_dir()
 
 def get_latest_session_folder():
-    sessions_dir = get_sessions_dir()
-    subdirs = [os.path.join(sessions_dir, d) for d in os.listdir(sessions_dir) if os.path.isdir(os.path.join(sessions_dir, d))]
-    if not subdirs:
+    # O(1): read from sessions/index.json instead of listing every folder
+    import session_store
+    session = session_store.SessionStore().latest_session()
+    if session is None:
         return None
-    subdirs.sort()
-    return subdirs[-1]
+    return session.folder
 
 def create_new_session_folder():
-    sessions_dir = get_sessions_dir()
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    session_folder = os.path.join(sessions_dir, timestamp)
-    os.makedirs(session_folder)
-    return session_folder
+    import session_store
+    return session_store.SessionStore().create_session().folder
 
 def get_next_index(session_folder):
-    files = os.listdir(session_folder)
-    count = 0
-    for f in files:
-        if f.startswith("script_") and f.endswith(".py"):
-            count += 1
-    return count
+    import session_store
+    return session_store.Session(session_folder).next_index()
 
 def build_chat_history(session_folder, system_prompt):
-    messages = [{"role": "system", "content": system_prompt}]
-    
-    index = 0
-    while True:
-        prompt_file = os.path.join(session_folder, "prompt_{}.txt".format(index))
-        script_file = os.path.join(session_folder, "script_{}.py".format(index))
-        error_file = os.path.join(session_folder, "error_{}.txt".format(index))
-        
-        if not os.path.exists(prompt_file):
-            break
-            
-        with open(prompt_file, 'r') as f:
-            prompt_text = f.read()
-        messages.append({"role": "user", "content": prompt_text})
-        
-        if os.path.exists(script_file):
-            with open(script_file, 'r') as f:
-                script_code = f.read()
-            messages.append({"role": "assistant", "content": script_code})
-            
-        if os.path.exists(error_file):
-            with open(error_file, 'r') as f:
-                error_text = f.read()
-            messages.append({"role": "user", "content": "The previous script caused an error: " + error_text})
-            
-        index += 1
-        
-    return messages
-
-def generate_script_content(messages):
-    if not API_KEY:
-        return "Error: OPENAI_API_KEY not found. Please ensure .env file exists and is loaded."
+    # Full, unbudgeted history; the REPL keeps a chat_history.ChatHistory instead
+    import chat_history
+    return chat_history.ChatHistory.load(session_folder, system_prompt, max_tokens=None).messages()
+
+def echo_token(text):
+    sys.stdout.write(text)
+    if hasattr(sys.stdout, "flush"):
+        sys.stdout.flush()
 
-    url = "https://api.openai.com/v1/chat/completions"
-    
-    data = {
+def _stream_reply(client, data, on_token):
+    import openai_client
+    fences = openai_client.FenceStripper()
+    parts = []
+    for token in client.stream_chat_completion(data):
+        parts.append(token)
+        if on_token:
+            text = fences.feed(token)
+            if text:
+                on_token(text)
+    if on_token:
+        text = fences.flush()
+        if text:
+            on_token(text)
+    return "".join(parts)
+
+def _chat_request(messages):
+    return {
         "model": "gpt-4o",
         "messages": messages,
         "temperature": 0.7,
         "max_tokens": 1000
     }
 
-    if IS_IRONPYTHON:
-        try:
-            request = WebRequest.Create(url)
-            request.Method = "POST"
-            request.ContentType = "application/json"
-            request.Headers.Add("Authorization", "Bearer " + API_KEY)
-            
-            json_str = json.dumps(data)
-            bytes_data = Encoding.UTF8.GetBytes(json_str)
-            request.ContentLength = bytes_data.Length
-            
-            req_stream = request.GetRequestStream()
-            req_stream.Write(bytes_data, 0, bytes_data.Length)
-            req_stream.Close()
-            
-            try:
-                response = request.GetResponse()
-                stream = response.GetResponseStream()
-                reader = StreamReader(stream)
-                response_text = reader.ReadToEnd()
-                reader.Close()
-                stream.Close()
-                response.Close()
-                
-                response_json = json.loads(response_text)
-                return response_json['choices'][0]['message']['content']
-            except Exception as e:
-                if hasattr(e, 'Response') and e.Response:
-                    stream = e.Response.GetResponseStream()
-                    reader = StreamReader(stream)
-                    err_text = reader.ReadToEnd()
-                    reader.Close()
-                    stream.Close()
-                    e.Response.Close()
-                    return "API Error: " + err_text
-                return "Error getting response: " + str(e)
-        except Exception as e:
-            return "Error (.NET): " + str(e)
-    else:
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": "Bearer " + API_KEY
-        }
-        json_data = json.dumps(data).encode('utf-8')
+def extract_code(reply):
+    # Clean up code (extract from markdown block if present)
+    code_block_match = re.search(r"```(?:python)?\s*(.*?)```", reply, re.DOTALL)
+    if code_block_match:
+        reply = code_block_match.group(1)
+    return reply.strip()
+
+def generate_script_content(messages, stream=False, on_token=None, cache=None, raise_errors=False):
+    """
+    Asks the model for a script. With stream=True the reply is received as
+    server-sent events and each piece is passed to on_token as it arrives,
+    with ``` fence lines already stripped. The full reply is returned either way.
+    If a response_cache.ResponseCache is given, it is consulted first and
+    successful replies are stored in it.
+    Request errors are returned as an error message, or raised with
+    raise_errors=True (batch_generate.py retries them).
+    """
+    if not API_KEY:
+        return "Error: OPENAI_API_KEY not found. Please ensure .env file exists and is loaded."
+
+    import openai_client
+    data = _chat_request(messages)
+
+    if cache is not None:
+        cached = cache.get(data)
+        if cached is not None:
+            if stream and on_token:
+                fences = openai_client.FenceStripper()
+                on_token(fences.feed(cached) + fences.flush())
+            return cached
+
+    try:
+        # Shared client: the connection stays open between turns
+        client = openai_client.get_client(API_KEY)
+        if stream:
+            reply = _stream_reply(client, data, on_token)
+        else:
+            response_json = client.chat_completion(data)
+            reply = response_json['choices'][0]['message']['content']
+    except openai_client.APIError as e:
+        if raise_errors:
+            raise
+        return "API Error: " + str(e.status) + " " + e.body
+    except Exception as e:
+        if raise_errors:
+            raise
+        return "Error getting response: " + str(e)
+
+    if cache is not None:
+        cache.put(data, reply)
+    return reply
+
+def iter_candidates(client, data, count, parallel=False):
+    """
+    Yields `count` replies to one request. By default they come from a single
+    request with "n"; with parallel=True each is its own request on a worker
+    thread and replies are yielded in the order they finish. Raises the first
+    error only if every parallel request failed.
+    """
+    if not parallel:
+        request = dict(data)
+        request["n"] = count
+        for choice in client.chat_completion(request)["choices"]:
+            yield choice["message"]["content"]
+        return
+
+    results = queue.Queue()
+
+    def worker():
         try:
-            req = urllib2.Request(url, json_data, headers)
-            response = urllib2.urlopen(req)
-            response_text = response.read().decode('utf-8')
-            response_json = json.loads(response_text)
-            return response_json['choices'][0]['message']['content']
-        except urllib2.HTTPError as e:
-            return "HTTP Error: " + str(e.code) + " " + str(e.read())
-        except urllib2.URLError as e:
-            return "URL Error: " + str(e.reason)
+            results.put((client.chat_completion(data)["choices"][0]["message"]["content"], None))
         except Exception as e:
-            return "Error: " + str(e)
+            results.put((None, e))
+
+    for _ in range(count):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+    errors = []
+    for _ in range(count):
+        reply, error = results.get()
+        if error is None:
+            yield reply
+        else:
+            errors.append(error)
+    if len(errors) == count:
+        raise errors[0]
+
+def generate_validated_script(messages, count, parallel=False, cache=None, on_candidate=None):
+    """
+    Asks for `count` candidate scripts and returns (code, result) for the first
+    one that passes script_validation.validate_script, checking each as it
+    arrives; on_candidate(number, result) is called for every check. If none
+    passes, the first candidate is returned with its failed result. Request
+    errors return (message, None) like generate_script_content.
+    """
+    if not API_KEY:
+        return "Error: OPENAI_API_KEY not found. Please ensure .env file exists and is loaded.", None
+
+    import openai_client
+    import script_validation
+    data = _chat_request(messages)
+
+    if cache is not None:
+        cached = cache.get(data)
+        if cached is not None:
+            code = extract_code(cached)
+            result = script_validation.validate_script(code)
+            if result.ok:
+                return code, result
+
+    first = None
+    try:
+        client = openai_client.get_client(API_KEY)
+        for number, reply in enumerate(iter_candidates(client, data, count, parallel), 1):
+            code = extract_code(reply)
+            result = script_validation.validate_script(code)
+            if on_candidate:
+                on_candidate(number, result)
+            if result.ok:
+                if cache is not None:
+                    cache.put(data, reply)
+                return code, result
+            if first is None:
+                first = (code, result)
+    except openai_client.APIError as e:
+        return "API Error: " + str(e.status) + " " + e.body, None
+    except Exception as e:
+        return "Error getting response: " + str(e), None
+    return first
+
+def print_candidate(number, result):
+    print("Candidate {}: {}".format(number, "ok" if result.ok else result.error))
 
 def get_input_compat(prompt):
     if sys.version_info[0] < 3:
@@ -204,30 +277,130 @@ SYSTEM_PROMPT = (
     " Make sure that the generated script has the necessary imports because it will be running on its own."
 )
 
-if __name__ == "__main__":
-    session_folder = get_latest_session_folder()
-    if not session_folder:
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+class LocalGenerator(object):
+    """
+    The REPL's session, chat history and response cache, held in this
+    process. generation_daemon.py keeps one of these alive between Rhino
+    commands and its DaemonGenerator offers the same methods over a socket.
+    """
+
+    def __init__(self, store=None):
+        import response_cache
+        import session_store
+        self.store = store or session_store.SessionStore(dedup=DEDUP_SESSIONS)
+        self.cache = response_cache.ResponseCache() if USE_RESPONSE_CACHE else None
+        self.session = None
+        self.history = None
+        self._log_size = None
+
+    def open(self):
+        """
+        Opens the latest session, or a new one if there is none, and returns
+        (name, created). The history is read again only if the session log
+        changed since this generator last wrote to it.
+        """
+        created = False
+        session = self.store.latest_session()
+        if session is None:
+            session = self.store.create_session()
+            created = True
+        size = _file_size(session.log_path)
+        if self.session is None or session.folder != self.session.folder or size != self._log_size:
+            self.session = session
+            # Read the session once; later turns are appended in memory
+            import chat_history
+            self.history = chat_history.ChatHistory.from_session(
+                session, SYSTEM_PROMPT, CONTEXT_TOKENS or chat_history.DEFAULT_CONTEXT_TOKENS)
+            self._log_size = size
+        return self.session.name, created
+
+    def _logged(self):
+        self._log_size = _file_size(self.session.log_path)
+
+    def generate(self, prompt, candidates=1, parallel=False, on_token=None, on_candidate=None):
+        """
+        Generates a script for `prompt`, saves it as the next turn and returns
+        a dict with its index, path and code. "valid" is False when candidates
+        were requested and none passed validation. With on_token the reply is
+        streamed (see generate_script_content).
+        """
+        messages = self.history.messages(prompt)
+        valid = None
+        if candidates > 1:
+            code, validation = generate_validated_script(
+                messages, candidates, parallel, self.cache, on_candidate=on_candidate)
+            if validation is not None:
+                valid = validation.ok
+        elif on_token:
+            code = generate_script_content(messages, stream=True, on_token=on_token, cache=self.cache)
+        else:
+            code = generate_script_content(messages, cache=self.cache)
+        code = extract_code(code)
+
+        # Reserve the next index and append the turn to the session log
+        index = self.session.allocate_index()
+        path = self.session.add_turn(index, prompt, code)
+        self.history.add_turn(index, prompt, code)
+        self._logged()
+        return {"index": index, "path": path, "code": code, "valid": valid}
+
+    def record_run(self, index, record, error=None):
+        """
+        Logs one run of script `index` (script_runner.RunResult.to_record())
+        and its error message, if it failed. Returns the note passed to the
+        model about a slow run, or None.
+        """
+        self.session.add_run(index, record)
+        note = None
+        if error:
+            self.session.add_error(index, error)
+            self.history.set_error(index, error)
+        elif record.get("duration", 0) > SLOW_SCRIPT_SECONDS:
+            note = ("The previous script worked but took {:.1f} seconds to run; "
+                    "prefer faster approaches.".format(record["duration"]))
+            self.session.add_note(index, note)
+            self.history.set_note(index, note)
+        self._logged()
+        return note
+
+    def format_stats(self):
+        return self.cache.format_stats() if self.cache is not None else None
+
+def get_rhino_string(prompt):
+    """
+    Asks in Rhino's command line, or on the console outside Rhino.
+    """
+    try:
+        import Rhino
+    except ImportError:
+        return get_input_compat(prompt + " ")
+    gs = Rhino.Input.Custom.GetString()
+    gs.SetCommandPrompt(prompt)
+    gs.AcceptNothing(True)
+    gs.GetLiteralString()
+    if gs.CommandResult() == Rhino.Commands.Result.Success:
+        return gs.StringResult()
+    return ""
+
+def main(generator):
+    """
+    The generate / save / run loop, on a LocalGenerator or a
+    generation_daemon.DaemonGenerator.
+    """
+    name, created = generator.open()
+    if created:
         print("No existing session found. Starting a new session.")
-        session_folder = create_new_session_folder()
     else:
-        print("Continuing session: " + os.path.basename(session_folder))
+        print("Continuing session: " + name)
 
     while True:
-        user_request = ""
-        
-        # Try to get input from Rhino if available
-        try:
-            import Rhino
-            gs = Rhino.Input.Custom.GetString()
-            gs.SetCommandPrompt("What do you want Rhino to do? (or type 'quit' to exit)")
-            gs.AcceptNothing(True)
-            gs.GetLiteralString()
-            if gs.CommandResult() == Rhino.Commands.Result.Success:
-                rhino_input = gs.StringResult()
-                if rhino_input:
-                    user_request = rhino_input
-        except ImportError:
-            user_request = get_input_compat("What do you want Rhino to do? (or type 'quit' to exit) ")
+        user_request = get_rhino_string("What do you want Rhino to do? (or type 'quit' to exit)")
 
         if not user_request:
             print("No request provided.")
@@ -235,75 +408,69 @@ if __name__ == "__main__":
 
         if user_request.strip().lower() in ["quit", "exit", "stop"]:
             print("Exiting session.")
+            stats = generator.format_stats()
+            if stats:
+                print(stats)
             break
 
-        # Build history
-        messages = build_chat_history(session_folder, SYSTEM_PROMPT)
-        messages.append({"role": "user", "content": user_request})
-
         print("Generating script for: " + user_request)
-        generated_code = generate_script_content(messages)
-        
-        # Clean up code (extract from markdown block if present)
-        code_block_match = re.search(r"```(?:python)?\s*(.*?)```", generated_code, re.DOTALL)
-        if code_block_match:
-            generated_code = code_block_match.group(1)
-        
-        generated_code = generated_code.strip()
-
-        # Determine index for filenames
-        index = get_next_index(session_folder)
-        
-        # Save prompt
-        prompt_filename = "prompt_{}.txt".format(index)
-        with open(os.path.join(session_folder, prompt_filename), "w") as f:
-            f.write(user_request)
-
-        # Save script
-        script_filename = "script_{}.py".format(index)
-        full_path = os.path.join(session_folder, script_filename)
-        
-        with open(full_path, "w") as f:
-            f.write(generated_code)
-            
-        print("\n--- Generated Script (" + script_filename + ") ---")
-        print(generated_code)
-        print("------------------------------------------\n")
-        
+        streamed = STREAM_OUTPUT and CANDIDATES <= 1
+        if CANDIDATES > 1:
+            # Candidates are checked before they are offered, so they are not streamed
+            print("Requesting {} candidates...".format(CANDIDATES))
+            turn = generator.generate(user_request, CANDIDATES, PARALLEL_CANDIDATES,
+                                      on_candidate=print_candidate)
+            if turn["valid"] is False:
+                print("Warning: no candidate passed validation; showing the first one.")
+        elif streamed:
+            print("\n--- Generated Script ---")
+            turn = generator.generate(user_request, on_token=echo_token)
+            print("\n------------------------------------------\n")
+        else:
+            turn = generator.generate(user_request)
+
+        index = turn["index"]
+        full_path = turn["path"]
+        script_filename = os.path.basename(full_path)
+
+        if streamed:
+            print("Saved as " + script_filename)
+        else:
+            print("\n--- Generated Script (" + script_filename + ") ---")
+            print(turn["code"])
+            print("------------------------------------------\n")
+
         # Ask to run
-        run_it = ""
-        try:
-            import Rhino
-            gs = Rhino.Input.Custom.GetString()
-            gs.SetCommandPrompt("Do you want to run this script? (Y/N)")
-            gs.AcceptNothing(True)
-            gs.GetLiteralString()
-            if gs.CommandResult() == Rhino.Commands.Result.Success:
-                run_it = gs.StringResult()
-        except ImportError:
-            run_it = get_input_compat("Do you want to run this script? (Y/N): ")
-            
+        run_it = get_rhino_string("Do you want to run this script? (Y/N)")
+
         if run_it and run_it.upper() == "Y":
             print("Running script...")
-            # Execute the script
-            try:
-                # Add the directory to sys.path so imports work if needed
-                if session_folder not in sys.path:
-                    sys.path.append(session_folder)
-                    
-                if sys.version_info[0] < 3:
-                    execfile(full_path)
-                else:
-                    with open(full_path) as f:
-                        code = compile(f.read(), full_path, 'exec')
-                        exec(code)
-                print("Script execution finished.")
-            except Exception as e:
-                error_msg = str(e)
+            import script_runner
+            # Separate worker process (or watchdog in Rhino) with a timeout and memory cap
+            profile_path = None
+            if PROFILE_SCRIPTS:
+                profile_path = os.path.join(os.path.dirname(full_path), "profile_{}.json".format(index))
+            result = script_runner.run_script(
+                full_path, timeout=RUN_TIMEOUT or script_runner.DEFAULT_TIMEOUT,
+                memory_limit=MEMORY_LIMIT_MB * 1024 * 1024 or script_runner.DEFAULT_MEMORY_LIMIT,
+                profile_path=profile_path)
+            error_msg = None if result.ok else result.error_message()
+            generator.record_run(index, result.to_record(), error_msg)
+            if result.profile_path:
+                import rs_profiler
+                print(rs_profiler.format_report(rs_profiler.load_report(result.profile_path)))
+            if result.ok:
+                print("Script execution finished in {:.2f} s.".format(result.duration))
+            else:
                 print("Error running script: " + error_msg)
-                # Save error
-                error_filename = "error_{}.txt".format(index)
-                with open(os.path.join(session_folder, error_filename), "w") as f:
-                    f.write(error_msg)
         else:
             print("Script saved but not run.")
+
+if __name__ == "__main__":
+    # A running generation_daemon.py already holds the session, history and
+    # open connections; without one everything is loaded here
+    import generation_daemon
+    generator = generation_daemon.connect()
+    if generator is None:
+        generator = LocalGenerator()
+    main(generator)
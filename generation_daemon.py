@@ -0,0 +1,398 @@
+"""
+Resident generation daemon for the Rhino commands.
+
+Every press of a toolbar button runs ai_chat.py or generate_rhino_script.py
+from scratch: the modules are imported, the session log is read into a chat
+history, the response cache is opened and the first request pays a new TCP
+and TLS handshake. This daemon is a long-lived process that keeps all of
+that loaded. While it runs, the commands connect to it over a localhost
+socket and only send prompts and run results; the generated scripts still
+run in Rhino. When no daemon is running they work in-process as before.
+
+    python generation_daemon.py [serve] [--port N] [--sessions DIR] [--idle-timeout SECONDS]
+    python generation_daemon.py status
+    python generation_daemon.py stop
+
+The daemon writes its port and an access token to daemon.json next to this
+file; a client that cannot read it, connect or authenticate falls back to
+working in-process. Set RHINO_AI_NO_DAEMON=1 to never use the daemon.
+benchmark_daemon.py measures command start-up with and without it.
+
+Protocol: one JSON object per line. A request carries "token", "op" and the
+op's arguments; the daemon answers with any number of progress events
+({"event": "token", ...} or {"event": "candidate", ...}) followed by
+{"event": "result", "value": ...} or {"event": "error", "message": ...}.
+"""
+import json
+import os
+import socket
+import sys
+import time
+from collections import namedtuple
+
+# time.perf_counter is not available on IronPython 2.7
+_clock = getattr(time, "perf_counter", time.time)
+
+DAEMON_FILE = os.getenv("RHINO_AI_DAEMON_FILE",
+                        os.path.join(os.path.dirname(os.path.abspath(__file__)), "daemon.json"))
+
+# Port to listen on (0 = any free port; clients find it in DAEMON_FILE)
+PORT = int(os.getenv("RHINO_AI_DAEMON_PORT", "0"))
+
+# Set RHINO_AI_NO_DAEMON=1 to always work in-process
+USE_DAEMON = os.getenv("RHINO_AI_NO_DAEMON", "0") in ("", "0")
+
+# Exit after this many seconds without a request (0 = never)
+IDLE_TIMEOUT = float(os.getenv("RHINO_AI_DAEMON_IDLE_TIMEOUT", "0"))
+
+# Seconds a client waits for the daemon to accept before working in-process
+CONNECT_TIMEOUT = 0.5
+
+HOST = "127.0.0.1"
+
+# A candidate check as reported by the daemon (ok, error), like script_validation.ValidationResult
+Candidate = namedtuple("Candidate", "ok error")
+
+
+class DaemonError(Exception):
+    """
+    The daemon refused a request or failed while handling it.
+    """
+
+
+def read_daemon_file(path=None):
+    """
+    The running daemon's {"port", "token", "pid"}, or None.
+    """
+    try:
+        with open(path or DAEMON_FILE, "r") as f:
+            info = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(info, dict) or "port" not in info or "token" not in info:
+        return None
+    return info
+
+
+def _encode(message):
+    return (json.dumps(message) + "\n").encode("utf-8")
+
+
+class Connection(object):
+    """
+    One client connection; requests are answered in order.
+    """
+
+    def __init__(self, port, token, timeout=CONNECT_TIMEOUT):
+        self.token = token
+        self.sock = socket.create_connection((HOST, port), timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # Generation takes as long as the model does
+        self.sock.settimeout(None)
+        self.reader = self.sock.makefile("rb")
+
+    def request(self, op, on_event=None, **args):
+        """
+        Sends one request and returns its result value. Progress events are
+        passed to on_event(kind, event) as they arrive.
+        """
+        message = dict(args)
+        message["op"] = op
+        message["token"] = self.token
+        self.sock.sendall(_encode(message))
+        while True:
+            line = self.reader.readline()
+            if not line:
+                raise DaemonError("the daemon closed the connection")
+            event = json.loads(line.decode("utf-8"))
+            kind = event.pop("event", None)
+            if kind == "result":
+                return event.get("value")
+            if kind == "error":
+                raise DaemonError(event.get("message"))
+            if on_event:
+                on_event(kind, event)
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except socket.error:
+            pass
+
+
+class DaemonGenerator(object):
+    """
+    Client side of the daemon with the methods of
+    generate_rhino_script.LocalGenerator, plus chat() for ai_chat.py.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def open(self):
+        value = self.connection.request("open")
+        return value["session"], value["created"]
+
+    def generate(self, prompt, candidates=1, parallel=False, on_token=None, on_candidate=None):
+        def on_event(kind, event):
+            if kind == "token" and on_token:
+                on_token(event["text"])
+            elif kind == "candidate" and on_candidate:
+                on_candidate(event["number"], Candidate(event["ok"], event["error"]))
+
+        return self.connection.request("generate", on_event, prompt=prompt, candidates=candidates,
+                                       parallel=parallel, stream=on_token is not None)
+
+    def record_run(self, index, record, error=None):
+        return self.connection.request("record_run", index=index, record=record, error=error)
+
+    def format_stats(self):
+        return self.connection.request("stats")
+
+    def chat(self, message):
+        return self.connection.request("chat", message=message)
+
+    def ping(self):
+        return self.connection.request("ping")
+
+    def stop(self):
+        return self.connection.request("stop")
+
+    def close(self):
+        self.connection.close()
+
+
+def connect(path=None, timeout=CONNECT_TIMEOUT):
+    """
+    A DaemonGenerator for the running daemon, or None when the daemon is
+    disabled, not running or not answering.
+    """
+    if not USE_DAEMON:
+        return None
+    info = read_daemon_file(path)
+    if info is None:
+        return None
+    connection = None
+    try:
+        connection = Connection(info["port"], info["token"], timeout)
+        connection.request("ping")
+    except (socket.error, DaemonError, ValueError):
+        if connection is not None:
+            connection.close()
+        return None
+    return DaemonGenerator(connection)
+
+
+# Server side. Its imports are deferred so a client only loads the above.
+
+class DaemonState(object):
+    """
+    What the daemon keeps between commands: one LocalGenerator (session,
+    history, response cache; the OpenAI connections live in openai_client's
+    shared clients) and request counters.
+    """
+
+    def __init__(self, sessions_dir=None):
+        import threading
+        import generate_rhino_script
+        import session_store
+        self.generate_rhino_script = generate_rhino_script
+        store = session_store.SessionStore(sessions_dir, dedup=generate_rhino_script.DEDUP_SESSIONS)
+        self.generator = generate_rhino_script.LocalGenerator(store)
+        # Commands share the session, so turns are handled one at a time
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.last_request = _clock()
+        self.requests = 0
+
+    def handle(self, request, send):
+        """
+        Runs one request; progress events go to send(event). Returns the result value.
+        """
+        op = request.get("op")
+        if op == "ping":
+            return {"pid": os.getpid(), "uptime": time.time() - self.started, "requests": self.requests}
+        if op == "chat":
+            import ai_chat
+            return ai_chat.get_chat_response(request["message"])
+        if op == "open":
+            with self.lock:
+                name, created = self.generator.open()
+            return {"session": name, "created": created}
+        if op == "generate":
+            on_token = None
+            if request.get("stream"):
+                def on_token(text):
+                    send({"event": "token", "text": text})
+
+            def on_candidate(number, result):
+                send({"event": "candidate", "number": number, "ok": result.ok, "error": result.error})
+
+            with self.lock:
+                if self.generator.session is None:
+                    self.generator.open()
+                return self.generator.generate(request["prompt"], request.get("candidates", 1),
+                                               request.get("parallel", False), on_token, on_candidate)
+        if op == "record_run":
+            with self.lock:
+                return self.generator.record_run(request["index"], request["record"], request.get("error"))
+        if op == "stats":
+            return self.generator.format_stats()
+        raise DaemonError("unknown op: {}".format(op))
+
+
+def _write_daemon_file(path, info):
+    # Only this user may read the token
+    tmp_path = path + ".tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(info, f)
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp_path, path)
+
+
+def _remove_daemon_file(path, token):
+    info = read_daemon_file(path)
+    if info is not None and info.get("token") == token:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def make_server(port=PORT, sessions_dir=None, path=None):
+    """
+    A daemon server bound to localhost (not yet serving or published).
+    """
+    import binascii
+    import threading
+    try:
+        import socketserver
+    except ImportError:
+        import SocketServer as socketserver
+
+    state = DaemonState(sessions_dir)
+    token = binascii.hexlify(os.urandom(16)).decode("ascii")
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            write_lock = threading.Lock()
+
+            def send(event):
+                with write_lock:
+                    self.wfile.write(_encode(event))
+                    self.wfile.flush()
+
+            for line in iter(self.rfile.readline, b""):
+                try:
+                    request = json.loads(line.decode("utf-8"))
+                except ValueError:
+                    send({"event": "error", "message": "malformed request"})
+                    return
+                if request.get("token") != token:
+                    send({"event": "error", "message": "bad token"})
+                    return
+                state.requests += 1
+                state.last_request = _clock()
+                if request.get("op") == "stop":
+                    send({"event": "result", "value": None})
+                    threading.Thread(target=self.server.shutdown).start()
+                    return
+                try:
+                    send({"event": "result", "value": state.handle(request, send)})
+                except Exception as e:
+                    send({"event": "error", "message": "{}: {}".format(type(e).__name__, e)})
+
+    class Server(socketserver.ThreadingTCPServer):
+        allow_reuse_address = True
+        daemon_threads = True
+
+    server = Server((HOST, port), Handler)
+    server.state = state
+    server.token = token
+    server.daemon_file = path or DAEMON_FILE
+    return server
+
+
+def serve(port=PORT, sessions_dir=None, idle_timeout=IDLE_TIMEOUT, path=None):
+    """
+    Runs the daemon until it is stopped (or idle for idle_timeout seconds).
+    """
+    path = path or DAEMON_FILE
+    if connect(path) is not None:
+        raise DaemonError("a daemon is already running (see {})".format(path))
+    server = make_server(port, sessions_dir, path)
+    port = server.server_address[1]
+    _write_daemon_file(path, {"port": port, "token": server.token, "pid": os.getpid()})
+
+    if idle_timeout:
+        import threading
+
+        def watch():
+            while True:
+                idle = _clock() - server.state.last_request
+                if idle >= idle_timeout:
+                    server.shutdown()
+                    return
+                time.sleep(min(1.0, idle_timeout - idle))
+
+        thread = threading.Thread(target=watch)
+        thread.daemon = True
+        thread.start()
+
+    print("Generation daemon listening on {}:{} (pid {})".format(HOST, port, os.getpid()))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        _remove_daemon_file(path, server.token)
+    print("Generation daemon stopped after {} requests".format(server.state.requests))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+
+    def option(name, default=None):
+        if name in args:
+            i = args.index(name)
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        return default
+
+    port = int(option("--port", PORT))
+    sessions_dir = option("--sessions")
+    idle_timeout = float(option("--idle-timeout", IDLE_TIMEOUT))
+    command = args[0] if args else "serve"
+
+    if command == "serve":
+        try:
+            serve(port, sessions_dir, idle_timeout)
+        except DaemonError as e:
+            print(e)
+            sys.exit(1)
+    elif command in ("status", "stop"):
+        daemon = connect()
+        if daemon is None:
+            print("No generation daemon is running.")
+            sys.exit(1)
+        if command == "status":
+            info = daemon.ping()
+            print("Generation daemon pid {}, up {:.0f} s, {} requests".format(
+                info["pid"], info["uptime"], info["requests"]))
+            stats = daemon.format_stats()
+            if stats:
+                print(stats)
+        else:
+            daemon.stop()
+            print("Generation daemon stopped.")
+        daemon.close()
+    else:
+        print("usage: python generation_daemon.py [serve|status|stop] [--port N] [--sessions DIR] "
+              "[--idle-timeout SECONDS]")
+        sys.exit(1)
@@ -1,110 +1,108 @@
 import rhinoscriptsyntax as rs
-import math
+import scriptcontext as sc
+import disk_cache
+import geodesic_lod
+import geodesic_mesh
 
-def create_geodesic_dome(radius, frequency):
+# sc.sticky outlives a single script run, so the levels survive between runs
+LOD_STICKY_KEY = "geodesic_dome.lod"
+
+def get_lod():
+    """
+    The GeodesicLOD shared by runs of this script in the current Rhino session.
+    """
+    lod = sc.sticky.get(LOD_STICKY_KEY)
+    if lod is None:
+        lod = sc.sticky[LOD_STICKY_KEY] = geodesic_lod.GeodesicLOD()
+    return lod
+
+def create_geodesic_dome(radius, frequency, chunked=False, rows_per_patch=None, cache=None,
+                         fraction=None, cut=None, subdivision="class1", lod=None):
     """
     Creates a geodesic sphere (dome) based on an icosahedron with the given radius and frequency.
+    A fraction (0.5 for a hemisphere, 0.375 or 0.625 for the 3/8 and 5/8
+    domes) or a cut plane (origin, normal) truncates the sphere while it is
+    generated, see geodesic_mesh.geodesic_dome; subdivision="class2" uses
+    Class II subdivision (even frequencies).
+    With chunked=True the mesh is added one patch at a time (see
+    geodesic_mesh.iter_geodesic_patches) and the patches are joined at the end,
+    which keeps peak memory bounded at very high frequencies.
+    If a disk_cache.DiskCache is given, the mesh arrays are reused from it for
+    parameters that were generated before. A geodesic_lod.GeodesicLOD serves
+    full spheres from the levels it holds instead.
     """
-    
-    # Golden ratio
-    t = (1.0 + math.sqrt(5.0)) / 2.0
-    
-    # Base icosahedron vertices (unscaled)
-    # These define the 12 vertices of an icosahedron
-    base_verts = [
-        [-1,  t,  0], [ 1,  t,  0], [-1, -t,  0], [ 1, -t,  0],
-        [ 0, -1,  t], [ 0,  1,  t], [ 0, -1, -t], [ 0,  1, -t],
-        [ t,  0, -1], [ t,  0,  1], [-t,  0, -1], [-t,  0,  1]
-    ]
-    
-    # Normalize vertices to unit sphere
-    base_verts = [rs.VectorUnitize(v) for v in base_verts]
-    
-    # Icosahedron faces (indices of vertices)
-    # 20 faces
-    faces = [
-        [0, 11, 5], [0, 5, 1], [0, 1, 7], [0, 7, 10], [0, 10, 11],
-        [1, 5, 9], [5, 11, 4], [11, 10, 2], [10, 7, 6], [7, 1, 8],
-        [3, 9, 4], [3, 4, 2], [3, 2, 6], [3, 6, 8], [3, 8, 9],
-        [4, 9, 5], [2, 4, 11], [6, 2, 10], [8, 6, 7], [9, 8, 1]
-    ]
-    
-    # We will collect all unique vertices and faces for the new mesh
-    mesh_vertices = []
-    mesh_face_indices = []
-    
-    # Helper to get index of a vertex, adding it if it doesn't exist
-    # Using a dictionary for faster lookup of existing vertices to merge duplicates
-    # Key: (x,y,z) rounded to avoid float precision issues, Value: index
-    vert_map = {} 
-    
-    def get_vert_index(v):
-        # Normalize to project onto sphere
-        v_unit = rs.VectorUnitize(v)
-        # Scale by radius
-        v_scaled = rs.VectorScale(v_unit, radius)
-        
-        # Create a key for the map (rounding for tolerance)
-        key = (round(v_scaled[0], 4), round(v_scaled[1], 4), round(v_scaled[2], 4))
-        
-        if key in vert_map:
-            return vert_map[key]
-        else:
-            idx = len(mesh_vertices)
-            mesh_vertices.append(v_scaled)
-            vert_map[key] = idx
-            return idx
+    truncated = fraction is not None or cut is not None or subdivision != "class1"
+    if chunked:
+        if truncated:
+            raise ValueError("Chunked generation only builds full Class I spheres")
+        return _create_geodesic_dome_chunked(radius, frequency, rows_per_patch)
 
-    # Subdivide each face of the icosahedron
-    for face in faces:
-        v1 = base_verts[face[0]]
-        v2 = base_verts[face[1]]
-        v3 = base_verts[face[2]]
-        
-        # We iterate through the grid of the triangle
-        # We need to store the indices of the points in this face grid to form triangles
-        grid_indices = {}
-        
-        for row in range(frequency + 1):
-            for col in range(frequency - row + 1):
-                # Calculate point on the flat triangle face
-                # Using vector addition: P = v1 + (col/f) * (v2-v1) + (row/f) * (v3-v1)
-                
-                vec_col = rs.VectorScale(rs.VectorSubtract(v2, v1), float(col)/frequency)
-                vec_row = rs.VectorScale(rs.VectorSubtract(v3, v1), float(row)/frequency)
-                
-                pt = rs.VectorAdd(v1, rs.VectorAdd(vec_col, vec_row))
-                
-                # Get the index (this projects it to the sphere and merges duplicates)
-                idx = get_vert_index(pt)
-                grid_indices[(row, col)] = idx
-        
-        # Create faces for this subdivision
-        for row in range(frequency):
-            for col in range(frequency - row):
-                # Triangle pointing up (relative to v1)
-                # Vertices: (row, col), (row, col+1), (row+1, col)
-                i1 = grid_indices[(row, col)]
-                i2 = grid_indices[(row, col+1)]
-                i3 = grid_indices[(row+1, col)]
-                mesh_face_indices.append([i1, i2, i3])
-                
-                # Triangle pointing down (if not in the last sub-row)
-                # Vertices: (row, col+1), (row+1, col+1), (row+1, col)
-                if col < frequency - row - 1:
-                    i1 = grid_indices[(row, col+1)]
-                    i2 = grid_indices[(row+1, col+1)]
-                    i3 = grid_indices[(row+1, col)]
-                    mesh_face_indices.append([i1, i2, i3])
+    # The whole vertex and face arrays are computed in one batch outside Rhino,
+    # so Rhino is only called once to build the mesh.
+    if truncated:
+        if fraction is None:
+            fraction = 1.0
+        if cache is not None:
+            mesh_vertices, mesh_face_indices = geodesic_mesh.cached_geodesic_dome(
+                radius, frequency, cache, fraction, cut, subdivision)
+        else:
+            mesh_vertices, mesh_face_indices = geodesic_mesh.to_lists(
+                *geodesic_mesh.geodesic_dome(radius, frequency, fraction, cut, subdivision))
+    elif lod is not None:
+        mesh_vertices, mesh_face_indices = geodesic_mesh.to_lists(*lod.mesh(radius, frequency))
+    elif cache is not None:
+        mesh_vertices, mesh_face_indices = geodesic_mesh.cached_geodesic_sphere(radius, frequency, cache)
+    else:
+        mesh_vertices, mesh_face_indices = geodesic_mesh.to_lists(
+            *geodesic_mesh.geodesic_sphere(radius, frequency))
 
     # Create the mesh in Rhino
     mesh_id = rs.AddMesh(mesh_vertices, mesh_face_indices)
     return mesh_id
 
+def create_geodesic_dome_lods(radius, frequency, levels=3, lod=None):
+    """
+    Adds the sphere at up to `levels` frequencies, coarse to fine (see
+    geodesic_lod.lod_frequencies), redrawing after each so the viewport shows
+    a coarse mesh while the finer one is refined from it. Each mesh replaces
+    the previous one; returns the id of the finest.
+    """
+    if lod is None:
+        lod = get_lod()
+    mesh_id = None
+    for f, vertices, faces in lod.lods(radius, frequency, levels):
+        new_id = rs.AddMesh(*geodesic_mesh.to_lists(vertices, faces))
+        if mesh_id:
+            rs.DeleteObject(mesh_id)
+        mesh_id = new_id
+        rs.Redraw()
+    return mesh_id
+
+def _create_geodesic_dome_chunked(radius, frequency, rows_per_patch):
+    patch_ids = []
+    for patch in geodesic_mesh.iter_geodesic_patches(radius, frequency, rows_per_patch):
+        patch_id = rs.AddMesh(geodesic_mesh.patch_points(patch), geodesic_mesh.patch_triangles(patch))
+        if patch_id:
+            patch_ids.append(patch_id)
+    if not patch_ids:
+        return None
+    if len(patch_ids) == 1:
+        return patch_ids[0]
+    
+    mesh_id = rs.JoinMeshes(patch_ids, True)
+    if mesh_id:
+        # Patches repeat their border vertices; weld them back together
+        mesh = rs.coercemesh(mesh_id)
+        mesh.Vertices.CombineIdentical(True, True)
+        sc.doc.Objects.Replace(mesh_id, mesh)
+    return mesh_id
+
 if __name__ == "__main__":
     # Default values
     radius = 10.0
     frequency = 2
+    fraction = 1.0
+    subdivision = "class1"
     
     # Prompt user for input if running in Rhino
     # These functions return None if the user cancels
@@ -116,10 +114,31 @@ if __name__ == "__main__":
     if f_input is not None:
         frequency = f_input
         
-    rs.EnableRedraw(False)
-    mesh = create_geodesic_dome(radius, frequency)
-    rs.EnableRedraw(True)
+    h_input = rs.GetReal("Fraction of the sphere height to keep (1 = full sphere, 0.5 = hemisphere)", fraction, 0.0, 1.0)
+    if h_input is not None:
+        fraction = h_input
+        
+    s_input = rs.GetString("Subdivision", subdivision, ["class1", "class2"])
+    if s_input:
+        subdivision = s_input
+        
+    if fraction >= 1.0 and subdivision == "class1":
+        # Full spheres come from the level hierarchy, coarse levels first
+        lod = get_lod()
+        mesh = create_geodesic_dome_lods(radius, frequency, lod=lod)
+        stats = lod.format_stats()
+    else:
+        cache = disk_cache.DiskCache("geometry")
+        rs.EnableRedraw(False)
+        if subdivision == "class2" and frequency % 2:
+            frequency += 1
+            print("Class II needs an even frequency, using {}".format(frequency))
+        mesh = create_geodesic_dome(radius, frequency, cache=cache,
+                                    fraction=fraction if fraction < 1.0 else None, subdivision=subdivision)
+        rs.EnableRedraw(True)
+        stats = cache.format_stats()
     
     if mesh:
         print("Geodesic dome created with Radius {} and Frequency {}".format(radius, frequency))
+        print(stats)
         rs.SelectObject(mesh)
@@ -0,0 +1,301 @@
+"""
+Multi-resolution (LOD) geodesic spheres.
+
+GeodesicLOD keeps every level it has computed, keyed by frequency. A level
+whose half frequency (or a quarter, ...) is already held is derived from it
+by midpoint refinement: every triangle is split into four, which doubles the
+frequency in time proportional to the finer mesh instead of rebuilding it
+from the 12 icosahedron vertices. Levels are kept unprojected (on the
+icosahedron's faces, see geodesic_mesh.flat_geodesic_sphere), so midpoints
+are exactly the grid points of the finer level and one hierarchy serves any
+radius. The least recently used levels are dropped once they take more than
+max_bytes.
+
+    lod = geodesic_lod.GeodesicLOD()
+    vertices, faces = lod.mesh(10.0, 32)
+    for frequency, vertices, faces in lod.lods(10.0, 64, count=3):
+        ...  # 16, then 32, then 64
+
+A refined level has the same vertices as geodesic_sphere at that frequency
+but numbers them (and orders the faces) differently.
+"""
+from collections import OrderedDict, namedtuple
+
+import geodesic_mesh
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Approximate size of one vertex or face held as a list of three Python numbers
+PYTHON_ROW_BYTES = 150
+
+# vertices: unprojected points; faces: triangles; edges: vertex pairs;
+# face_edges: for each face (a, b, c) its edges ab, bc, ca
+Level = namedtuple("Level", "frequency vertices faces edges face_edges")
+
+
+def _index_dtype(count):
+    # The edge tables are only used internally; int32 halves their memory
+    return np.int32 if count < 2 ** 31 else np.int64
+
+
+def _edge_tables_numpy(faces):
+    pairs = faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)
+    low, high = pairs.min(axis=1), pairs.max(axis=1)
+    keys = low * (int(faces.max()) + 1) + high
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    dtype = _index_dtype(len(pairs))
+    edges = np.stack([low[first], high[first]], axis=1).astype(dtype)
+    return edges, inverse.reshape(-1, 3).astype(dtype)
+
+
+def _edge_tables_python(faces):
+    index = {}
+    edges = []
+    face_edges = []
+    for a, b, c in faces:
+        row = []
+        for p, q in ((a, b), (b, c), (c, a)):
+            key = (p, q) if p < q else (q, p)
+            e = index.get(key)
+            if e is None:
+                e = index[key] = len(edges)
+                edges.append(key)
+            row.append(e)
+        face_edges.append(row)
+    return edges, face_edges
+
+
+def _refine_numpy(level):
+    vertices, faces, edges, face_edges = level[1:]
+    v, e, n = len(vertices), len(edges), len(faces)
+    p, q = edges[:, 0], edges[:, 1]
+    new_vertices = np.empty((v + e, 3))
+    new_vertices[:v] = vertices
+    np.add(vertices[p], vertices[q], out=new_vertices[v:])
+    new_vertices[v:] *= 0.5
+
+    a, b, c = faces[:, 0], faces[:, 1], faces[:, 2]
+    eab, ebc, eca = face_edges[:, 0], face_edges[:, 1], face_edges[:, 2]
+    mab, mbc, mca = v + eab, v + ebc, v + eca
+
+    def child(edge, vertex):
+        # Edge (p, q) is split into 2 * edge = (p, m) and 2 * edge + 1 = (m, q)
+        return 2 * edge + (p[edge] != vertex)
+
+    # Interior edges of each face: (mab, mbc), (mbc, mca), (mca, mab)
+    i0 = 2 * e + 3 * np.arange(n)
+    i1, i2 = i0 + 1, i0 + 2
+
+    # The four children of each face stay together, corners first
+    new_faces = np.empty((n, 4, 3), dtype=faces.dtype)
+    dtype = _index_dtype(2 * e + 3 * n)
+    new_face_edges = np.empty((n, 4, 3), dtype=dtype)
+    for i, (tri, tri_edges) in enumerate((
+            ((a, mab, mca), (child(eab, a), i2, child(eca, a))),
+            ((mab, b, mbc), (child(eab, b), child(ebc, b), i0)),
+            ((mca, mbc, c), (i1, child(ebc, c), child(eca, c))),
+            ((mab, mbc, mca), (i0, i1, i2)))):
+        for j in range(3):
+            new_faces[:, i, j] = tri[j]
+            new_face_edges[:, i, j] = tri_edges[j]
+
+    new_edges = np.empty((2 * e + 3 * n, 2), dtype=dtype)
+    halves = new_edges[:2 * e].reshape(e, 2, 2)
+    halves[:, 0, 0] = p
+    halves[:, 0, 1] = halves[:, 1, 0] = v + np.arange(e)
+    halves[:, 1, 1] = q
+    interior = new_edges[2 * e:].reshape(n, 3, 2)
+    for i, (start, end) in enumerate(((mab, mbc), (mbc, mca), (mca, mab))):
+        interior[:, i, 0] = start
+        interior[:, i, 1] = end
+    return Level(2 * level.frequency, new_vertices, new_faces.reshape(-1, 3),
+                 new_edges, new_face_edges.reshape(-1, 3))
+
+
+def _refine_python(level):
+    vertices, faces, edges, face_edges = level[1:]
+    v, e = len(vertices), len(edges)
+    new_vertices = list(vertices)
+    new_edges = []
+    for p, q in edges:
+        vp, vq = vertices[p], vertices[q]
+        m = len(new_vertices)
+        new_vertices.append([(vp[0] + vq[0]) * 0.5, (vp[1] + vq[1]) * 0.5, (vp[2] + vq[2]) * 0.5])
+        new_edges.append((p, m))
+        new_edges.append((m, q))
+
+    def child(edge, vertex):
+        return 2 * edge + (edges[edge][0] != vertex)
+
+    new_faces = []
+    new_face_edges = []
+    for fi, ((a, b, c), (eab, ebc, eca)) in enumerate(zip(faces, face_edges)):
+        mab, mbc, mca = v + eab, v + ebc, v + eca
+        i0 = 2 * e + 3 * fi
+        i1, i2 = i0 + 1, i0 + 2
+        new_faces.extend(([a, mab, mca], [mab, b, mbc], [mca, mbc, c], [mab, mbc, mca]))
+        new_face_edges.extend(([child(eab, a), i2, child(eca, a)],
+                               [child(eab, b), child(ebc, b), i0],
+                               [i1, child(ebc, c), child(eca, c)],
+                               [i0, i1, i2]))
+    for mab, mbc, mca in new_faces[3::4]:
+        new_edges.extend(((mab, mbc), (mbc, mca), (mca, mab)))
+    return Level(2 * level.frequency, new_vertices, new_faces, new_edges, new_face_edges)
+
+
+def project(vertices, radius):
+    """
+    Level vertices pushed out onto the sphere of `radius` (a new array or list).
+    """
+    radius = float(radius)
+    if np is not None and hasattr(vertices, "shape"):
+        return vertices * (radius / np.sqrt((vertices * vertices).sum(axis=1)))[:, None]
+    result = []
+    for x, y, z in vertices:
+        s = radius / (x * x + y * y + z * z) ** 0.5
+        result.append([x * s, y * s, z * s])
+    return result
+
+
+def level_bytes(level):
+    if hasattr(level.vertices, "nbytes"):
+        return sum(a.nbytes for a in level[1:])
+    return PYTHON_ROW_BYTES * sum(len(a) for a in level[1:])
+
+
+def lod_frequencies(frequency, count):
+    """
+    Up to `count` frequencies ending at `frequency`, each half the next
+    (fewer when the frequency runs out of factors of two), coarsest first.
+    """
+    frequencies = [int(frequency)]
+    while len(frequencies) < count and frequencies[0] % 2 == 0:
+        frequencies.insert(0, frequencies[0] // 2)
+    return frequencies
+
+
+class GeodesicLOD(object):
+    """
+    Geodesic sphere levels by frequency, refined from coarser levels where
+    possible and evicted least recently used first.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, use_numpy=None):
+        if use_numpy is None:
+            use_numpy = np is not None
+        if use_numpy and np is None:
+            raise ImportError("NumPy is not available")
+        self.max_bytes = max_bytes
+        self.use_numpy = use_numpy
+        self.levels = OrderedDict()
+        self.hits = 0
+        self.builds = 0
+        self.refinements = 0
+        self.evictions = 0
+
+    def _ancestor(self, frequency):
+        # Nearest held level the frequency is a power-of-two multiple of
+        f = frequency
+        while f % 2 == 0:
+            f //= 2
+            if f in self.levels:
+                return self.levels[f]
+        return None
+
+    def _build(self, frequency):
+        vertices, faces = geodesic_mesh.flat_geodesic_sphere(frequency, self.use_numpy)
+        if self.use_numpy:
+            edges, face_edges = _edge_tables_numpy(faces)
+        else:
+            edges, face_edges = _edge_tables_python(faces)
+        self.builds += 1
+        return Level(frequency, vertices, faces, edges, face_edges)
+
+    def _store(self, level):
+        self.levels[level.frequency] = level
+
+    def level(self, frequency):
+        """
+        The Level for `frequency`, computing it (and any levels between it
+        and the nearest coarser one held) if needed.
+        """
+        if frequency < 1:
+            raise ValueError("frequency must be at least 1")
+        f = int(frequency)
+        level = self.levels.pop(f, None)
+        if level is not None:
+            self.hits += 1
+            self._store(level)
+            return level
+
+        level = self._ancestor(f)
+        if level is None:
+            level = self._build(f)
+            self._store(level)
+        refine = _refine_numpy if self.use_numpy else _refine_python
+        while level.frequency < f:
+            level = refine(level)
+            self.refinements += 1
+            self._store(level)
+        self.evict(keep=f)
+        return level
+
+    def mesh(self, radius, frequency):
+        """
+        (vertices, faces) of the sphere at `frequency`, as geodesic_sphere
+        returns them (NumPy arrays or lists).
+        """
+        level = self.level(frequency)
+        return project(level.vertices, radius), level.faces
+
+    def lods(self, radius, frequency, count=3):
+        """
+        Yields (frequency, vertices, faces) for up to `count` levels from
+        coarse to fine (see lod_frequencies), each computed only when the
+        previous one has been used, so a caller can show the coarse mesh
+        while the finer ones are made.
+        """
+        for f in lod_frequencies(frequency, count):
+            vertices, faces = self.mesh(radius, f)
+            yield f, vertices, faces
+
+    def nbytes(self):
+        return sum(level_bytes(level) for level in self.levels.values())
+
+    def evict(self, keep=None):
+        """
+        Drops least recently used levels (other than `keep`) until the rest
+        fit max_bytes.
+        """
+        total = self.nbytes()
+        for f in list(self.levels):
+            if total <= self.max_bytes:
+                break
+            if f == keep:
+                continue
+            total -= level_bytes(self.levels.pop(f))
+            self.evictions += 1
+
+    def clear(self):
+        self.levels.clear()
+
+    def stats(self):
+        return {
+            "levels": sorted(self.levels),
+            "bytes": self.nbytes(),
+            "hits": self.hits,
+            "builds": self.builds,
+            "refinements": self.refinements,
+            "evictions": self.evictions,
+        }
+
+    def format_stats(self):
+        s = self.stats()
+        return "LOD: levels {} ({:.1f} MB), {} hits, {} built, {} refined, {} evicted".format(
+            s["levels"], s["bytes"] / (1024.0 * 1024.0), s["hits"], s["builds"],
+            s["refinements"], s["evictions"])
@@ -0,0 +1,948 @@
+"""
+Rhino-free geodesic sphere kernel.
+
+Builds the vertex and face arrays of a subdivided icosahedron in one batch so
+that Rhino only has to receive the finished mesh. NumPy is used when it is
+available; otherwise a pure-Python path is used (e.g. under IronPython).
+"""
+import math
+from array import array
+from collections import namedtuple
+
+import disk_cache
+import mesh_export
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Bump when the generated geometry changes so stale cache entries are ignored
+KERNEL_VERSION = 2
+
+# Golden ratio
+T = (1.0 + math.sqrt(5.0)) / 2.0
+
+# Base icosahedron vertices (unscaled)
+ICOSAHEDRON_VERTS = [
+    [-1,  T,  0], [ 1,  T,  0], [-1, -T,  0], [ 1, -T,  0],
+    [ 0, -1,  T], [ 0,  1,  T], [ 0, -1, -T], [ 0,  1, -T],
+    [ T,  0, -1], [ T,  0,  1], [-T,  0, -1], [-T,  0,  1]
+]
+
+# Icosahedron faces (indices of vertices), 20 faces
+ICOSAHEDRON_FACES = [
+    [0, 11, 5], [0, 5, 1], [0, 1, 7], [0, 7, 10], [0, 10, 11],
+    [1, 5, 9], [5, 11, 4], [11, 10, 2], [10, 7, 6], [7, 1, 8],
+    [3, 9, 4], [3, 4, 2], [3, 2, 6], [3, 6, 8], [3, 8, 9],
+    [4, 9, 5], [2, 4, 11], [6, 2, 10], [8, 6, 7], [9, 8, 1]
+]
+
+
+def icosahedron():
+    """
+    Returns the 12 unit-length icosahedron vertices and its 20 faces.
+    """
+    verts = []
+    for v in ICOSAHEDRON_VERTS:
+        length = math.sqrt(v[0] * v[0] + v[1] * v[1] + v[2] * v[2])
+        verts.append([v[0] / length, v[1] / length, v[2] / length])
+    return verts, [list(f) for f in ICOSAHEDRON_FACES]
+
+
+def grid_index(row, col, frequency):
+    """
+    Local index of grid point (row, col) inside one subdivided face.
+    Rows are stored one after another, row r holding frequency - r + 1 points.
+    """
+    return row * (frequency + 1) - row * (row - 1) // 2 + col
+
+
+def face_grid(frequency):
+    """
+    Returns the barycentric grid shared by every face: a list of (row, col)
+    pairs in local index order and the local triangles connecting them.
+    """
+    points = []
+    for row in range(frequency + 1):
+        for col in range(frequency - row + 1):
+            points.append((row, col))
+
+    triangles = []
+    for row in range(frequency):
+        for col in range(frequency - row):
+            # Triangle pointing up (relative to the first corner)
+            triangles.append([grid_index(row, col, frequency),
+                              grid_index(row, col + 1, frequency),
+                              grid_index(row + 1, col, frequency)])
+            # Triangle pointing down (if not in the last sub-row)
+            if col < frequency - row - 1:
+                triangles.append([grid_index(row, col + 1, frequency),
+                                  grid_index(row + 1, col + 1, frequency),
+                                  grid_index(row + 1, col, frequency)])
+    return points, triangles
+
+
+def _build_edge_tables(faces):
+    """
+    Lists the 30 icosahedron edges as (low, high) vertex pairs and, for each
+    face, the edge id of its three sides (corner slots 0-1, 0-2, 1-2) together
+    with whether the side runs from the high to the low vertex.
+    """
+    edges = []
+    face_edges = []
+    for face in faces:
+        sides = []
+        for slot_a, slot_b in ((0, 1), (0, 2), (1, 2)):
+            a, b = face[slot_a], face[slot_b]
+            pair = [min(a, b), max(a, b)]
+            if pair not in edges:
+                edges.append(pair)
+            sides.append((edges.index(pair), a > b))
+        face_edges.append(sides)
+    return edges, face_edges
+
+
+# Precomputed once so index lookups below are pure arithmetic
+ICOSAHEDRON_EDGES, FACE_EDGES = _build_edge_tables(ICOSAHEDRON_FACES)
+
+# A polyhedron whose faces are subdivided: unit vertices, faces and the edge
+# tables of _build_edge_tables
+BasePolyhedron = namedtuple("BasePolyhedron", "vertices faces edges face_edges")
+
+ICOSAHEDRON_BASE = BasePolyhedron(icosahedron()[0], ICOSAHEDRON_FACES, ICOSAHEDRON_EDGES, FACE_EDGES)
+
+
+def vertex_count(frequency):
+    """
+    Number of distinct vertices of a geodesic sphere: 10 * f^2 + 2.
+    """
+    return 10 * frequency * frequency + 2
+
+
+def face_vertex_start(frequency):
+    """
+    Global index of the first face-interior vertex (after corners and edges).
+    """
+    return len(ICOSAHEDRON_VERTS) + len(ICOSAHEDRON_EDGES) * (frequency - 1)
+
+
+def interior_count(frequency):
+    """
+    Number of vertices strictly inside one subdivided face.
+    """
+    return (frequency - 1) * (frequency - 2) // 2
+
+
+def interior_index(row, col, frequency):
+    """
+    Index of interior grid point (row, col) among the interior points of its
+    face (row >= 1, col >= 1, row + col <= frequency - 1).
+    """
+    return (row - 1) * (frequency - 1) - (row - 1) * row // 2 + col - 1
+
+
+def vertex_index(face, row, col, frequency):
+    """
+    Global vertex index of grid point (row, col) of icosahedron face `face`.
+
+    Vertices are laid out as the 12 icosahedron corners, then the
+    frequency - 1 interior points of each of the 30 edges (ordered from the
+    lower to the higher corner index), then the interior points of each of the
+    20 faces. Every point therefore has one closed-form index, whichever face
+    it is reached from.
+    """
+    return base_vertex_index(ICOSAHEDRON_BASE, face, row, col, frequency)
+
+
+def base_vertex_index(base, face, row, col, frequency):
+    """
+    vertex_index for the faces of any BasePolyhedron: its corners, then its
+    edge points, then its face-interior points.
+    """
+    f = frequency
+    corners = base.faces[face]
+    if row == 0 and col == 0:
+        return corners[0]
+    if row == 0 and col == f:
+        return corners[1]
+    if row == f:
+        return corners[2]
+    if row == 0:
+        side, pos = 0, col
+    elif col == 0:
+        side, pos = 1, row
+    elif row + col == f:
+        side, pos = 2, row
+    else:
+        return (len(base.vertices) + len(base.edges) * (f - 1) +
+                face * interior_count(f) + interior_index(row, col, f))
+    edge, reverse = base.face_edges[face][side]
+    if reverse:
+        pos = f - pos
+    return len(base.vertices) + edge * (f - 1) + pos - 1
+
+
+def face_vertex_indices(face, frequency):
+    """
+    Global vertex index of every grid point of one face, in local order.
+    Depends only on the face and frequency, so faces can be indexed (and
+    their triangles emitted) independently of each other.
+    """
+    return [vertex_index(face, row, col, frequency)
+            for row in range(frequency + 1)
+            for col in range(frequency - row + 1)]
+
+
+def face_triangles(face, frequency, triangles=None):
+    """
+    Triangles of one subdivided face as global vertex indices.
+    """
+    if triangles is None:
+        triangles = face_grid(frequency)[1]
+    g = face_vertex_indices(face, frequency)
+    return [[g[i], g[j], g[k]] for i, j, k in triangles]
+
+
+def _interior_points(frequency):
+    return [(row, col)
+            for row in range(1, frequency - 1)
+            for col in range(1, frequency - row)]
+
+
+def _face_grid_numpy(frequency):
+    """
+    face_grid as NumPy arrays: (n, 2) grid points and (t, 3) triangles, in
+    the same order.
+    """
+    f = frequency
+    steps = np.arange(f + 1)
+    rows = np.repeat(steps, f + 1 - steps)
+    cols = np.arange(len(rows)) - grid_index(rows, 0, f)
+    up = rows + cols < f
+    down = rows + cols < f - 1
+    r, c = rows[up], cols[up]
+    up_tris = np.stack([grid_index(r, c, f), grid_index(r, c + 1, f), grid_index(r + 1, c, f)], axis=1)
+    r, c = rows[down], cols[down]
+    down_tris = np.stack([grid_index(r, c + 1, f), grid_index(r + 1, c + 1, f), grid_index(r + 1, c, f)], axis=1)
+    # Interleave as face_grid does: up and down triangles alternate along each row
+    order = np.argsort(np.concatenate([2 * (rows[up] * f + cols[up]), 2 * (rows[down] * f + cols[down]) + 1]),
+                       kind="stable")
+    return np.stack([rows, cols], axis=1), np.concatenate([up_tris, down_tris])[order]
+
+
+def _face_index_table_numpy(frequency, base=ICOSAHEDRON_BASE):
+    """
+    Vectorized face_vertex_indices for all faces of `base`: a (faces, n) array.
+    """
+    f = frequency
+    face_start = len(base.vertices) + len(base.edges) * (f - 1)
+    rc = _face_grid_numpy(f)[0]
+    rows, cols = rc[:, 0], rc[:, 1]
+    interior = (rows >= 1) & (cols >= 1) & (rows + cols <= f - 1)
+    interior_local = interior_index(rows[interior], cols[interior], f)
+    sides = [
+        ((rows == 0) & (cols > 0) & (cols < f), cols),
+        ((cols == 0) & (rows > 0) & (rows < f), rows),
+        ((rows + cols == f) & (rows > 0) & (rows < f), rows),
+    ]
+    corner_locals = [0, f, grid_index(f, 0, f)]
+
+    table = np.empty((len(base.faces), len(rc)), dtype=np.int64)
+    for fi, face in enumerate(base.faces):
+        row = table[fi]
+        row[interior] = face_start + fi * interior_count(f) + interior_local
+        for (mask, pos), (edge, reverse) in zip(sides, base.face_edges[fi]):
+            pos = pos[mask]
+            if reverse:
+                pos = f - pos
+            row[mask] = len(base.vertices) + edge * (f - 1) + pos - 1
+        row[corner_locals] = face
+    return table
+
+
+def _flat_sphere_numpy(frequency):
+    f = frequency
+    base_verts, faces = icosahedron()
+    base = np.array(base_verts)
+    edges = np.array(ICOSAHEDRON_EDGES)
+
+    # Edge-interior points, all 30 edges at once
+    t = (np.arange(1, f) / float(f))[None, :, None]
+    edge_pts = (1.0 - t) * base[edges[:, 0]][:, None, :] + t * base[edges[:, 1]][:, None, :]
+
+    # Face-interior points from one barycentric grid shared by all 20 faces
+    rc = np.array(_interior_points(f), dtype=float).reshape(-1, 2) / f
+    weights = np.empty((len(rc), 3))
+    weights[:, 0] = 1.0 - rc[:, 0] - rc[:, 1]
+    weights[:, 1] = rc[:, 1]
+    weights[:, 2] = rc[:, 0]
+    corners = base[np.array(faces)]  # (20, 3, 3)
+    face_pts = np.einsum('nk,fkd->fnd', weights, corners)
+
+    pts = np.concatenate([base, edge_pts.reshape(-1, 3), face_pts.reshape(-1, 3)])
+
+    local = _face_grid_numpy(f)[1]
+    face_indices = _face_index_table_numpy(f)[:, local].reshape(-1, 3)
+    return pts, face_indices
+
+
+def _geodesic_sphere_numpy(radius, frequency):
+    pts, face_indices = _flat_sphere_numpy(frequency)
+    # One normalize-and-scale pass over all vertices
+    pts *= (radius / np.sqrt((pts * pts).sum(axis=1)))[:, None]
+    return pts, face_indices
+
+
+def _iter_vertices(radius, frequency):
+    """
+    Yields every sphere vertex as an (x, y, z) tuple in global index order.
+    With radius=None the points are left on the icosahedron's faces.
+    """
+    f = frequency
+    inv_f = 1.0 / f
+    base_verts, faces = icosahedron()
+
+    def project(x, y, z):
+        if radius is None:
+            return (x, y, z)
+        s = radius / math.sqrt(x * x + y * y + z * z)
+        return (x * s, y * s, z * s)
+
+    for v in base_verts:
+        yield project(*v)
+
+    for a, b in ICOSAHEDRON_EDGES:
+        va, vb = base_verts[a], base_verts[b]
+        for k in range(1, f):
+            wb = k * inv_f
+            wa = 1.0 - wb
+            yield project(wa * va[0] + wb * vb[0],
+                          wa * va[1] + wb * vb[1],
+                          wa * va[2] + wb * vb[2])
+
+    interior = _interior_points(f)
+    for face in faces:
+        v1, v2, v3 = base_verts[face[0]], base_verts[face[1]], base_verts[face[2]]
+        for row, col in interior:
+            wb = col * inv_f
+            wc = row * inv_f
+            wa = 1.0 - wb - wc
+            yield project(wa * v1[0] + wb * v2[0] + wc * v3[0],
+                          wa * v1[1] + wb * v2[1] + wc * v3[1],
+                          wa * v1[2] + wb * v2[2] + wc * v3[2])
+
+
+def _geodesic_sphere_python(radius, frequency):
+    # radius=None gives the flat (unprojected) vertices
+    vertices = [list(v) for v in _iter_vertices(radius, frequency)]
+
+    triangles = face_grid(frequency)[1]
+    face_indices = []
+    for fi in range(len(ICOSAHEDRON_FACES)):
+        face_indices.extend(face_triangles(fi, frequency, triangles))
+    return vertices, face_indices
+
+
+def geodesic_sphere(radius, frequency, use_numpy=None):
+    """
+    Computes the vertices and triangle faces of a geodesic sphere.
+
+    Returns NumPy arrays when NumPy is used (the default when it is installed)
+    and nested lists otherwise. Pass use_numpy=False to force the pure-Python
+    path.
+    """
+    if frequency < 1:
+        raise ValueError("frequency must be at least 1")
+    if use_numpy is None:
+        use_numpy = np is not None
+    if use_numpy:
+        if np is None:
+            raise ImportError("NumPy is not available")
+        return _geodesic_sphere_numpy(float(radius), int(frequency))
+    return _geodesic_sphere_python(float(radius), int(frequency))
+
+
+def flat_geodesic_sphere(frequency, use_numpy=None):
+    """
+    geodesic_sphere before projection: the same vertices (in the same order)
+    still on the faces of the icosahedron inscribed in the unit sphere.
+    The midpoint of two of these points on one face is again a grid point,
+    which is what geodesic_lod refines with.
+    """
+    if frequency < 1:
+        raise ValueError("frequency must be at least 1")
+    if use_numpy is None:
+        use_numpy = np is not None
+    if use_numpy:
+        if np is None:
+            raise ImportError("NumPy is not available")
+        return _flat_sphere_numpy(int(frequency))
+    return _geodesic_sphere_python(None, int(frequency))
+
+
+def to_lists(vertices, faces):
+    """
+    Converts kernel output to the plain lists expected by rs.AddMesh.
+    """
+    if hasattr(vertices, "tolist"):
+        vertices = vertices.tolist()
+    if hasattr(faces, "tolist"):
+        faces = faces.tolist()
+    return vertices, faces
+
+
+def cached_geodesic_sphere(radius, frequency, cache):
+    """
+    geodesic_sphere as plain lists, served from `cache` (a disk_cache.DiskCache)
+    when the same radius and frequency were generated before.
+    """
+    key = disk_cache.cache_key("geodesic_sphere", KERNEL_VERSION, radius, frequency)
+    data = cache.get(key)
+    if data is not None:
+        return mesh_export.unpack_mesh(data)
+    vertices, faces = to_lists(*geodesic_sphere(radius, frequency))
+    cache.put(key, mesh_export.pack_mesh(vertices, faces))
+    return vertices, faces
+
+
+SUBDIVISIONS = ("class1", "class2")
+
+
+def _vertex_up(vertices):
+    # Rotate about x so that vertex 5 (0, 1, T) points along +z, the usual
+    # dome orientation with a five-fold vertex at the top
+    angle = math.atan2(1.0, T)
+    c, s = math.cos(angle), math.sin(angle)
+    return [[x, c * y - s * z, s * y + c * z] for x, y, z in vertices]
+
+
+def _unit(v):
+    length = math.sqrt(v[0] * v[0] + v[1] * v[1] + v[2] * v[2])
+    return [v[0] / length, v[1] / length, v[2] / length]
+
+
+def _dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+def _pentakis(base):
+    """
+    Class II base: adds the face centres of `base` and replaces each of its
+    edges by the two triangles (corner, centre, centre) across it. Class I
+    subdivision of this base at frequency k is Class II at frequency 2k.
+    """
+    vertices = [list(v) for v in base.vertices]
+    for face in base.faces:
+        vertices.append(_unit([sum(base.vertices[i][k] for i in face) for k in range(3)]))
+    edge_faces = {}
+    for fi, sides in enumerate(base.face_edges):
+        for edge, _ in sides:
+            edge_faces.setdefault(edge, []).append(fi)
+    faces = []
+    for edge, (a, b) in enumerate(base.edges):
+        c1, c2 = [len(base.vertices) + fi for fi in edge_faces[edge]]
+        for corner in (a, b):
+            p, q, r = vertices[corner], vertices[c1], vertices[c2]
+            u = [q[k] - p[k] for k in range(3)]
+            w = [r[k] - p[k] for k in range(3)]
+            normal = [u[1] * w[2] - u[2] * w[1], u[2] * w[0] - u[0] * w[2], u[0] * w[1] - u[1] * w[0]]
+            # Keep the winding outward like the icosahedron's
+            faces.append([corner, c1, c2] if _dot(normal, p) > 0 else [corner, c2, c1])
+    edges, face_edges = _build_edge_tables(faces)
+    return BasePolyhedron(vertices, faces, edges, face_edges)
+
+
+def dome_base(subdivision="class1"):
+    """
+    The polyhedron a dome is subdivided from, with a vertex at the top.
+    """
+    if subdivision not in SUBDIVISIONS:
+        raise ValueError("Unknown subdivision: " + str(subdivision))
+    base = ICOSAHEDRON_BASE._replace(vertices=_vertex_up(ICOSAHEDRON_BASE.vertices))
+    if subdivision == "class2":
+        base = _pentakis(base)
+    return base
+
+
+def dome_cut(radius, fraction):
+    """
+    Cut plane (origin, normal) that keeps the top `fraction` of the sphere's
+    height: 0.5 is a hemisphere, 0.375 and 0.625 the 3/8 and 5/8 domes.
+    """
+    return (0.0, 0.0, radius * (1.0 - 2.0 * fraction)), (0.0, 0.0, 1.0)
+
+
+def _cap_side(points, normal, offset):
+    """
+    Where the spherical polygon with these unit corners lies relative to the
+    cut (kept side n.p >= offset): -1 entirely cut away, 1 entirely kept, 0
+    possibly crossing. Judged from the smallest cap around the polygon's
+    centre that holds its corners.
+    """
+    centre = _unit([sum(p[k] for p in points) for k in range(3)])
+    spread = max(math.acos(max(-1.0, min(1.0, _dot(centre, p)))) for p in points)
+    tilt = math.acos(max(-1.0, min(1.0, _dot(centre, normal))))
+    if math.cos(max(0.0, tilt - spread)) < offset - 1e-12:
+        return -1
+    if math.cos(min(math.pi, tilt + spread)) > offset + 1e-12:
+        return 1
+    return 0
+
+
+# Crossing faces are culled in bands of rows, about this many per face
+DOME_BANDS_PER_FACE = 16
+
+
+def _dome_bands(base, k, normal, offset):
+    """
+    (face, first_row, last_row, inside) for the row bands of each face that
+    can reach the kept side of the cut (unit sphere); inside is True when the
+    whole band is kept.
+    """
+    step = max(1, -(-k // DOME_BANDS_PER_FACE))
+    for fi, face in enumerate(base.faces):
+        v1, v2, v3 = [base.vertices[i] for i in face]
+        side = _cap_side([v1, v2, v3], normal, offset)
+        if side != 0:
+            if side > 0:
+                yield fi, 0, k, True
+            continue
+
+        def point(row, col):
+            wb, wc = float(col) / k, float(row) / k
+            wa = 1.0 - wb - wc
+            return _unit([wa * v1[j] + wb * v2[j] + wc * v3[j] for j in range(3)])
+
+        # Consecutive bands on the same side are merged into one
+        band = None
+        for row_start in range(0, k, step):
+            row_end = min(row_start + step, k)
+            corners = [point(row_start, 0), point(row_start, k - row_start),
+                       point(row_end, 0), point(row_end, k - row_end)]
+            side = _cap_side(corners, normal, offset)
+            if side < 0:
+                if band:
+                    yield band
+                band = None
+            elif band and band[3] == (side > 0):
+                band = (fi, band[1], row_end, band[3])
+            else:
+                if band:
+                    yield band
+                band = (fi, row_start, row_end, side > 0)
+        if band:
+            yield band
+
+
+def _row_triangle_start(row, k):
+    # Triangles of face_grid before grid row `row` (row r has 2 * (k - r) - 1)
+    return row * (2 * k - row)
+
+
+def _clip_triangle(tri, dist, positions, cuts, eps):
+    """
+    The part of triangle `tri` (three vertex keys) on the kept side of the
+    cut, as triangles with the same winding. Points where edges cross the cut
+    are keyed by the edge's (low, high) vertex keys and stored in `cuts`, so
+    neighbouring triangles share them and the boundary stays welded.
+    """
+    d = [dist[k] for k in tri]
+    above = [x >= 0 for x in d]
+    count = sum(above)
+    if count == 3:
+        return [tri]
+    if count == 0:
+        return []
+
+    def cut(a, b, da, db):
+        if da <= eps:
+            # The kept vertex is on the cut already
+            return a
+        key = (min(a, b), max(a, b))
+        if key not in cuts:
+            t = da / (da - db)
+            pa, pb = positions[a], positions[b]
+            cuts[key] = [pa[k] + t * (pb[k] - pa[k]) for k in range(3)]
+        return key
+
+    if count == 1:
+        i = above.index(True)
+        a, b, c = tri[i], tri[(i + 1) % 3], tri[(i + 2) % 3]
+        da, db, dc = d[i], d[(i + 1) % 3], d[(i + 2) % 3]
+        result = [[a, cut(a, b, da, db), cut(a, c, da, dc)]]
+    else:
+        i = above.index(False)
+        c, a, b = tri[i], tri[(i + 1) % 3], tri[(i + 2) % 3]
+        dc, da, db = d[i], d[(i + 1) % 3], d[(i + 2) % 3]
+        ca, bc = cut(a, c, da, dc), cut(b, c, db, dc)
+        result = [[ca, a, b], [ca, b, bc]]
+    # Cuts that landed on a vertex leave degenerate triangles
+    return [t for t in result if t[0] != t[1] and t[1] != t[2] and t[0] != t[2]]
+
+
+def _clip_triangles_numpy(ids, points, d, eps):
+    """
+    _clip_triangle for many triangles at once: ids (m, 3) vertex keys,
+    points (m, 3, 3) and d (m, 3) signed distances of triangles that cross
+    the cut. Returns the kept triangles as (t, 3) references, where r >= 0 is
+    a vertex key and r < 0 stands for cut point -r - 1, and the (c, 3) cut
+    points, one per crossed edge.
+    """
+    above = d >= 0
+    count = above.sum(axis=1)
+    # Rotate (keeping the winding) so that the lone vertex on its side comes first
+    first = np.where(count == 1, above.argmax(axis=1), (~above).argmax(axis=1))
+    order = (first[:, None] + np.arange(3)) % 3
+    rows = np.arange(len(ids))[:, None]
+    ids, points, d = ids[rows, order], points[rows, order], d[rows, order]
+
+    one = count == 1
+    # One vertex kept: its cut edges go to the other two. Two kept: the cut
+    # edges run from each of them to the dropped vertex.
+    kept_end = np.concatenate([np.where(one, 0, 1), np.where(one, 0, 2)])
+    other_end = np.concatenate([np.where(one, 1, 0), np.where(one, 2, 0)])
+    tri = np.concatenate([np.arange(len(ids))] * 2)
+    a, b = ids[tri, kept_end], ids[tri, other_end]
+    da, db = d[tri, kept_end], d[tri, other_end]
+    # A kept vertex on the cut is its own cut point
+    crossing = da > eps
+    pair = np.where(crossing, np.minimum(a, b) * (int(ids.max()) + 1) + np.maximum(a, b), -1)
+    keys, first_use, inverse = np.unique(pair[crossing], return_index=True, return_inverse=True)
+    refs = a.copy()
+    refs[crossing] = -inverse - 1
+    t = (da / (da - db))[crossing][first_use][:, None]
+    pa = points[tri, kept_end][crossing][first_use]
+    pb = points[tri, other_end][crossing][first_use]
+    cuts = pa + t * (pb - pa)
+
+    m = len(ids)
+    first_cut, second_cut = refs[:m], refs[m:]
+    triangles = [
+        # [a, cut(a, b), cut(a, c)]
+        (one & (d[:, 0] > eps), [ids[:, 0], first_cut, second_cut]),
+        # [cut(a, c), a, b] and [cut(a, c), b, cut(b, c)], with c = ids[:, 0]
+        (~one & (d[:, 1] > eps), [first_cut, ids[:, 1], ids[:, 2]]),
+        (~one & (d[:, 2] > eps), [first_cut, ids[:, 2], second_cut]),
+    ]
+    faces = np.concatenate([np.stack(columns, axis=1)[mask] for mask, columns in triangles])
+    return faces, cuts
+
+
+def _dome_python(radius, base, k, bands, normal, offset, eps):
+    grid, triangles = face_grid(k)
+    inv_k = 1.0 / k
+    # Only points on face borders are shared; interior points are numbered
+    # from their face's start in local order
+    inner = [None] * len(grid)
+    n = 0
+    for li, (row, col) in enumerate(grid):
+        if not (row == 0 or col == 0 or row + col == k):
+            inner[li] = n
+            n += 1
+    face_start = len(base.vertices) + len(base.edges) * (k - 1)
+    positions = {}
+    dist = {}
+    cuts = {}
+    kept = []
+    ids = [0] * len(grid)
+    for fi, row_start, row_end, inside in bands:
+        v1, v2, v3 = [base.vertices[i] for i in base.faces[fi]]
+        start = face_start + fi * interior_count(k)
+        for li in range(grid_index(row_start, 0, k), grid_index(row_end, k - row_end, k) + 1):
+            row, col = grid[li]
+            g = ids[li] = (start + inner[li] if inner[li] is not None
+                           else base_vertex_index(base, fi, row, col, k))
+            if g in positions:
+                continue
+            wb = col * inv_k
+            wc = row * inv_k
+            wa = 1.0 - wb - wc
+            x = wa * v1[0] + wb * v2[0] + wc * v3[0]
+            y = wa * v1[1] + wb * v2[1] + wc * v3[1]
+            z = wa * v1[2] + wb * v2[2] + wc * v3[2]
+            s = radius / math.sqrt(x * x + y * y + z * z)
+            p = [x * s, y * s, z * s]
+            positions[g] = p
+            d = p[0] * normal[0] + p[1] * normal[1] + p[2] * normal[2] - offset
+            dist[g] = 0.0 if abs(d) <= eps else d
+        band = triangles[_row_triangle_start(row_start, k):_row_triangle_start(row_end, k)]
+        if inside:
+            kept.extend((ids[i], ids[j], ids[l]) for i, j, l in band)
+            continue
+        for i, j, l in band:
+            a, b, c = ids[i], ids[j], ids[l]
+            da, db, dc = dist[a], dist[b], dist[c]
+            if da >= 0 and db >= 0 and dc >= 0:
+                kept.append((a, b, c))
+            elif da >= 0 or db >= 0 or dc >= 0:
+                kept.extend(_clip_triangle([a, b, c], dist, positions, cuts, eps))
+
+    # Number only the vertices the kept triangles use
+    index = {}
+    vertices = []
+    mesh_faces = []
+    for tri in kept:
+        face = []
+        for key in tri:
+            i = index.get(key)
+            if i is None:
+                i = index[key] = len(vertices)
+                vertices.append(positions[key] if key in positions else cuts[key])
+            face.append(i)
+        mesh_faces.append(face)
+    return vertices, mesh_faces
+
+
+def _dome_numpy(radius, base, k, bands, normal, offset, eps):
+    rc, local = _face_grid_numpy(k)
+    rc = rc / float(k)
+    weights = np.empty((len(rc), 3))
+    weights[:, 0] = 1.0 - rc[:, 0] - rc[:, 1]
+    weights[:, 1] = rc[:, 1]
+    weights[:, 2] = rc[:, 0]
+    table = _face_index_table_numpy(k, base)
+    base_vertices = np.array(base.vertices)
+    n = np.array(normal)
+    total = len(base.vertices) + len(base.edges) * (k - 1) + len(base.faces) * interior_count(k)
+
+    kept_ids, kept_points, full_parts = [], [], []
+    crossing_ids, crossing_points, crossing_d = [], [], []
+    on_cut = False
+    for fi, row_start, row_end, inside in bands:
+        p0 = grid_index(row_start, 0, k)
+        p1 = grid_index(row_end, k - row_end, k) + 1
+        points = weights[p0:p1].dot(base_vertices[base.faces[fi]])
+        points *= (radius / np.sqrt(np.einsum("ij,ij->i", points, points)))[:, None]
+        g = table[fi, p0:p1]
+        band = local[_row_triangle_start(row_start, k):_row_triangle_start(row_end, k)] - p0
+        if inside:
+            kept_ids.append(g)
+            kept_points.append(points)
+            full_parts.append(g[band])
+            continue
+        d = points.dot(n) - offset
+        # Points on the cut must be classified alike from every face sharing them
+        snap = np.abs(d) <= eps
+        if snap.any():
+            d[snap] = 0.0
+            on_cut = True
+        above = d >= 0
+        a, b, c = above[band[:, 0]], above[band[:, 1]], above[band[:, 2]]
+        full = a & b & c
+        kept_ids.append(g[above])
+        kept_points.append(points[above])
+        full_parts.append(g[band[full]])
+        crossing = band[(a | b | c) & ~full]
+        crossing_ids.append(g[crossing])
+        crossing_points.append(points[crossing])
+        crossing_d.append(d[crossing])
+
+    if crossing_ids and sum(len(tris) for tris in crossing_ids):
+        partial, cuts = _clip_triangles_numpy(np.concatenate(crossing_ids), np.concatenate(crossing_points),
+                                              np.concatenate(crossing_d), eps)
+    else:
+        partial, cuts = np.zeros((0, 3), dtype=np.int64), np.zeros((0, 3))
+
+    # Renumber the kept sphere vertices in global order, without sorting;
+    # cut points follow them
+    ids = np.concatenate(kept_ids) if kept_ids else np.zeros(0, dtype=np.int64)
+    kept = np.zeros(total, dtype=bool)
+    kept[ids] = True
+    remap = np.cumsum(kept) - 1
+    count = int(remap[-1]) + 1
+    vertices = np.empty((count + len(cuts), 3))
+    if kept_points:
+        vertices[remap[ids]] = np.concatenate(kept_points)
+    vertices[count:] = cuts
+    full_faces = (remap[np.concatenate(full_parts)].reshape(-1, 3) if full_parts
+                  else np.zeros((0, 3), dtype=np.int64))
+    partial_faces = np.where(partial >= 0, remap[np.maximum(partial, 0)], count - partial - 1)
+    mesh_faces = np.concatenate([full_faces, partial_faces])
+    if on_cut:
+        # Drop vertices no kept triangle uses (on-cut vertices of degenerate pieces)
+        used = np.bincount(mesh_faces.ravel(), minlength=len(vertices)) > 0
+        if not used.all():
+            compact = np.cumsum(used) - 1
+            vertices, mesh_faces = vertices[used], compact[mesh_faces]
+    return vertices, mesh_faces
+
+
+def geodesic_dome(radius, frequency, fraction=0.5, cut=None, subdivision="class1", use_numpy=None):
+    """
+    Vertices and triangle faces of a geodesic dome: the part of a geodesic
+    sphere (with a vertex at the top) above a cut plane.
+
+    The cut keeps the top `fraction` of the height (see dome_cut) unless
+    `cut` gives a plane as (origin, normal), keeping the side the normal
+    points to. Base faces entirely below the cut are never subdivided, and
+    triangles crossing it are clipped to end exactly on the plane, so a
+    hemisphere costs about half a sphere.
+
+    subdivision="class1" splits each icosahedron face into a triangular grid
+    (as geodesic_sphere); "class2" uses the grid rotated by 30 degrees, for
+    even frequencies only. Returns NumPy arrays or lists like geodesic_sphere.
+    """
+    if frequency < 1:
+        raise ValueError("frequency must be at least 1")
+    k = int(frequency)
+    if subdivision == "class2":
+        if k % 2:
+            raise ValueError("Class II domes need an even frequency")
+        k //= 2
+    base = dome_base(subdivision)
+    radius = float(radius)
+    origin, normal = cut or dome_cut(radius, fraction)
+    normal = _unit([float(c) for c in normal])
+    offset = _dot([float(c) for c in origin], normal)
+    bands = _dome_bands(base, k, normal, offset / radius)
+    eps = 1e-9 * radius
+    if use_numpy is None:
+        use_numpy = np is not None
+    if use_numpy:
+        if np is None:
+            raise ImportError("NumPy is not available")
+        return _dome_numpy(radius, base, k, bands, normal, offset, eps)
+    return _dome_python(radius, base, k, bands, normal, offset, eps)
+
+
+def cached_geodesic_dome(radius, frequency, cache, fraction=0.5, cut=None, subdivision="class1"):
+    """
+    geodesic_dome as plain lists, served from `cache` when possible.
+    """
+    key = disk_cache.cache_key("geodesic_dome", KERNEL_VERSION, radius, frequency, fraction,
+                               [list(p) for p in cut] if cut else None, subdivision)
+    data = cache.get(key)
+    if data is not None:
+        return mesh_export.unpack_mesh(data)
+    vertices, faces = to_lists(*geodesic_dome(radius, frequency, fraction, cut, subdivision))
+    cache.put(key, mesh_export.pack_mesh(vertices, faces))
+    return vertices, faces
+
+
+# One bounded-memory piece of a geodesic sphere. `vertices` is a flat
+# array('d') of x, y, z values and `faces` a flat array('i') of local vertex
+# indices (three per triangle). `global_index` maps each local vertex to its
+# index in the full sphere, so patches can be written or welded back together.
+MeshPatch = namedtuple("MeshPatch", "face row_start row_end vertices faces global_index")
+
+
+def iter_geodesic_patches(radius, frequency, rows_per_patch=None):
+    """
+    Yields the sphere as MeshPatch objects, one icosahedron face at a time, or
+    in bands of `rows_per_patch` grid rows when a face is still too large.
+    Only one patch is held in memory at a time; vertices on patch borders are
+    repeated in each patch that uses them.
+    """
+    if frequency < 1:
+        raise ValueError("frequency must be at least 1")
+    f = int(frequency)
+    radius = float(radius)
+    inv_f = 1.0 / f
+    band = int(rows_per_patch) if rows_per_patch else f
+    if band < 1:
+        raise ValueError("rows_per_patch must be at least 1")
+    base_verts, faces = icosahedron()
+
+    for fi, face in enumerate(faces):
+        v1, v2, v3 = base_verts[face[0]], base_verts[face[1]], base_verts[face[2]]
+        for row_start in range(0, f, band):
+            row_end = min(row_start + band, f)
+            offset = grid_index(row_start, 0, f)
+
+            vertices = array('d')
+            global_index = array('i')
+            for row in range(row_start, row_end + 1):
+                wc = row * inv_f
+                for col in range(f - row + 1):
+                    wb = col * inv_f
+                    wa = 1.0 - wb - wc
+                    x = wa * v1[0] + wb * v2[0] + wc * v3[0]
+                    y = wa * v1[1] + wb * v2[1] + wc * v3[1]
+                    z = wa * v1[2] + wb * v2[2] + wc * v3[2]
+                    s = radius / math.sqrt(x * x + y * y + z * z)
+                    vertices.extend((x * s, y * s, z * s))
+                    global_index.append(vertex_index(fi, row, col, f))
+
+            tris = array('i')
+            for row in range(row_start, row_end):
+                for col in range(f - row):
+                    tris.extend((grid_index(row, col, f) - offset,
+                                 grid_index(row, col + 1, f) - offset,
+                                 grid_index(row + 1, col, f) - offset))
+                    if col < f - row - 1:
+                        tris.extend((grid_index(row, col + 1, f) - offset,
+                                     grid_index(row + 1, col + 1, f) - offset,
+                                     grid_index(row + 1, col, f) - offset))
+
+            yield MeshPatch(fi, row_start, row_end, vertices, tris, global_index)
+
+
+def iter_vertex_chunks(radius, frequency, chunk_size=65536):
+    """
+    Yields all sphere vertices in global index order as flat array('d')
+    buffers of at most `chunk_size` vertices.
+    """
+    if frequency < 1:
+        raise ValueError("frequency must be at least 1")
+    chunk = array('d')
+    for v in _iter_vertices(float(radius), int(frequency)):
+        chunk.extend(v)
+        if len(chunk) >= 3 * chunk_size:
+            yield chunk
+            chunk = array('d')
+    if chunk:
+        yield chunk
+
+
+def patch_points(patch):
+    """
+    Vertices of a patch as a list of [x, y, z] (the form rs.AddMesh takes).
+    """
+    v = patch.vertices
+    return [[v[i], v[i + 1], v[i + 2]] for i in range(0, len(v), 3)]
+
+
+def patch_triangles(patch, use_global=False):
+    """
+    Triangles of a patch as a list of [i, j, k], in local indices or, with
+    use_global=True, in indices of the full sphere.
+    """
+    t = patch.faces
+    if use_global:
+        g = patch.global_index
+        return [[g[t[i]], g[t[i + 1]], g[t[i + 2]]] for i in range(0, len(t), 3)]
+    return [[t[i], t[i + 1], t[i + 2]] for i in range(0, len(t), 3)]
+
+
+def export_geodesic_sphere(path, radius, frequency, rows_per_patch=None):
+    """
+    Streams a geodesic sphere straight to a binary STL, binary PLY or OBJ file
+    (chosen by extension) without building the whole mesh in memory.
+    """
+    ext = path.lower().rsplit(".", 1)[-1]
+    face_count = 20 * frequency * frequency
+
+    def patches():
+        return iter_geodesic_patches(radius, frequency, rows_per_patch)
+
+    if ext == "stl":
+        mesh_export.write_stl(path, patches(), face_count)
+    elif ext == "ply":
+        mesh_export.write_ply(path, vertex_count(frequency), iter_vertex_chunks(radius, frequency),
+                              face_count, patches())
+    elif ext == "obj":
+        mesh_export.write_obj(path, iter_vertex_chunks(radius, frequency), patches())
+    else:
+        raise ValueError("Unsupported mesh format: " + ext)
+
+
+if __name__ == "__main__":
+    # Stream a sphere to disk without Rhino:
+    #   python geodesic_mesh.py dome.ply 10 200
+    import sys
+    out_path = sys.argv[1]
+    out_radius = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+    out_frequency = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    export_geodesic_sphere(out_path, out_radius, out_frequency)
+    print("Wrote {} (radius {}, frequency {})".format(out_path, out_radius, out_frequency))
@@ -0,0 +1,415 @@
+"""
+Headless evaluator for simple Grasshopper definitions.
+
+Loads a .ghx through ghx_parser, sorts the component graph topologically and
+solves the supported components with NumPy, outside Grasshopper:
+
+    Number Slider, Construct Point, XY Plane, Construct Plane, Circle,
+    and floating Number / Point / Plane parameters (pass-through)
+
+Every value carries a leading batch axis, so a slider can be given an array
+of values and thousands of parameter combinations are solved in one pass
+(see grid()). After the first solve, changing a slider re-solves only the
+components downstream of it.
+
+    ev = ghx_evaluator.Evaluator.load("Tangent circles.ghx")
+    ev.set_slider("98eb7da9-b18b-409e-bdcc-12cc095e180a", numpy.linspace(1, 20, 1000))
+    ev.solve()
+    circles = ev.result("Circle")       # per Circle component: plane and radius arrays
+
+Components outside the supported set (and everything downstream of them)
+solve to None and are listed in Evaluator.unsupported.
+"""
+import collections
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import ghx_parser
+
+# time.perf_counter is not available on IronPython 2.7
+_clock = getattr(time, "perf_counter", time.time)
+
+WORLD_XY = ((0.0, 0.0, 0.0), (1.0, 0.0, 0.0), (0.0, 1.0, 0.0))
+
+
+class Value(object):
+    """
+    A batched value: kind is "number" (shape (B,)), "point" (B, 3),
+    "plane" (B, 3, 3: origin, x axis, y axis) or "circle" (data is a dict
+    with "plane" and "radius"). B may be 1 and is broadcast as needed.
+    """
+
+    def __init__(self, kind, data):
+        self.kind = kind
+        self.data = data
+
+    def __len__(self):
+        if self.kind == "circle":
+            return max(len(self.data["plane"]), len(self.data["radius"]))
+        return len(self.data)
+
+
+def _broadcast(*arrays):
+    """
+    Broadcasts arrays along their first (batch) axis only.
+    """
+    size = max(len(a) for a in arrays)
+    out = []
+    for a in arrays:
+        if len(a) not in (1, size):
+            raise ValueError("Batch sizes {} and {} do not match".format(len(a), size))
+        out.append(np.broadcast_to(a, (size,) + a.shape[1:]) if len(a) != size else a)
+    return out
+
+
+def number(values):
+    return Value("number", np.atleast_1d(np.asarray(values, dtype=float)))
+
+
+def point_from(value):
+    if value.kind == "point":
+        return value
+    if value.kind == "plane":
+        return Value("point", value.data[:, 0])
+    if value.kind == "circle":
+        return Value("point", value.data["plane"][:, 0])
+    raise TypeError("Cannot use a {} as a point".format(value.kind))
+
+
+def plane_from(value):
+    if value.kind == "plane":
+        return value
+    if value.kind == "point":
+        # Grasshopper converts a point into a world XY plane at that point
+        planes = np.empty((len(value.data), 3, 3))
+        planes[:, 0] = value.data
+        planes[:, 1] = WORLD_XY[1]
+        planes[:, 2] = WORLD_XY[2]
+        return Value("plane", planes)
+    if value.kind == "circle":
+        return Value("plane", value.data["plane"])
+    raise TypeError("Cannot use a {} as a plane".format(value.kind))
+
+
+def number_from(value):
+    if value.kind == "number":
+        return value
+    if value.kind == "circle":
+        return Value("number", value.data["radius"])
+    raise TypeError("Cannot use a {} as a number".format(value.kind))
+
+
+def persistent_value(data):
+    """
+    Value for one persistent-data entry from the index.
+    """
+    if isinstance(data, dict):
+        if "Ox" in data:
+            plane = [[data["Ox"], data["Oy"], data["Oz"]],
+                     [data["Xx"], data["Xy"], data["Xz"]],
+                     [data["Yx"], data["Yy"], data["Yz"]]]
+            return Value("plane", np.array([plane], dtype=float))
+        if "X" in data:
+            return Value("point", np.array([[data["X"], data["Y"], data.get("Z", 0.0)]], dtype=float))
+        raise TypeError("Unsupported persistent data: " + str(sorted(data)))
+    return number(data)
+
+
+def _unit(v):
+    length = np.linalg.norm(v, axis=-1, keepdims=True)
+    return v / np.where(length == 0, 1.0, length)
+
+
+# Component solvers: (evaluator, object, input Values) -> output Values
+
+def _construct_point(ev, obj, inputs):
+    x, y, z = _broadcast(*[number_from(v).data for v in inputs])
+    return [Value("point", np.stack([x, y, z], axis=-1))]
+
+
+def _xy_plane(ev, obj, inputs):
+    return [plane_from(point_from(inputs[0]))]
+
+
+def _construct_plane(ev, obj, inputs):
+    origin, x_axis, y_axis = _broadcast(*[point_from(v).data for v in inputs])
+    x_axis = _unit(x_axis)
+    # Make the y axis orthogonal to x, as Grasshopper does
+    y_axis = _unit(y_axis - np.sum(y_axis * x_axis, axis=-1, keepdims=True) * x_axis)
+    return [Value("plane", np.stack([origin, x_axis, y_axis], axis=1))]
+
+
+def _circle(ev, obj, inputs):
+    plane, radius = _broadcast(plane_from(inputs[0]).data, number_from(inputs[1]).data)
+    return [Value("circle", {"plane": plane, "radius": radius})]
+
+
+COMPONENTS = {
+    "Construct Point": _construct_point,
+    "XY Plane": _xy_plane,
+    "Construct Plane": _construct_plane,
+    "Circle": _circle,
+}
+
+# Floating parameters that pass their input through, with the conversion applied
+PARAMETERS = {
+    "Number": number_from,
+    "Point": point_from,
+    "Plane": plane_from,
+    "Circle": lambda value: value,
+}
+
+
+def _world_xy():
+    return Value("plane", np.array([WORLD_XY], dtype=float))
+
+
+# Values for unconnected inputs without persistent data, by input position
+DEFAULT_INPUTS = {
+    "Construct Point": [lambda: number(0.0)] * 3,
+    "XY Plane": [lambda: Value("point", np.zeros((1, 3)))],
+    "Circle": [_world_xy, lambda: number(1.0)],
+}
+
+
+def grid(values_by_key):
+    """
+    Every combination of the given slider values, as flat arrays of equal
+    length for set_sliders: grid({"A": [1, 2], "B": [10, 20, 30]}) has 6 rows.
+    """
+    keys = list(values_by_key)
+    axes = np.meshgrid(*[np.asarray(values_by_key[k], dtype=float) for k in keys], indexing="ij")
+    return dict((k, a.ravel()) for k, a in zip(keys, axes))
+
+
+class Evaluator(object):
+    """
+    Solves one definition. Values are stored per output parameter GUID (and
+    per object GUID for floating parameters such as sliders).
+    """
+
+    def __init__(self, index):
+        if np is None:
+            raise ImportError("ghx_evaluator needs numpy")
+        self.index = index
+        self.order = self._topological_order()
+        self.values = {}
+        self.overrides = {}
+        self.unsupported = sorted(set(
+            o.get("name") for o in index.objects
+            if not self._is_slider(o) and o.get("name") not in COMPONENTS and o.get("name") not in PARAMETERS))
+        self._dirty = None
+        # Objects solved by the last solve() call
+        self.solved = 0
+
+    @classmethod
+    def load(cls, path, use_cache=True):
+        return cls(ghx_parser.GhxIndex.load(path, use_cache))
+
+    def _topological_order(self):
+        index = self.index
+        pending = {}
+        consumers = {}
+        for obj in index.objects:
+            guid = obj.get("instance_guid")
+            sources = set(index.inputs_of(obj))
+            pending[guid] = len(sources)
+            for source in sources:
+                consumers.setdefault(source, []).append(guid)
+        ready = collections.deque(
+            o.get("instance_guid") for o in index.objects if pending[o.get("instance_guid")] == 0)
+        order = []
+        while ready:
+            guid = ready.popleft()
+            order.append(guid)
+            for consumer in consumers.get(guid, []):
+                pending[consumer] -= 1
+                if pending[consumer] == 0:
+                    ready.append(consumer)
+        if len(order) != len(index.objects):
+            raise ValueError("The definition has a cycle")
+        self._consumers = consumers
+        return order
+
+    @staticmethod
+    def _is_slider(obj):
+        return "slider" in obj
+
+    def _slider_guid(self, key):
+        found = [o for o in self.index.find(key) if self._is_slider(o)]
+        if len(found) != 1:
+            raise KeyError("{} matches {} sliders".format(key, len(found)))
+        return found[0].get("instance_guid")
+
+    def set_slider(self, key, values):
+        """
+        Overrides a slider (by InstanceGuid or unique NickName) with a value
+        or an array of values. Values are clamped to the slider's range.
+        """
+        guid = self._slider_guid(key)
+        slider = self.index.by_guid[guid]["slider"]
+        values = np.atleast_1d(np.asarray(values, dtype=float))
+        if "min" in slider and "max" in slider:
+            values = np.clip(values, slider["min"], slider["max"])
+        self.overrides[guid] = values
+        if self._dirty is not None:
+            self._dirty.add(guid)
+
+    def set_sliders(self, values_by_key):
+        for key, values in values_by_key.items():
+            self.set_slider(key, values)
+
+    def _downstream(self, guids):
+        seen = set(guids)
+        frontier = list(guids)
+        while frontier:
+            guid = frontier.pop()
+            for consumer in self._consumers.get(guid, []):
+                if consumer not in seen:
+                    seen.add(consumer)
+                    frontier.append(consumer)
+        return seen
+
+    def _source_value(self, guid):
+        return self.values.get(guid)
+
+    def _input_value(self, obj, param, position):
+        sources = param["sources"]
+        if sources:
+            # Several wires into one input would merge into a list; only the first is used
+            return self._source_value(sources[0])
+        if param.get("persistent"):
+            return persistent_value(param["persistent"][0])
+        defaults = DEFAULT_INPUTS.get(obj.get("name"), [])
+        if position < len(defaults):
+            return defaults[position]()
+        return None
+
+    def _solve_object(self, obj):
+        guid = obj.get("instance_guid")
+        name = obj.get("name")
+        if self._is_slider(obj):
+            values = self.overrides.get(guid)
+            if values is None:
+                values = obj["slider"].get("value", 0.0)
+            self.values[guid] = number(values)
+            return
+        if name in PARAMETERS and not obj["inputs"]:
+            if obj["sources"]:
+                source = self._source_value(obj["sources"][0])
+            elif obj.get("persistent"):
+                source = persistent_value(obj["persistent"][0])
+            else:
+                source = None
+            self.values[guid] = PARAMETERS[name](source) if source is not None else None
+            return
+        solver = COMPONENTS.get(name)
+        inputs = [self._input_value(obj, p, i) for i, p in enumerate(obj["inputs"])]
+        if solver is None or any(v is None for v in inputs):
+            outputs = [None] * len(obj["outputs"])
+        else:
+            outputs = solver(self, obj, inputs)
+        for param, value in zip(obj["outputs"], outputs):
+            self.values[param.get("instance_guid")] = value
+
+    def solve(self):
+        """
+        Solves the definition (on later calls only what changed sliders
+        affect) and returns results(). Raises ValueError if slider arrays of
+        different lengths (other than 1) meet in one component.
+        """
+        if self._dirty is None:
+            targets = self.order
+        else:
+            affected = self._downstream(self._dirty)
+            targets = [guid for guid in self.order if guid in affected]
+        for guid in targets:
+            self._solve_object(self.index.by_guid[guid])
+        self.solved = len(targets)
+        self._dirty = set()
+        return self.results()
+
+    def output(self, obj):
+        """
+        Data of an object's outputs (one entry per output parameter; for a
+        floating parameter, its own value).
+        """
+        if not obj["outputs"]:
+            value = self.values.get(obj.get("instance_guid"))
+            return [value.data if value is not None else None]
+        values = [self.values.get(p.get("instance_guid")) for p in obj["outputs"]]
+        return [v.data if v is not None else None for v in values]
+
+    def results(self):
+        """
+        Output data of every object by InstanceGuid (a single output is not
+        wrapped in a list).
+        """
+        results = {}
+        for obj in self.index.objects:
+            data = self.output(obj)
+            results[obj.get("instance_guid")] = data[0] if len(data) == 1 else data
+        return results
+
+    def result(self, key):
+        """
+        Output data of the objects matching `key` (InstanceGuid, Name or
+        NickName), one entry per object.
+        """
+        results = []
+        for obj in self.index.find(key):
+            data = self.output(obj)
+            results.append(data[0] if len(data) == 1 else data)
+        return results
+
+
+def circle_points(circle, segments=64):
+    """
+    Points along batched circles, shape (B, segments, 3).
+    """
+    plane = circle["plane"]
+    radius = circle["radius"]
+    t = np.linspace(0.0, 2.0 * np.pi, segments, endpoint=False)
+    return (plane[:, None, 0] + radius[:, None, None] * (
+        np.cos(t)[None, :, None] * plane[:, None, 1] + np.sin(t)[None, :, None] * plane[:, None, 2]))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python ghx_evaluator.py FILE.ghx [combinations]")
+        sys.exit(1)
+    evaluator = Evaluator.load(sys.argv[1])
+    evaluator.solve()
+    for obj in evaluator.index.objects:
+        print("{} ({}): {}".format(obj.get("name"), obj.get("nickname"),
+                                   evaluator.output(obj)))
+    if evaluator.unsupported:
+        print("Unsupported components: " + ", ".join(evaluator.unsupported))
+
+    # Sweep every slider over its range, batched and one combination at a time
+    sliders = [o.get("instance_guid") for o in evaluator.index.sliders()]
+    if len(sys.argv) > 2 and sliders:
+        combinations = int(sys.argv[2])
+        steps = max(2, int(round(combinations ** (1.0 / len(sliders)))))
+        values = grid(dict((g, np.linspace(evaluator.index.by_guid[g]["slider"]["min"],
+                                           evaluator.index.by_guid[g]["slider"]["max"], steps))
+                           for g in sliders))
+        count = len(values[sliders[0]])
+        start = _clock()
+        evaluator.set_sliders(values)
+        evaluator.solve()
+        batched = _clock() - start
+
+        looped_count = min(count, 2000)
+        start = _clock()
+        for row in range(looped_count):
+            evaluator.set_sliders(dict((g, values[g][row]) for g in sliders))
+            evaluator.solve()
+        looped = (_clock() - start) * count / looped_count
+        print("{} combinations: batched {:.1f} ms, one at a time {:.1f} ms (estimated from {})".format(
+            count, batched * 1000, looped * 1000, looped_count))
@@ -0,0 +1,382 @@
+"""
+Streaming reader for Grasshopper .ghx archives.
+
+An archive is nested <chunk name=...>/<item name=...> XML. parse_ghx walks it
+with iterparse and keeps only one DefinitionObjects/Object chunk in memory
+at a time (everything else is cleared as soon as it has been read), so
+memory stays flat for archives of any size. The result is a compact index
+of the definition's objects: component name, InstanceGuid, NickName, slider
+settings, input/output parameters with their persistent values, and the
+wires (source -> target parameter GUIDs).
+
+GhxIndex.load caches the index next to the archive (<file>.index.json),
+keyed on the archive's SHA-1, so repeat queries do not read the XML again:
+
+    index = ghx_parser.GhxIndex.load("Tangent circles.ghx")
+    for slider in index.sliders():
+        print(slider["nickname"], slider["slider"]["value"])
+    print([o["name"] for o in index.upstream("Circle")])
+
+    python ghx_parser.py "Tangent circles.ghx" sliders
+"""
+import hashlib
+import json
+import os
+import sys
+
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+# Bump when the index layout changes so cached indexes are rebuilt
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".index.json"
+
+# Chunk path of the top-level objects
+OBJECTS_PATH = ["Definition", "DefinitionObjects"]
+
+
+def file_hash(path, block_size=1024 * 1024):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _number(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return text
+
+
+def item_value(item):
+    """
+    Python value of an <item>, based on its type_name. Items with child
+    elements (points, planes, rectangles) become dicts of their fields.
+    """
+    children = list(item)
+    if children:
+        return dict((child.tag, _number(child.text)) for child in children)
+    text = item.text.strip() if item.text else ""
+    type_name = item.get("type_name", "")
+    if type_name in ("gh_double", "gh_decimal", "gh_single"):
+        return float(text)
+    if type_name in ("gh_int32", "gh_int64", "gh_int16", "gh_byte"):
+        return int(text)
+    if type_name == "gh_bool":
+        return text.lower() == "true"
+    return text
+
+
+def _items(chunk):
+    """
+    (name, index, element) for each item directly in a chunk.
+    """
+    items = chunk.find("items")
+    if items is None:
+        return []
+    return [(item.get("name"), item.get("index"), item) for item in items.findall("item")]
+
+
+def _chunks(chunk, name=None):
+    chunks = chunk.find("chunks")
+    if chunks is None:
+        return []
+    return [c for c in chunks.findall("chunk") if name is None or c.get("name") == name]
+
+
+def _persistent_data(param):
+    """
+    Values stored on a parameter itself (used when it has no wires), flattened
+    over all branches.
+    """
+    values = []
+    for data in _chunks(param, "PersistentData"):
+        for branch in _chunks(data, "Branch"):
+            for entry in _chunks(branch, "Item"):
+                for name, index, item in _items(entry):
+                    values.append(item_value(item))
+    return values
+
+
+def _parameter(chunk):
+    param = {"index": int(chunk.get("index") or 0), "sources": []}
+    for name, index, item in _items(chunk):
+        if name == "Source":
+            param["sources"].append(item_value(item))
+        elif name == "InstanceGuid":
+            param["instance_guid"] = item_value(item)
+        elif name in ("Name", "NickName"):
+            param[name.lower()] = item_value(item)
+    persistent = _persistent_data(chunk)
+    if persistent:
+        param["persistent"] = persistent
+    return param
+
+
+def parse_object(chunk):
+    """
+    Index entry for one DefinitionObjects/Object chunk.
+    """
+    obj = {"index": int(chunk.get("index") or 0), "inputs": [], "outputs": [], "sources": []}
+    for name, index, item in _items(chunk):
+        if name == "GUID":
+            obj["component_guid"] = item_value(item)
+        elif name == "Name":
+            obj["name"] = item_value(item)
+    for container in _chunks(chunk, "Container"):
+        for name, index, item in _items(container):
+            if name == "InstanceGuid":
+                obj["instance_guid"] = item_value(item)
+            elif name == "NickName":
+                obj["nickname"] = item_value(item)
+            elif name == "Source":
+                # Floating parameters (sliders, panels, ...) carry their own wires
+                obj["sources"].append(item_value(item))
+        for child in _chunks(container):
+            kind = child.get("name")
+            if kind == "param_input":
+                obj["inputs"].append(_parameter(child))
+            elif kind == "param_output":
+                obj["outputs"].append(_parameter(child))
+            elif kind == "Slider":
+                obj["slider"] = dict((n.lower(), item_value(i)) for n, _, i in _items(child))
+        persistent = _persistent_data(container)
+        if persistent:
+            obj["persistent"] = persistent
+    obj["inputs"].sort(key=lambda p: p["index"])
+    obj["outputs"].sort(key=lambda p: p["index"])
+    return obj
+
+
+def iter_objects(path):
+    """
+    Yields parse_object() for each top-level object of the archive, reading
+    it with iterparse and discarding every element once it has been used.
+    """
+    chunk_path = []
+    collecting = 0
+    parents = []
+    for event, elem in ET.iterparse(path, events=("start", "end")):
+        if event == "start":
+            if elem.tag == "chunk":
+                if collecting:
+                    collecting += 1
+                elif elem.get("name") == "Object" and chunk_path == OBJECTS_PATH:
+                    collecting = 1
+                chunk_path.append(elem.get("name"))
+            parents.append(elem)
+            continue
+
+        parents.pop()
+        if elem.tag == "chunk":
+            chunk_path.pop()
+            if collecting:
+                collecting -= 1
+                if collecting == 0:
+                    yield parse_object(elem)
+                    elem.clear()
+                    if parents:
+                        parents[-1].remove(elem)
+                continue
+        if not collecting:
+            # Outside objects nothing is needed once read (e.g. the thumbnail)
+            elem.clear()
+            if parents and elem.tag in ("chunk", "item"):
+                parents[-1].remove(elem)
+
+
+def parse_ghx(path):
+    """
+    Builds the index dict of an archive (without touching the cache).
+    """
+    objects = list(iter_objects(path))
+    wires = []
+    for obj in objects:
+        for source in obj["sources"]:
+            wires.append([source, obj.get("instance_guid")])
+        for param in obj["inputs"]:
+            for source in param["sources"]:
+                wires.append([source, param.get("instance_guid")])
+    return {"version": INDEX_VERSION, "objects": objects, "wires": wires}
+
+
+def index_path(path):
+    return path + INDEX_SUFFIX
+
+
+class GhxIndex(object):
+    """
+    Queries over the index of one archive. Objects are the dicts made by
+    parse_object; they are addressed by InstanceGuid, Name or NickName.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.objects = data["objects"]
+        self.wires = data["wires"]
+        self.by_guid = {}
+        # Parameter or object GUID -> InstanceGuid of the object that owns it
+        self.owner = {}
+        for obj in self.objects:
+            guid = obj.get("instance_guid")
+            self.by_guid[guid] = obj
+            self.owner[guid] = guid
+            for param in obj["inputs"] + obj["outputs"]:
+                self.owner[param.get("instance_guid")] = guid
+
+    @classmethod
+    def load(cls, path, use_cache=True):
+        """
+        Reads the cached index if it matches the archive, otherwise parses
+        the archive and writes the cache.
+        """
+        cache_path = index_path(path)
+        stat = os.stat(path)
+        cached = None
+        if use_cache and os.path.exists(cache_path):
+            try:
+                with open(cache_path, "r") as f:
+                    cached = json.load(f)
+            except (IOError, OSError, ValueError):
+                cached = None
+        if cached is not None and cached.get("version") == INDEX_VERSION:
+            # Size and mtime unchanged: trust the cache without hashing
+            if cached.get("size") == stat.st_size and cached.get("mtime") == stat.st_mtime:
+                return cls(cached)
+            digest = file_hash(path)
+            if cached.get("hash") == digest:
+                cached["mtime"] = stat.st_mtime
+                cls._write(cache_path, cached)
+                return cls(cached)
+        else:
+            digest = file_hash(path)
+
+        data = parse_ghx(path)
+        data.update({"hash": digest, "size": stat.st_size, "mtime": stat.st_mtime})
+        if use_cache:
+            cls._write(cache_path, data)
+        return cls(data)
+
+    @staticmethod
+    def _write(cache_path, data):
+        tmp_path = cache_path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+            if os.path.exists(cache_path):
+                os.remove(cache_path)
+            os.rename(tmp_path, cache_path)
+        except (IOError, OSError):
+            # A read-only folder only loses the cache
+            pass
+
+    def find(self, key):
+        """
+        Objects whose InstanceGuid, Name or NickName equals `key` (names are
+        compared case-insensitively).
+        """
+        if key in self.by_guid:
+            return [self.by_guid[key]]
+        key = key.lower()
+        return [o for o in self.objects
+                if (o.get("name") or "").lower() == key or (o.get("nickname") or "").lower() == key]
+
+    def sliders(self):
+        return [o for o in self.objects if "slider" in o]
+
+    def _targets(self, key):
+        if isinstance(key, dict):
+            return [key]
+        found = self.find(key)
+        if not found:
+            raise KeyError("No object named " + str(key))
+        return found
+
+    def inputs_of(self, obj):
+        """
+        InstanceGuids of the objects wired directly into `obj`.
+        """
+        sources = list(obj["sources"])
+        for param in obj["inputs"]:
+            sources.extend(param["sources"])
+        return [self.owner[s] for s in sources if s in self.owner]
+
+    def upstream(self, key):
+        """
+        All objects `key` depends on, directly or indirectly, nearest first.
+        """
+        seen = set()
+        order = []
+        frontier = self._targets(key)
+        for obj in frontier:
+            seen.add(obj.get("instance_guid"))
+        while frontier:
+            next_frontier = []
+            for obj in frontier:
+                for guid in self.inputs_of(obj):
+                    if guid not in seen:
+                        seen.add(guid)
+                        order.append(self.by_guid[guid])
+                        next_frontier.append(self.by_guid[guid])
+            frontier = next_frontier
+        return order
+
+    def downstream(self, key):
+        """
+        All objects that depend on `key`, nearest first.
+        """
+        consumers = {}
+        for obj in self.objects:
+            for guid in self.inputs_of(obj):
+                consumers.setdefault(guid, []).append(obj)
+        seen = set()
+        order = []
+        frontier = self._targets(key)
+        for obj in frontier:
+            seen.add(obj.get("instance_guid"))
+        while frontier:
+            next_frontier = []
+            for obj in frontier:
+                for consumer in consumers.get(obj.get("instance_guid"), []):
+                    guid = consumer.get("instance_guid")
+                    if guid not in seen:
+                        seen.add(guid)
+                        order.append(consumer)
+                        next_frontier.append(consumer)
+            frontier = next_frontier
+        return order
+
+
+def describe(obj):
+    text = "{} ({}) {}".format(obj.get("name"), obj.get("nickname"), obj.get("instance_guid"))
+    if "slider" in obj:
+        slider = obj["slider"]
+        text += " = {} [{} .. {}]".format(slider.get("value"), slider.get("min"), slider.get("max"))
+    return text
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python ghx_parser.py FILE.ghx [objects|sliders|wires|upstream NAME|downstream NAME]")
+        sys.exit(1)
+    index = GhxIndex.load(sys.argv[1])
+    command = sys.argv[2] if len(sys.argv) > 2 else "objects"
+    if command == "sliders":
+        for obj in index.sliders():
+            print(describe(obj))
+    elif command == "wires":
+        for source, target in index.wires:
+            print("{} -> {}".format(source, target))
+    elif command in ("upstream", "downstream"):
+        for obj in getattr(index, command)(sys.argv[3]):
+            print(describe(obj))
+    else:
+        for obj in index.objects:
+            print(describe(obj))
@@ -0,0 +1,523 @@
+"""
+Writes Grasshopper .ghx archives from a Python description of components
+and wires.
+
+Objects are described with a Definition; write() streams the archive to disk
+one object at a time (each object's chunks are built, written and dropped),
+so no DOM of the whole file is ever held and writing is linear in the
+number of objects:
+
+    definition = ghx_writer.Definition()
+    radius = definition.slider("Radius", 5.0, 0.0, 10.0)
+    circle = definition.component("Circle")
+    definition.connect(radius, circle.input("Radius"))
+    definition.write("circle.ghx")
+    print(definition.verify("circle.ghx"))    # [] when it parses back identically
+
+write_ghx() takes any iterable of objects plus their count, so definitions
+can also be generated lazily without keeping them all in memory. Component
+types other than the ones in COMPONENT_TYPES can be described with a
+ComponentType carrying their Grasshopper GUID and parameters.
+
+    python ghx_writer.py big.ghx 5000      # 5000 slider/point/circle chains
+"""
+import codecs
+import os
+import sys
+import time
+import uuid
+
+from xml.sax.saxutils import escape, quoteattr
+
+# time.perf_counter is not available on IronPython 2.7
+_clock = getattr(time, "perf_counter", time.time)
+
+# type_name and type_code of the archive item types written here
+GH_BOOL = ("gh_bool", 1)
+GH_INT32 = ("gh_int32", 3)
+GH_DOUBLE = ("gh_double", 6)
+GH_DATE = ("gh_date", 8)
+GH_GUID = ("gh_guid", 9)
+GH_STRING = ("gh_string", 10)
+GH_POINTF = ("gh_drawing_pointf", 31)
+GH_RECTANGLEF = ("gh_drawing_rectanglef", 35)
+GH_POINT3D = ("gh_point3d", 51)
+GH_PLANE = ("gh_plane", 72)
+GH_VERSION = ("gh_version", 80)
+
+ARCHIVE_VERSION = (0, 2, 2)
+PLUGIN_VERSION = (1, 0, 7)
+
+# .NET DateTime ticks at the Unix epoch
+_EPOCH_TICKS = 621355968000000000
+
+# Canvas layout, in Grasshopper canvas units
+PARAM_SIZE = 20
+COMPONENT_WIDTH = 120
+SLIDER_WIDTH = 150
+COLUMN_WIDTH = 250
+ROW_HEIGHT = 90
+ROWS_PER_COLUMN = 40
+
+
+class ParamType(object):
+    def __init__(self, name, nickname, description="", optional=False):
+        self.name = name
+        self.nickname = nickname
+        self.description = description
+        self.optional = optional
+
+
+class ComponentType(object):
+    """
+    A Grasshopper component: its type GUID (the Object "GUID" item), names
+    and parameter layout.
+    """
+
+    def __init__(self, name, guid, description="", nickname=None, inputs=(), outputs=()):
+        self.name = name
+        self.guid = guid
+        self.description = description
+        self.nickname = nickname or name
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+
+
+NUMBER_SLIDER_GUID = "57da07bd-ecab-415d-9d86-af36d7073abc"
+
+COMPONENT_TYPES = {
+    "Construct Point": ComponentType(
+        "Construct Point", "3581f42a-9592-4549-bd6b-1c0fc39d067b",
+        "Construct a point from {xyz} coordinates.", "Pt",
+        [ParamType("X coordinate", "X", "{x} coordinate"),
+         ParamType("Y coordinate", "Y", "{y} coordinate"),
+         ParamType("Z coordinate", "Z", "{z} coordinate")],
+        [ParamType("Point", "Pt", "Point coordinate")]),
+    "Circle": ComponentType(
+        "Circle", "807b86e3-be8d-4970-92b5-f8cdcb45b06b",
+        "Create a circle defined by base plane and radius.", "Cir",
+        [ParamType("Plane", "P", "Base plane of circle"),
+         ParamType("Radius", "R", "Radius of circle")],
+        [ParamType("Circle", "C", "Resulting circle")]),
+}
+
+
+def new_guid():
+    return str(uuid.uuid4())
+
+
+class Param(object):
+    """
+    One input or output of a component. Inputs collect the GUIDs they are
+    wired to (`sources`) and may carry persistent values.
+    """
+
+    def __init__(self, owner, index, param_type, kind):
+        self.owner = owner
+        self.index = index
+        self.type = param_type
+        self.kind = kind
+        self.instance_guid = new_guid()
+        self.sources = []
+        self.persistent = []
+
+    def set(self, *values):
+        """
+        Persistent data used while the input has no wires: numbers, (x, y, z)
+        points or planes as (origin, x_axis, y_axis).
+        """
+        self.persistent = list(values)
+        return self
+
+
+class Component(object):
+    def __init__(self, component_type, nickname=None, position=(0, 0)):
+        self.type = component_type
+        self.nickname = nickname or component_type.nickname
+        self.position = position
+        self.instance_guid = new_guid()
+        self.inputs = [Param(self, i, p, "input") for i, p in enumerate(component_type.inputs)]
+        self.outputs = [Param(self, i, p, "output") for i, p in enumerate(component_type.outputs)]
+
+    @property
+    def name(self):
+        return self.type.name
+
+    @staticmethod
+    def _find(params, key):
+        if isinstance(key, int):
+            return params[key]
+        for param in params:
+            if key in (param.type.name, param.type.nickname):
+                return param
+        raise KeyError("No parameter named " + str(key))
+
+    def input(self, key=0):
+        return self._find(self.inputs, key)
+
+    def output(self, key=0):
+        return self._find(self.outputs, key)
+
+
+class Slider(object):
+    """
+    A Number Slider. It is a floating parameter: wires start at the slider
+    itself rather than at an output.
+    """
+
+    name = "Number Slider"
+
+    def __init__(self, nickname, value, minimum, maximum, digits=3, position=(0, 0)):
+        self.nickname = nickname
+        self.value = value
+        self.minimum = minimum
+        self.maximum = maximum
+        self.digits = digits
+        self.position = position
+        self.instance_guid = new_guid()
+
+
+def _number(value):
+    value = float(value)
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _item(name, item_type, value, index=None):
+    """
+    An item as (name, index, (type_name, type_code), value); value is text
+    or a list of (field, number) pairs.
+    """
+    return (name, index, item_type, value)
+
+
+def _chunk(name, items, chunks=(), index=None):
+    return (name, index, items, list(chunks))
+
+
+# Item and chunk names repeat constantly; quote each once
+_quoted = {}
+
+
+def _quote(name):
+    quoted = _quoted.get(name)
+    if quoted is None:
+        quoted = _quoted[name] = quoteattr(name)
+    return quoted
+
+
+def _escape(text):
+    if "&" in text or "<" in text or ">" in text:
+        return escape(text)
+    return text
+
+
+def _item_text(item, indent):
+    name, index, (type_name, type_code), value = item
+    attributes = "name={}{} type_name=\"{}\" type_code=\"{}\"".format(
+        _quote(name), "" if index is None else " index=\"{}\"".format(index), type_name, type_code)
+    if isinstance(value, list):
+        fields = "".join("{}  <{}>{}</{}>\n".format(indent, field, _number(v), field)
+                         for field, v in value)
+        return "{}<item {}>\n{}{}</item>\n".format(indent, attributes, fields, indent)
+    return "{}<item {}>{}</item>\n".format(indent, attributes, _escape(value))
+
+
+def _write_chunk(write, chunk, depth):
+    name, index, items, chunks = chunk
+    indent = "  " * depth
+    write("{}<chunk name={}{}>\n".format(
+        indent, _quote(name), "" if index is None else " index=\"{}\"".format(index)))
+    _write_body(write, items, chunks, depth + 1)
+    write(indent + "</chunk>\n")
+
+
+def _write_body(write, items, chunks, depth):
+    indent = "  " * depth
+    if items:
+        write("{}<items count=\"{}\">\n".format(indent, len(items)))
+        for item in items:
+            write(_item_text(item, indent + "  "))
+        write(indent + "</items>\n")
+    if chunks:
+        write("{}<chunks count=\"{}\">\n".format(indent, len(chunks)))
+        for child in chunks:
+            _write_chunk(write, child, depth + 1)
+        write(indent + "</chunks>\n")
+
+
+def _version(name, version):
+    return _item(name, GH_VERSION, list(zip(("Major", "Minor", "Revision"), version)))
+
+
+def _attributes(x, y, width, height, pivot=None):
+    pivot = pivot or (x + width / 2.0, y + height / 2.0)
+    return _chunk("Attributes", [
+        _item("Bounds", GH_RECTANGLEF, [("X", x), ("Y", y), ("W", width), ("H", height)]),
+        _item("Pivot", GH_POINTF, [("X", pivot[0]), ("Y", pivot[1])]),
+    ])
+
+
+def _persistent_item(value):
+    if isinstance(value, (int, float)):
+        return _item("number", GH_DOUBLE, _number(value))
+    if len(value) == 3 and all(isinstance(v, (int, float)) for v in value):
+        return _item("point", GH_POINT3D, list(zip(("X", "Y", "Z"), value)))
+    origin, x_axis, y_axis = value
+    fields = list(zip(("Ox", "Oy", "Oz"), origin)) + list(zip(("Xx", "Xy", "Xz"), x_axis)) + \
+        list(zip(("Yx", "Yy", "Yz"), y_axis))
+    return _item("plane", GH_PLANE, fields)
+
+
+def _persistent_chunk(values):
+    entries = [_chunk("Item", [_persistent_item(v)], index=i) for i, v in enumerate(values)]
+    branch = _chunk("Branch", [_item("Count", GH_INT32, str(len(values))),
+                               _item("Path", GH_STRING, "{0}")], entries, index=0)
+    return _chunk("PersistentData", [_item("Count", GH_INT32, "1")], [branch])
+
+
+def _sources(guids):
+    items = [_item("Source", GH_GUID, guid, index=i) for i, guid in enumerate(guids)]
+    return items + [_item("SourceCount", GH_INT32, str(len(guids)))]
+
+
+def _param_chunk(param, x, y):
+    items = [
+        _item("Description", GH_STRING, param.type.description),
+        _item("InstanceGuid", GH_GUID, param.instance_guid),
+        _item("Name", GH_STRING, param.type.name),
+        _item("NickName", GH_STRING, param.type.nickname),
+        _item("Optional", GH_BOOL, "true" if param.type.optional else "false"),
+    ] + _sources(param.sources)
+    chunks = [_attributes(x, y, PARAM_SIZE, PARAM_SIZE)]
+    if param.persistent:
+        chunks.append(_persistent_chunk(param.persistent))
+    return _chunk("param_" + param.kind, items, chunks, index=param.index)
+
+
+def object_chunk(obj, index):
+    """
+    The DefinitionObjects/Object chunk of a Component or Slider, as nested
+    (name, index, items, chunks) tuples.
+    """
+    x, y = obj.position
+    if isinstance(obj, Slider):
+        container = _chunk("Container", [
+            _item("Description", GH_STRING, "Numeric slider for single values"),
+            _item("InstanceGuid", GH_GUID, obj.instance_guid),
+            _item("Name", GH_STRING, obj.name),
+            _item("NickName", GH_STRING, obj.nickname),
+            _item("Optional", GH_BOOL, "false"),
+            _item("SourceCount", GH_INT32, "0"),
+        ], [
+            _attributes(x, y, SLIDER_WIDTH, PARAM_SIZE, (x, y)),
+            _chunk("Slider", [
+                _item("Digits", GH_INT32, str(obj.digits)),
+                _item("GripDisplay", GH_INT32, "1"),
+                _item("Interval", GH_INT32, "0"),
+                _item("Max", GH_DOUBLE, _number(obj.maximum)),
+                _item("Min", GH_DOUBLE, _number(obj.minimum)),
+                _item("SnapCount", GH_INT32, "0"),
+                _item("Value", GH_DOUBLE, _number(obj.value)),
+            ]),
+        ])
+        type_guid = NUMBER_SLIDER_GUID
+    else:
+        rows = max(len(obj.inputs), len(obj.outputs), 1)
+        height = rows * PARAM_SIZE
+        chunks = [_attributes(x, y, COMPONENT_WIDTH, height)]
+        for params, px in ((obj.inputs, x), (obj.outputs, x + COMPONENT_WIDTH - PARAM_SIZE)):
+            step = float(height) / max(len(params), 1)
+            for param in params:
+                chunks.append(_param_chunk(param, px, y + param.index * step))
+        container = _chunk("Container", [
+            _item("Description", GH_STRING, obj.type.description),
+            _item("InstanceGuid", GH_GUID, obj.instance_guid),
+            _item("Name", GH_STRING, obj.name),
+            _item("NickName", GH_STRING, obj.nickname),
+        ], chunks)
+        type_guid = obj.type.guid
+    return _chunk("Object", [_item("GUID", GH_GUID, type_guid), _item("Name", GH_STRING, obj.name)],
+                  [container], index=index)
+
+
+def write_ghx(path, objects, count, name=None, store=None):
+    """
+    Streams an archive with `count` objects (Components and Sliders, any
+    iterable) to `path`. Returns the number of bytes written. With a
+    blob_store.BlobStore, the file is then linked to the store's copy so
+    identical archives share disk space.
+    """
+    ticks = _EPOCH_TICKS + int(time.time() * 10000000)
+    header = [
+        _chunk("DocumentHeader", [_item("DocumentID", GH_GUID, new_guid())]),
+        _chunk("DefinitionProperties", [
+            _item("Date", GH_DATE, str(ticks)),
+            _item("Description", GH_STRING, ""),
+            _item("Name", GH_STRING, name or os.path.basename(path)),
+        ]),
+    ]
+    tmp_path = path + ".tmp"
+    written = 0
+    with codecs.open(tmp_path, "w", "utf-8") as f:
+        write = f.write
+        write("<?xml version=\"1.0\" encoding=\"utf-8\" standalone=\"yes\"?>\n")
+        write("<Archive name=\"Root\">\n  <!--Grasshopper archive-->\n")
+        _write_body(write, [_version("ArchiveVersion", ARCHIVE_VERSION)], [], 1)
+        write("  <chunks count=\"1\">\n    <chunk name=\"Definition\">\n")
+        _write_body(write, [_version("plugin_version", PLUGIN_VERSION)], [], 3)
+        write("      <chunks count=\"{}\">\n".format(len(header) + 1))
+        for chunk in header:
+            _write_chunk(write, chunk, 4)
+        write("        <chunk name=\"DefinitionObjects\">\n")
+        _write_body(write, [_item("ObjectCount", GH_INT32, str(count))], [], 5)
+        write("          <chunks count=\"{}\">\n".format(count))
+        for obj in objects:
+            # One write per object: codecs writers encode on every call
+            parts = []
+            _write_chunk(parts.append, object_chunk(obj, written), 6)
+            write("".join(parts))
+            written += 1
+        write("          </chunks>\n        </chunk>\n      </chunks>\n    </chunk>\n  </chunks>\n</Archive>\n")
+    if written != count:
+        os.remove(tmp_path)
+        raise ValueError("Expected {} objects, got {}".format(count, written))
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp_path, path)
+    if store is not None:
+        store.link_file(path)
+    return os.path.getsize(path)
+
+
+class Definition(object):
+    """
+    Components, sliders and wires of a definition to be written. Objects
+    without a position are laid out in columns in the order they are added.
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+        self.objects = []
+
+    def _position(self, position):
+        if position is not None:
+            return position
+        n = len(self.objects)
+        return (50 + (n // ROWS_PER_COLUMN) * COLUMN_WIDTH, 50 + (n % ROWS_PER_COLUMN) * ROW_HEIGHT)
+
+    def add(self, obj):
+        self.objects.append(obj)
+        return obj
+
+    def slider(self, nickname, value, minimum, maximum, digits=3, position=None):
+        return self.add(Slider(nickname, value, minimum, maximum, digits, self._position(position)))
+
+    def component(self, component_type, nickname=None, position=None):
+        """
+        Adds a component; `component_type` is a ComponentType or the name of
+        one in COMPONENT_TYPES.
+        """
+        if not isinstance(component_type, ComponentType):
+            try:
+                component_type = COMPONENT_TYPES[component_type]
+            except KeyError:
+                raise KeyError("Unknown component {!r}; describe it with a ComponentType".format(
+                    component_type))
+        return self.add(Component(component_type, nickname, self._position(position)))
+
+    def connect(self, source, target):
+        """
+        Wires `source` (a Slider, an output Param, or a Component for its
+        first output) into `target` (an input Param, or a Component for its
+        first input).
+        """
+        if isinstance(source, Component):
+            source = source.output(0)
+        if isinstance(target, Component):
+            target = target.input(0)
+        if not isinstance(target, Param) or target.kind != "input":
+            raise ValueError("Wires must end at a component input")
+        if isinstance(source, Param) and source.kind != "output":
+            raise ValueError("Wires must start at a slider or a component output")
+        target.sources.append(source.instance_guid)
+        return target
+
+    def wires(self):
+        return [[source, param.instance_guid]
+                for obj in self.objects if isinstance(obj, Component)
+                for param in obj.inputs for source in param.sources]
+
+    def write(self, path, store=None):
+        return write_ghx(path, self.objects, len(self.objects), self.name, store)
+
+    def verify(self, path):
+        """
+        Parses the written archive back with ghx_parser and lists every
+        difference from this definition (an empty list when it round-trips).
+        """
+        import ghx_parser
+        data = ghx_parser.parse_ghx(path)
+        problems = []
+        if len(data["objects"]) != len(self.objects):
+            problems.append("{} objects written, {} read back".format(
+                len(self.objects), len(data["objects"])))
+        for obj, parsed in zip(self.objects, data["objects"]):
+            expected = {"name": obj.name, "nickname": obj.nickname, "instance_guid": obj.instance_guid}
+            if isinstance(obj, Component):
+                expected["inputs"] = [p.instance_guid for p in obj.inputs]
+                expected["outputs"] = [p.instance_guid for p in obj.outputs]
+            else:
+                expected["value"] = float(obj.value)
+            found = dict((key, parsed.get(key)) for key in ("name", "nickname", "instance_guid"))
+            found["inputs"] = [p.get("instance_guid") for p in parsed["inputs"]]
+            found["outputs"] = [p.get("instance_guid") for p in parsed["outputs"]]
+            found["value"] = parsed.get("slider", {}).get("value")
+            for key, value in expected.items():
+                if found[key] != value:
+                    problems.append("object {} {}: wrote {!r}, read {!r}".format(
+                        obj.instance_guid, key, value, found[key]))
+        if sorted(data["wires"]) != sorted(self.wires()):
+            problems.append("wires differ: {} written, {} read back".format(
+                len(self.wires()), len(data["wires"])))
+        return problems
+
+
+def circle_chains(count):
+    """
+    Definition with `count` independent X/Y/radius slider -> Construct Point
+    -> Circle chains, for testing large archives.
+    """
+    definition = Definition()
+    for i in range(count):
+        x = definition.slider("X{}".format(i), i % 100, 0, 100)
+        y = definition.slider("Y{}".format(i), i // 100, 0, 100)
+        r = definition.slider("R{}".format(i), 1.0 + i % 5, 0.1, 10)
+        point = definition.component("Construct Point")
+        definition.connect(x, point.input("X"))
+        definition.connect(y, point.input("Y"))
+        point.input("Z").set(0.0)
+        circle = definition.component("Circle")
+        definition.connect(point, circle.input("Plane"))
+        definition.connect(r, circle.input("Radius"))
+    return definition
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python ghx_writer.py OUT.ghx [chains]")
+        sys.exit(1)
+    chains = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    start = _clock()
+    definition = circle_chains(chains)
+    built = _clock() - start
+    start = _clock()
+    size = definition.write(sys.argv[1])
+    written = _clock() - start
+    print("{} objects, {} wires: built in {:.2f} s, wrote {:.1f} MB in {:.2f} s".format(
+        len(definition.objects), len(definition.wires()), built, size / 1e6, written))
+    start = _clock()
+    problems = definition.verify(sys.argv[1])
+    print("Round trip through ghx_parser in {:.2f} s: {}".format(
+        _clock() - start, "; ".join(problems[:10]) if problems else "ok"))
@@ -0,0 +1,156 @@
+"""
+Streaming mesh writers (binary STL, binary PLY, OBJ) and a compact binary
+serialization of vertex/face arrays.
+
+The writers consume mesh patches one at a time (see
+geodesic_mesh.iter_geodesic_patches), so files far larger than the memory
+needed for a single patch can be written. Works without Rhino.
+"""
+import math
+import struct
+import sys
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _to_bytes(a):
+    # Files are little-endian; array() uses the native byte order
+    if sys.byteorder != "little":
+        a = array(a.typecode, a)
+        a.byteswap()
+    if hasattr(a, "tobytes"):
+        return a.tobytes()
+    return a.tostring()
+
+
+def _from_bytes(typecode, data):
+    a = array(typecode)
+    if hasattr(a, "frombytes"):
+        a.frombytes(data)
+    else:
+        a.fromstring(data)
+    if sys.byteorder != "little":
+        a.byteswap()
+    return a
+
+
+_MESH_HEADER = struct.Struct("<4sII")
+
+
+def pack_mesh(vertices, faces):
+    """
+    Serializes triangle mesh arrays ([[x, y, z], ...], [[i, j, k], ...]) or the
+    NumPy equivalents to bytes: a small header, float64 vertices, int32 faces.
+    """
+    if hasattr(vertices, "ravel"):
+        flat_v = array("d", vertices.ravel().tolist())
+        flat_f = array("i", faces.ravel().tolist())
+    else:
+        flat_v = array("d", [c for v in vertices for c in v])
+        flat_f = array("i", [i for t in faces for i in t])
+    header = _MESH_HEADER.pack(b"MSH1", len(flat_v) // 3, len(flat_f) // 3)
+    return header + _to_bytes(flat_v) + _to_bytes(flat_f)
+
+
+def unpack_mesh(data):
+    """
+    Inverse of pack_mesh; returns vertex and face lists ready for rs.AddMesh.
+    """
+    magic, nv, nf = _MESH_HEADER.unpack(data[:_MESH_HEADER.size])
+    if magic != b"MSH1":
+        raise ValueError("Not a packed mesh")
+    start = _MESH_HEADER.size
+    if np is not None:
+        vertices = np.frombuffer(data, dtype="<f8", count=3 * nv, offset=start)
+        faces = np.frombuffer(data, dtype="<i4", count=3 * nf, offset=start + 24 * nv)
+        return vertices.reshape(-1, 3).tolist(), faces.reshape(-1, 3).tolist()
+    flat_v = _from_bytes("d", data[start:start + 24 * nv])
+    flat_f = _from_bytes("i", data[start + 24 * nv:start + 24 * nv + 12 * nf])
+    it_v = iter(flat_v)
+    it_f = iter(flat_f)
+    return list(map(list, zip(it_v, it_v, it_v))), list(map(list, zip(it_f, it_f, it_f)))
+
+
+def write_stl(path, patches, face_count=None):
+    """
+    Writes patches to a binary STL file. Each triangle carries its own three
+    vertices, so only the patch-local arrays are needed. If `face_count` is not
+    given, the count in the header is filled in once all patches are written.
+    """
+    record = struct.Struct("<12fH")
+    written = 0
+    with open(path, "wb") as f:
+        f.write(b"geodesic mesh".ljust(80, b" "))
+        f.write(struct.pack("<I", face_count or 0))
+        for patch in patches:
+            v = patch.vertices
+            t = patch.faces
+            chunk = []
+            for i in range(0, len(t), 3):
+                a, b, c = 3 * t[i], 3 * t[i + 1], 3 * t[i + 2]
+                ax, ay, az = v[a], v[a + 1], v[a + 2]
+                bx, by, bz = v[b], v[b + 1], v[b + 2]
+                cx, cy, cz = v[c], v[c + 1], v[c + 2]
+                ux, uy, uz = bx - ax, by - ay, bz - az
+                wx, wy, wz = cx - ax, cy - ay, cz - az
+                nx, ny, nz = uy * wz - uz * wy, uz * wx - ux * wz, ux * wy - uy * wx
+                length = math.sqrt(nx * nx + ny * ny + nz * nz) or 1.0
+                chunk.append(record.pack(nx / length, ny / length, nz / length,
+                                         ax, ay, az, bx, by, bz, cx, cy, cz, 0))
+            f.write(b"".join(chunk))
+            written += len(t) // 3
+        if face_count is None:
+            f.seek(80)
+            f.write(struct.pack("<I", written))
+    return written
+
+
+def write_ply(path, vertex_count, vertex_chunks, face_count, patches):
+    """
+    Writes a binary little-endian PLY file. PLY stores all vertices before all
+    faces, so the vertices come from `vertex_chunks` (flat array('d') buffers in
+    global index order) and the faces from the patches' global indices.
+    """
+    header = (
+        "ply\n"
+        "format binary_little_endian 1.0\n"
+        "element vertex {}\n"
+        "property float x\n"
+        "property float y\n"
+        "property float z\n"
+        "element face {}\n"
+        "property list uchar int vertex_indices\n"
+        "end_header\n"
+    ).format(vertex_count, face_count)
+    with open(path, "wb") as f:
+        f.write(header.encode("ascii"))
+        for chunk in vertex_chunks:
+            f.write(_to_bytes(array("f", chunk)))
+        for patch in patches:
+            t = patch.faces
+            g = patch.global_index
+            n = len(t) // 3
+            values = []
+            for i in range(0, len(t), 3):
+                values.extend((3, g[t[i]], g[t[i + 1]], g[t[i + 2]]))
+            f.write(struct.pack("<" + "B3i" * n, *values))
+
+
+def write_obj(path, vertex_chunks, patches):
+    """
+    Writes a Wavefront OBJ file: all vertices (from `vertex_chunks`, in global
+    index order) followed by the faces of every patch in global indices.
+    """
+    with open(path, "w") as f:
+        for chunk in vertex_chunks:
+            f.write("".join("v {:.9g} {:.9g} {:.9g}\n".format(chunk[i], chunk[i + 1], chunk[i + 2])
+                            for i in range(0, len(chunk), 3)))
+        for patch in patches:
+            t = patch.faces
+            g = patch.global_index
+            f.write("".join("f {} {} {}\n".format(g[t[i]] + 1, g[t[i + 1]] + 1, g[t[i + 2]] + 1)
+                            for i in range(0, len(t), 3)))
@@ -0,0 +1,389 @@
+"""
+Shared OpenAI HTTP client for ai_chat.py and generate_rhino_script.py.
+
+Keeps connections alive between calls so each turn does not pay a new TCP
+and TLS handshake. Uses a small pool of http.client connections on CPython
+and keep-alive WebRequests (which .NET pools per ServicePoint) on IronPython.
+Set OPENAI_BASE_URL to point the client at another server, e.g. the local
+stand-in in fake_openai_server.py.
+"""
+import json
+import os
+import socket
+import sys
+import threading
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:
+    from urlparse import urlsplit
+
+# IronPython reports "cli". The HTTP modules (http.client or System.Net) are
+# only imported when the first client is made, so a command that hands its
+# requests to generation_daemon.py never loads them
+IS_IRONPYTHON = sys.platform == "cli"
+
+httplib = None
+WebRequest = ServicePointManager = StreamReader = Encoding = None
+
+
+def _setup_http():
+    global httplib
+    if httplib is not None:
+        return
+    try:
+        import http.client as module
+    except ImportError:
+        import httplib as module
+    httplib = module
+
+
+def _setup_net():
+    global WebRequest, ServicePointManager, StreamReader, Encoding
+    if WebRequest is not None:
+        return
+    from System.Net import ServicePointManager, SecurityProtocolType
+    from System.IO import StreamReader
+    from System.Text import Encoding
+    # Ensure TLS 1.2 is enabled for OpenAI API
+    try:
+        ServicePointManager.SecurityProtocol = SecurityProtocolType.Tls12
+    except:
+        pass
+    from System.Net import WebRequest
+
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+
+class APIError(Exception):
+    """
+    The server answered with an HTTP error status.
+    """
+
+    def __init__(self, status, body, retry_after=None):
+        Exception.__init__(self, "HTTP Error: {} {}".format(status, body))
+        self.status = status
+        self.body = body
+        self.retry_after = retry_after
+
+
+class OpenAIClient(object):
+    """
+    Minimal chat-completions client that reuses its connections.
+
+    connect_timeout bounds establishing a connection and read_timeout bounds
+    each wait for response data (both in seconds). pool_size is the number of
+    idle connections kept open. keep_alive=False opens a new connection for
+    every request (the old behaviour, useful for comparison).
+    """
+
+    def __init__(self, api_key, base_url=None, connect_timeout=10.0, read_timeout=120.0,
+                 pool_size=4, keep_alive=True):
+        self.api_key = api_key
+        self.base_url = (base_url or os.getenv("OPENAI_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+        parts = urlsplit(self.base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path_prefix = parts.path
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.connections_opened = 0
+        self.requests_sent = 0
+        self._idle = []
+        self._lock = threading.Lock()
+        self._service_point_ready = False
+        if IS_IRONPYTHON:
+            _setup_net()
+        else:
+            _setup_http()
+
+    def _headers(self):
+        return {
+            "Content-Type": "application/json",
+            "Authorization": "Bearer " + self.api_key,
+        }
+
+    # CPython connection pool
+
+    def _new_connection(self):
+        if self.scheme == "https":
+            conn = httplib.HTTPSConnection(self.host, self.port, timeout=self.connect_timeout)
+        else:
+            conn = httplib.HTTPConnection(self.host, self.port, timeout=self.connect_timeout)
+        conn.connect()
+        conn.sock.settimeout(self.read_timeout)
+        conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self._lock:
+            self.connections_opened += 1
+        return conn
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._new_connection(), False
+
+    def _release(self, conn):
+        with self._lock:
+            if self.keep_alive and len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def _post(self, path, body):
+        """
+        Sends a POST and returns (connection, response) with the response body
+        still unread. A pooled connection that the server has already closed
+        is replaced by a fresh one once.
+        """
+        headers = self._headers()
+        if not self.keep_alive:
+            headers["Connection"] = "close"
+        while True:
+            conn, reused = self._acquire()
+            try:
+                conn.request("POST", self.path_prefix + path, body, headers)
+                response = conn.getresponse()
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                if reused:
+                    continue
+                raise
+            with self._lock:
+                self.requests_sent += 1
+            return conn, response
+
+    def _finish(self, conn, response):
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(conn)
+
+    def _post_json_cpython(self, path, data):
+        conn, response = self._post(path, json.dumps(data).encode("utf-8"))
+        try:
+            text = response.read().decode("utf-8")
+        except Exception:
+            conn.close()
+            raise
+        self._finish(conn, response)
+        if response.status >= 400:
+            raise APIError(response.status, text, response.getheader("Retry-After"))
+        return json.loads(text)
+
+    # .NET path: WebRequest connections are pooled per ServicePoint
+
+    def _web_request(self, path):
+        url = self.base_url + path
+        request = WebRequest.Create(url)
+        if not self._service_point_ready:
+            service_point = ServicePointManager.FindServicePoint(request.RequestUri)
+            service_point.ConnectionLimit = max(self.pool_size, 1)
+            self._service_point_ready = True
+        request.Method = "POST"
+        request.ContentType = "application/json"
+        request.Headers.Add("Authorization", "Bearer " + self.api_key)
+        request.KeepAlive = self.keep_alive
+        # Timeout covers GetResponse(), i.e. the connect and the wait for the
+        # response headers; ReadWriteTimeout bounds each read of the body
+        request.Timeout = int((self.connect_timeout + self.read_timeout) * 1000)
+        request.ReadWriteTimeout = int(self.read_timeout * 1000)
+        return request
+
+    def _send_net(self, path, data):
+        request = self._web_request(path)
+        bytes_data = Encoding.UTF8.GetBytes(json.dumps(data))
+        request.ContentLength = bytes_data.Length
+        req_stream = request.GetRequestStream()
+        req_stream.Write(bytes_data, 0, bytes_data.Length)
+        req_stream.Close()
+        try:
+            response = request.GetResponse()
+        except Exception as e:
+            # Handle WebException (HTTP errors)
+            if hasattr(e, 'Response') and e.Response:
+                reader = StreamReader(e.Response.GetResponseStream())
+                err_text = reader.ReadToEnd()
+                reader.Close()
+                status = int(e.Response.StatusCode)
+                retry_after = e.Response.Headers["Retry-After"]
+                e.Response.Close()
+                raise APIError(status, err_text, retry_after)
+            raise
+        with self._lock:
+            self.requests_sent += 1
+        return response
+
+    def _post_json_net(self, path, data):
+        response = self._send_net(path, data)
+        reader = StreamReader(response.GetResponseStream())
+        try:
+            # Reading to the end and closing hands the connection back to the pool
+            response_text = reader.ReadToEnd()
+        finally:
+            reader.Close()
+            response.Close()
+        return json.loads(response_text)
+
+    def post_json(self, path, data):
+        """
+        POSTs `data` as JSON to base_url + path and returns the decoded reply.
+        Raises APIError for HTTP error statuses.
+        """
+        if IS_IRONPYTHON:
+            return self._post_json_net(path, data)
+        return self._post_json_cpython(path, data)
+
+    def chat_completion(self, data):
+        return self.post_json("/chat/completions", data)
+
+    def _stream_lines_cpython(self, path, data):
+        conn, response = self._post(path, json.dumps(data).encode("utf-8"))
+        if response.status >= 400:
+            text = response.read().decode("utf-8")
+            self._finish(conn, response)
+            raise APIError(response.status, text, response.getheader("Retry-After"))
+        finished = False
+        try:
+            while True:
+                line = response.readline()
+                if not line:
+                    break
+                yield line.decode("utf-8")
+            finished = True
+        finally:
+            if finished:
+                self._finish(conn, response)
+            else:
+                # Abandoned mid-stream: the connection cannot be reused
+                conn.close()
+
+    def _stream_lines_net(self, path, data):
+        response = self._send_net(path, data)
+        reader = StreamReader(response.GetResponseStream())
+        try:
+            while True:
+                line = reader.ReadLine()
+                if line is None:
+                    break
+                yield line
+        finally:
+            reader.Close()
+            response.Close()
+
+    def stream_chat_completion(self, data):
+        """
+        Sends the request with "stream": true and yields the content of each
+        server-sent-event delta as soon as it arrives.
+        """
+        data = dict(data)
+        data["stream"] = True
+        if IS_IRONPYTHON:
+            lines = self._stream_lines_net("/chat/completions", data)
+        else:
+            lines = self._stream_lines_cpython("/chat/completions", data)
+        for payload in iter_sse_data(lines):
+            if payload == "[DONE]":
+                # Read on to the end of the body so the connection can be reused
+                continue
+            event = json.loads(payload)
+            for choice in event.get("choices", []):
+                content = (choice.get("delta") or {}).get("content")
+                if content:
+                    yield content
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+def iter_sse_data(lines):
+    """
+    Yields the data field of each server-sent event in a sequence of lines.
+    Multi-line data fields are joined with newlines; comments are skipped.
+    """
+    data = []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line:
+            if data:
+                yield "\n".join(data)
+                data = []
+            continue
+        if line.startswith(":"):
+            continue
+        if line.startswith("data:"):
+            value = line[5:]
+            if value.startswith(" "):
+                value = value[1:]
+            data.append(value)
+    if data:
+        yield "\n".join(data)
+
+
+class FenceStripper(object):
+    """
+    Removes ``` fence lines from streamed text on the fly. Text is passed
+    through as soon as its line can no longer turn out to be a fence, so
+    ordinary code is echoed token by token.
+    """
+
+    def __init__(self):
+        self._held = ""
+        self._passing = False
+
+    def feed(self, text):
+        out = []
+        for i, part in enumerate(text.split("\n")):
+            if i > 0:
+                # A newline ends the current line; fence lines are dropped whole
+                if self._passing:
+                    out.append("\n")
+                elif not self._held.lstrip().startswith("```"):
+                    out.append(self._held + "\n")
+                self._held = ""
+                self._passing = False
+            if not part:
+                continue
+            if self._passing:
+                out.append(part)
+                continue
+            self._held += part
+            stripped = self._held.lstrip()
+            if not stripped.startswith("```") and not "```".startswith(stripped):
+                out.append(self._held)
+                self._held = ""
+                self._passing = True
+        return "".join(out)
+
+    def flush(self):
+        out = ""
+        if not self._held.lstrip().startswith("```"):
+            out = self._held
+        self._held = ""
+        self._passing = False
+        return out
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_key, base_url=None):
+    """
+    Returns the shared client for this key and base URL, so every call in the
+    process reuses the same connection pool.
+    """
+    key = (api_key, base_url or os.getenv("OPENAI_BASE_URL") or DEFAULT_BASE_URL)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = OpenAIClient(api_key, base_url=key[1])
+            _clients[key] = client
+        return client
@@ -0,0 +1,133 @@
+"""
+Local cache of model replies, keyed on a normalized hash of the request.
+
+Requests that differ only in case, spacing, trailing punctuation or number
+formatting ("Make a dome, radius 10.0!" vs "make a dome radius 10") share
+one entry. Entries live in memory and on disk (see disk_cache.DiskCache),
+expire after a TTL and are evicted least-recently-used past a size limit.
+"""
+import hashlib
+import json
+import re
+import time
+import unicodedata
+
+import disk_cache
+
+_SPACE_RE = re.compile(r"\s+")
+_TRAILING_ZEROS_RE = re.compile(r"(\d+)\.0+\b")
+_PUNCTUATION_RE = re.compile(r"\s*([,;:!?.])(?=\s|$)")
+
+
+def _text(value):
+    if not isinstance(value, type(u"")):
+        value = value.decode("utf-8")
+    return unicodedata.normalize("NFKC", value)
+
+
+def normalize_prompt(text):
+    """
+    Canonical form of a user prompt: case-folded, single-spaced, without
+    punctuation before spaces or at the end, and with 10.0 written as 10.
+    """
+    text = _text(text).lower()
+    text = _TRAILING_ZEROS_RE.sub(r"\1", text)
+    text = _PUNCTUATION_RE.sub("", text)
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def normalize_messages(messages):
+    """
+    User prompts are normalized with normalize_prompt; system and assistant
+    messages (code) only have trailing whitespace removed from each line.
+    """
+    normalized = []
+    for message in messages:
+        content = message.get("content") or ""
+        if message.get("role") == "user":
+            content = normalize_prompt(content)
+        else:
+            content = "\n".join(line.rstrip() for line in _text(content).strip().splitlines())
+        normalized.append([message.get("role"), content])
+    return normalized
+
+
+def request_key(data):
+    """
+    Cache key for a chat-completions request body: model, system prompt,
+    message history and temperature, after normalization.
+    """
+    messages = data.get("messages", [])
+    system = [m for m in messages if m.get("role") == "system"]
+    history = [m for m in messages if m.get("role") != "system"]
+    payload = {
+        "model": data.get("model"),
+        "system": normalize_messages(system),
+        "messages": normalize_messages(history),
+        "temperature": round(float(data.get("temperature", 1.0)), 3),
+    }
+    text = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ResponseCache(object):
+    """
+    Reply cache for chat-completions requests. Lookups are served from
+    memory after the first disk read of an entry.
+    """
+
+    def __init__(self, ttl=7 * 24 * 3600, max_bytes=32 * 1024 * 1024, max_memory_entries=256,
+                 directory=None):
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.store = disk_cache.DiskCache("responses", max_bytes=max_bytes, directory=directory)
+        self.hits = 0
+        self.misses = 0
+        self._memory = {}
+
+    def _remember(self, key, entry):
+        if len(self._memory) >= self.max_memory_entries:
+            self._memory.pop(next(iter(self._memory)))
+        self._memory[key] = entry
+
+    def get(self, data):
+        """
+        Returns the cached reply for a request body, or None.
+        """
+        key = request_key(data)
+        entry = self._memory.get(key)
+        if entry is None:
+            raw = self.store.get(key)
+            if raw is not None:
+                try:
+                    entry = json.loads(raw.decode("utf-8"))
+                except ValueError:
+                    entry = None
+                if entry is not None:
+                    self._remember(key, entry)
+        if entry is None or time.time() - entry["created"] > self.ttl:
+            self._memory.pop(key, None)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry["response"]
+
+    def put(self, data, response):
+        key = request_key(data)
+        entry = {"created": time.time(), "response": response}
+        self._remember(key, entry)
+        self.store.put(key, json.dumps(entry).encode("utf-8"))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": float(self.hits) / lookups if lookups else 0.0,
+            "entries": self.store.stats()["entries"],
+        }
+
+    def format_stats(self):
+        s = self.stats()
+        return "Response cache: {} hits, {} misses ({:.0%} hit rate)".format(
+            s["hits"], s["misses"], s["hit_rate"])
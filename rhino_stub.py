@@ -0,0 +1,377 @@
+"""
+Stand-ins for rhinoscriptsyntax, scriptcontext, Rhino and System under plain CPython.
+
+Lets generated and bundled scripts run outside Rhino, e.g. to dry-run a
+generated script before offering it to the user. Geometry is not computed:
+Add* functions return new object IDs recorded in a StubDocument, prompts
+return their default values (picks return placeholder objects), and any function the stub does not know
+returns a new ID so unfamiliar calls do not stop the run.
+
+    with rhino_stub.installed() as doc:
+        exec(code, {"__name__": "__main__"})
+    print(doc.created, doc.deleted)
+"""
+import math
+import sys
+import types
+import uuid
+
+
+class Point3d(object):
+    """
+    Minimal Rhino.Geometry.Point3d / Vector3d replacement.
+    """
+
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.X = float(x)
+        self.Y = float(y)
+        self.Z = float(z)
+
+    @property
+    def Length(self):
+        return math.sqrt(self.X * self.X + self.Y * self.Y + self.Z * self.Z)
+
+    def __add__(self, other):
+        other = coerce_point(other)
+        return Point3d(self.X + other.X, self.Y + other.Y, self.Z + other.Z)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        other = coerce_point(other)
+        return Point3d(self.X - other.X, self.Y - other.Y, self.Z - other.Z)
+
+    def __rsub__(self, other):
+        return coerce_point(other) - self
+
+    def __mul__(self, s):
+        if isinstance(s, Point3d):
+            return self.X * s.X + self.Y * s.Y + self.Z * s.Z
+        return Point3d(self.X * s, self.Y * s, self.Z * s)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, s):
+        return Point3d(self.X / s, self.Y / s, self.Z / s)
+
+    __div__ = __truediv__
+
+    def __neg__(self):
+        return Point3d(-self.X, -self.Y, -self.Z)
+
+    def __getitem__(self, i):
+        return (self.X, self.Y, self.Z)[i]
+
+    def __iter__(self):
+        return iter((self.X, self.Y, self.Z))
+
+    def __len__(self):
+        return 3
+
+    def __repr__(self):
+        return "Point3d({}, {}, {})".format(self.X, self.Y, self.Z)
+
+
+def coerce_point(p):
+    if isinstance(p, Point3d):
+        return p
+    if p is None:
+        raise ValueError("point is None")
+    p = list(p)
+    while len(p) < 3:
+        p.append(0.0)
+    return Point3d(p[0], p[1], p[2])
+
+
+class StubDocument(object):
+    """
+    Records the objects the stub functions create and delete, and the cost of
+    each kind of call: costs[name] = [calls, units], where units measure the
+    work Rhino would do (mesh vertices, boolean inputs, ...; 1 by default).
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.objects = {}
+        self.created = 0
+        self.deleted = 0
+        self.last_created = []
+        self.calls = []
+        self.costs = {}
+
+    def record(self, name, units=1):
+        cost = self.costs.get(name)
+        if cost is None:
+            cost = self.costs[name] = [0, 0]
+        cost[0] += 1
+        cost[1] += units
+
+    def add(self, kind, *data, **kwargs):
+        object_id = str(uuid.uuid4())
+        self.objects[object_id] = (kind, data)
+        self.created += 1
+        self.last_created = [object_id]
+        self.record(kind, kwargs.get("units", 1))
+        return object_id
+
+    def delete(self, object_id):
+        if object_id in self.objects:
+            del self.objects[object_id]
+            self.deleted += 1
+            return True
+        return False
+
+
+class _Anything(object):
+    """
+    Permissive placeholder for RhinoCommon objects: every attribute, call and
+    index returns another placeholder.
+    """
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return _Anything()
+
+    def __call__(self, *args, **kwargs):
+        return _Anything()
+
+    def __getitem__(self, key):
+        return _Anything()
+
+    def __iter__(self):
+        return iter(())
+
+    def __bool__(self):
+        return True
+
+    __nonzero__ = __bool__
+
+
+class _StubModule(types.ModuleType):
+    """
+    Module whose unknown attributes are functions that record the call and
+    return a new object ID.
+    """
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        doc = self.__dict__["_doc"]
+
+        def unknown(*args, **kwargs):
+            doc.calls.append(name)
+            return doc.add(name)
+
+        unknown.__name__ = name
+        return unknown
+
+
+def make_rhinoscriptsyntax(doc):
+    """
+    Builds a stub rhinoscriptsyntax module bound to `doc`.
+    """
+    rs = _StubModule("rhinoscriptsyntax")
+    rs._doc = doc
+
+    def vector(v):
+        return coerce_point(v)
+
+    # Vectors and points
+    rs.coerce3dpoint = lambda p, raise_on_error=False: coerce_point(p)
+    rs.coerce3dvector = lambda v, raise_on_error=False: coerce_point(v)
+    rs.CreatePoint = lambda x, y=None, z=None: coerce_point(x) if y is None else Point3d(x, y, z or 0.0)
+    rs.CreateVector = rs.CreatePoint
+    rs.VectorCreate = lambda to_point, from_point: vector(to_point) - vector(from_point)
+    rs.VectorAdd = lambda a, b: vector(a) + vector(b)
+    rs.VectorSubtract = lambda a, b: vector(a) - vector(b)
+    rs.VectorScale = lambda v, s: vector(v) * s
+    rs.VectorLength = lambda v: vector(v).Length
+    rs.VectorDotProduct = lambda a, b: vector(a) * vector(b)
+    rs.VectorReverse = lambda v: -vector(v)
+    rs.PointAdd = rs.VectorAdd
+    rs.PointSubtract = rs.VectorSubtract
+    rs.Distance = lambda a, b: (vector(a) - vector(b)).Length
+
+    def unitize(v):
+        v = vector(v)
+        length = v.Length
+        return v / length if length else None
+
+    def cross(a, b):
+        a, b = vector(a), vector(b)
+        return Point3d(a.Y * b.Z - a.Z * b.Y, a.Z * b.X - a.X * b.Z, a.X * b.Y - a.Y * b.X)
+
+    rs.VectorUnitize = unitize
+    rs.VectorCrossProduct = cross
+    rs.WorldXYPlane = lambda: [Point3d(), Point3d(1, 0, 0), Point3d(0, 1, 0), Point3d(0, 0, 1)]
+
+    # Prompts answer with their defaults
+    rs.GetReal = lambda message=None, number=None, minimum=None, maximum=None: number
+    rs.GetInteger = lambda message=None, number=None, minimum=None, maximum=None: number
+    rs.GetString = lambda message=None, defaultString=None, strings=None: defaultString
+    rs.GetBoolean = lambda message=None, items=None, defaults=None: defaults
+    # Picks return a placeholder object or the origin
+    rs.GetObject = lambda *args, **kwargs: doc.add("Picked")
+    rs.GetObjects = lambda *args, **kwargs: [doc.add("Picked")]
+    rs.GetPoint = lambda *args, **kwargs: Point3d()
+    rs.GetPoints = lambda *args, **kwargs: [Point3d(), Point3d(1, 0, 0), Point3d(1, 1, 0)]
+
+    # Document objects
+    def delete_object(object_id):
+        return doc.delete(object_id)
+
+    def delete_objects(object_ids):
+        return len([i for i in list(object_ids or []) if doc.delete(i)])
+
+    def _count(items):
+        if items is None:
+            return 0
+        if isinstance(items, (list, tuple)):
+            return len(items)
+        return 1
+
+    def combine(kind):
+        # Booleans and joins are no-ops; their cost is the number of inputs
+        def boolean(*args, **kwargs):
+            inputs = [a for a in args if isinstance(a, (list, tuple, str))]
+            return [doc.add(kind, units=sum(_count(a) for a in inputs) or 1)]
+        return boolean
+
+    def add_mesh(vertices, face_vertices, *args, **kwargs):
+        # The data keeps the counts for benchmark_suite.py
+        return doc.add("AddMesh", len(vertices), len(face_vertices), units=len(vertices))
+
+    rs.DeleteObject = delete_object
+    rs.DeleteObjects = delete_objects
+    rs.IsObject = lambda object_id: object_id in doc.objects
+    rs.AllObjects = lambda *args, **kwargs: list(doc.objects)
+    rs.LastCreatedObjects = lambda select=False: list(doc.last_created)
+    rs.BooleanUnion = combine("BooleanUnion")
+    rs.BooleanDifference = combine("BooleanDifference")
+    rs.BooleanIntersection = combine("BooleanIntersection")
+    rs.JoinCurves = combine("JoinCurves")
+    rs.AddMesh = add_mesh
+    rs.JoinMeshes = lambda object_ids, delete_input=False: doc.add("JoinMeshes", units=_count(object_ids))
+    rs.AddLoftSrf = combine("AddLoftSrf")
+    rs.CurveDomain = lambda curve_id, segment_index=-1: [0.0, 1.0]
+
+    def command(command_string, echo=True):
+        doc.calls.append("Command")
+        doc.add("Command", command_string)
+        return True
+
+    # Objects made by scripted commands are reported by LastCreatedObjects
+    rs.Command = command
+
+    # Display and selection do nothing
+    for name in ("EnableRedraw", "Redraw", "SelectObject", "SelectObjects",
+                 "UnselectAllObjects", "ZoomExtents", "Prompt", "MessageBox"):
+        setattr(rs, name, lambda *args, **kwargs: True)
+    # Geometry behind an ID is a placeholder
+    for name in ("coercebrep", "coercecurve", "coercemesh", "coercesurface", "coercegeometry"):
+        setattr(rs, name, lambda *args, **kwargs: _Anything())
+    rs.CapPlanarHoles = lambda surface_id: True
+    rs.IsBlock = lambda name: False
+    return rs
+
+
+class _StubObjectTable(object):
+    """
+    sc.doc.Objects: Add* methods add an object to the StubDocument, anything
+    else is a placeholder.
+    """
+
+    def __init__(self, doc):
+        self._doc = doc
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        if not name.startswith("Add"):
+            return _Anything()
+        doc = self._doc
+
+        def add(*args, **kwargs):
+            doc.calls.append("Objects." + name)
+            return doc.add("Objects." + name)
+        return add
+
+
+class _StubRhinoDoc(_Anything):
+    ModelAbsoluteTolerance = 0.001
+    ModelAngleToleranceRadians = math.radians(1.0)
+
+    def __init__(self, doc):
+        self.Objects = _StubObjectTable(doc)
+
+
+def make_scriptcontext(doc):
+    sc = types.ModuleType("scriptcontext")
+    sc.doc = _StubRhinoDoc(doc)
+    sc.sticky = {}
+    sc.id = 1
+    return sc
+
+
+class _PermissiveModule(types.ModuleType):
+    """
+    Module whose unknown attributes are _Anything placeholders.
+    """
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return _Anything()
+
+
+# RhinoCommon and .NET namespaces scripts import; all resolve to placeholders
+PERMISSIVE_MODULES = ("Rhino", "Rhino.Geometry", "Rhino.Input", "Rhino.Input.Custom",
+                      "Rhino.Commands", "Rhino.DocObjects", "Rhino.FileIO", "System",
+                      "System.Drawing", "System.Collections", "System.Collections.Generic")
+
+
+def make_permissive_modules():
+    """
+    Placeholder modules for PERMISSIVE_MODULES, linked as parent attributes.
+    """
+    modules = {}
+    for name in PERMISSIVE_MODULES:
+        modules[name] = _PermissiveModule(name)
+        parent, _, child = name.rpartition(".")
+        if parent:
+            setattr(modules[parent], child, modules[name])
+    modules["Rhino.Geometry"].Point3d = Point3d
+    modules["Rhino.Geometry"].Vector3d = Point3d
+    return modules
+
+
+class installed(object):
+    """
+    Context manager that puts the stub modules into sys.modules (replacing
+    any real ones) and restores the previous modules afterwards. Yields the
+    StubDocument the stubs record into.
+    """
+
+    MODULES = ("rhinoscriptsyntax", "scriptcontext") + PERMISSIVE_MODULES
+
+    def __init__(self, doc=None):
+        self.doc = doc or StubDocument()
+        self._saved = {}
+
+    def __enter__(self):
+        for name in self.MODULES:
+            self._saved[name] = sys.modules.get(name)
+        sys.modules.update(make_permissive_modules())
+        sys.modules["rhinoscriptsyntax"] = make_rhinoscriptsyntax(self.doc)
+        sys.modules["scriptcontext"] = make_scriptcontext(self.doc)
+        return self.doc
+
+    def __exit__(self, *exc):
+        for name, module in self._saved.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
@@ -0,0 +1,306 @@
+"""
+Opt-in per-call profiler for rhinoscriptsyntax.
+
+While installed, `import rhinoscriptsyntax` returns a proxy module that
+times every function call and counts the document objects created and
+deleted during it (from RhinoDoc events inside Rhino, from the stub
+document under plain CPython). The report lists, per function, the call
+count, cumulative, mean and 95th percentile time and objects created and
+deleted, plus the time spent outside rs calls.
+
+Profile a script from the command line (rhino_stub is used when
+rhinoscriptsyntax is not available) or run this file in Rhino to pick one:
+
+    python rs_profiler.py geodesic_dome.py --save dome_profile.json
+
+or from code:
+
+    profiler = rs_profiler.profile_script("script_3.py")
+    print(profiler.format_report())
+"""
+import json
+import math
+import os
+import sys
+import time
+import types
+
+# time.perf_counter is not available on IronPython 2.7
+_clock = getattr(time, "perf_counter", time.time)
+
+
+class _StubCounter(object):
+    """
+    Object counts from a rhino_stub.StubDocument.
+    """
+
+    def __init__(self, doc):
+        self.doc = doc
+
+    @property
+    def created(self):
+        return self.doc.created
+
+    @property
+    def deleted(self):
+        return self.doc.deleted
+
+    def close(self):
+        pass
+
+
+class _RhinoDocCounter(object):
+    """
+    Object counts from the RhinoDoc add/delete events.
+    """
+
+    def __init__(self):
+        import Rhino
+        self._rhino = Rhino
+        self.created = 0
+        self.deleted = 0
+        Rhino.RhinoDoc.AddRhinoObject += self._on_add
+        Rhino.RhinoDoc.DeleteRhinoObject += self._on_delete
+
+    def _on_add(self, sender, e):
+        self.created += 1
+
+    def _on_delete(self, sender, e):
+        self.deleted += 1
+
+    def close(self):
+        self._rhino.RhinoDoc.AddRhinoObject -= self._on_add
+        self._rhino.RhinoDoc.DeleteRhinoObject -= self._on_delete
+
+
+class _NullCounter(object):
+    created = 0
+    deleted = 0
+
+    def close(self):
+        pass
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    rank = int(math.ceil(fraction * len(sorted_values))) - 1
+    return sorted_values[max(0, min(rank, len(sorted_values) - 1))]
+
+
+def format_report(report, limit=20):
+    """
+    Text table for a report dict (Profiler.to_dict or a saved JSON report).
+    """
+    elapsed = report["elapsed"] or 1e-12
+    lines = []
+    if report["script"]:
+        lines.append("Profile of " + report["script"])
+    lines.append("{:<28} {:>7} {:>10} {:>9} {:>9} {:>6} {:>8} {:>8}".format(
+        "function", "calls", "total ms", "mean ms", "p95 ms", "%", "created", "deleted"))
+    functions = sorted(report["functions"].items(), key=lambda item: -item[1]["total"])
+    for name, f in functions[:limit]:
+        lines.append("{:<28} {:>7} {:>10.2f} {:>9.3f} {:>9.3f} {:>6.1f} {:>8} {:>8}".format(
+            name, f["calls"], f["total"] * 1000, f["mean"] * 1000, f["p95"] * 1000,
+            100.0 * f["total"] / elapsed, f["created"], f["deleted"]))
+    if len(functions) > limit:
+        lines.append("... {} more functions".format(len(functions) - limit))
+    lines.append("rs calls {:.2f} ms, other Python {:.2f} ms, total {:.2f} ms".format(
+        report["rs_time"] * 1000, report["other_time"] * 1000, report["elapsed"] * 1000))
+    lines.append("objects created {}, deleted {}".format(report["created"], report["deleted"]))
+    return "\n".join(lines)
+
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+class CallStats(object):
+    def __init__(self, name):
+        self.name = name
+        self.times = []
+        self.created = 0
+        self.deleted = 0
+
+    @property
+    def calls(self):
+        return len(self.times)
+
+    @property
+    def total(self):
+        return sum(self.times)
+
+    def to_dict(self):
+        times = sorted(self.times)
+        return {
+            "calls": len(times),
+            "total": self.total,
+            "mean": self.total / len(times) if times else 0.0,
+            "p95": percentile(times, 0.95),
+            "max": times[-1] if times else 0.0,
+            "created": self.created,
+            "deleted": self.deleted,
+        }
+
+
+class _ProfiledModule(types.ModuleType):
+    """
+    Stands in for rhinoscriptsyntax; functions are wrapped on first access.
+    """
+
+    def __init__(self, module, profiler):
+        types.ModuleType.__init__(self, module.__name__)
+        self.__dict__["_module"] = module
+        self.__dict__["_profiler"] = profiler
+
+    def __getattr__(self, name):
+        value = getattr(self.__dict__["_module"], name)
+        if callable(value) and not isinstance(value, (type, types.ModuleType)) and not name.startswith("_"):
+            value = self.__dict__["_profiler"].wrap(name, value)
+        self.__dict__[name] = value
+        return value
+
+
+class Profiler(object):
+    """
+    Collects per-function statistics for rhinoscriptsyntax calls between
+    install() and uninstall().
+    """
+
+    def __init__(self):
+        self.stats = {}
+        self.counter = _NullCounter()
+        self.start_time = None
+        self.elapsed = 0.0
+        self.label = None
+        self._saved_module = None
+
+    def wrap(self, name, function):
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = CallStats(name)
+        profiler = self
+
+        def profiled(*args, **kwargs):
+            counter = profiler.counter
+            created, deleted = counter.created, counter.deleted
+            start = _clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stats.times.append(_clock() - start)
+                stats.created += counter.created - created
+                stats.deleted += counter.deleted - deleted
+
+        profiled.__name__ = name
+        profiled.__doc__ = getattr(function, "__doc__", None)
+        return profiled
+
+    def install(self):
+        """
+        Replaces rhinoscriptsyntax in sys.modules with the profiling proxy.
+        Scripts must import it after this call.
+        """
+        import rhinoscriptsyntax
+        self._saved_module = sys.modules["rhinoscriptsyntax"]
+        doc = getattr(rhinoscriptsyntax, "_doc", None)
+        if doc is not None:
+            self.counter = _StubCounter(doc)
+        else:
+            try:
+                self.counter = _RhinoDocCounter()
+            except Exception:
+                self.counter = _NullCounter()
+        sys.modules["rhinoscriptsyntax"] = _ProfiledModule(rhinoscriptsyntax, self)
+        self.start_time = _clock()
+        return self
+
+    def uninstall(self):
+        if self.start_time is not None:
+            self.elapsed += _clock() - self.start_time
+            self.start_time = None
+        if self._saved_module is not None:
+            sys.modules["rhinoscriptsyntax"] = self._saved_module
+            self._saved_module = None
+        self.counter.close()
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, *exc):
+        self.uninstall()
+
+    def to_dict(self):
+        functions = dict((name, s.to_dict()) for name, s in self.stats.items() if s.calls)
+        rs_time = sum(f["total"] for f in functions.values())
+        return {
+            "script": self.label,
+            "elapsed": self.elapsed,
+            "rs_time": rs_time,
+            "other_time": max(self.elapsed - rs_time, 0.0),
+            "created": sum(f["created"] for f in functions.values()),
+            "deleted": sum(f["deleted"] for f in functions.values()),
+            "functions": functions,
+        }
+
+    def format_report(self, limit=20):
+        return format_report(self.to_dict(), limit)
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+        return path
+
+
+def profile_script(path, namespace=None):
+    """
+    Runs the script at `path` with the profiler installed (and rhino_stub when
+    rhinoscriptsyntax cannot be imported) and returns the Profiler.
+    Exceptions from the script propagate after the profile is complete.
+    """
+    stub = None
+    try:
+        import rhinoscriptsyntax
+    except ImportError:
+        import rhino_stub
+        stub = rhino_stub.installed()
+        stub.__enter__()
+    script_dir = os.path.dirname(os.path.abspath(path))
+    if script_dir not in sys.path:
+        sys.path.append(script_dir)
+    profiler = Profiler()
+    profiler.label = os.path.basename(path)
+    if namespace is None:
+        namespace = {"__name__": "__main__", "__file__": path}
+    try:
+        with open(path) as f:
+            code = compile(f.read(), path, "exec")
+        with profiler:
+            try:
+                exec(code, namespace)
+            except SystemExit:
+                pass
+    finally:
+        if stub is not None:
+            stub.__exit__(None, None, None)
+    return profiler
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    save_path = None
+    if "--save" in args:
+        i = args.index("--save")
+        save_path = args[i + 1]
+        del args[i:i + 2]
+    if not args:
+        # Run from Rhino's script editor: pick the script to profile
+        import rhinoscriptsyntax as rs
+        picked = rs.OpenFileName("Script to profile", "Python scripts (*.py)|*.py||")
+        args = [picked] if picked else []
+    for script_path in args:
+        profiler = profile_script(os.path.abspath(script_path))
+        print(profiler.format_report())
+        if save_path:
+            print("Saved " + profiler.save(save_path))
@@ -0,0 +1,368 @@
+"""
+Runs a generated script with a wall-clock timeout and a memory cap, and
+reports its output, traceback, run time and peak memory.
+
+Under CPython the script runs in a worker subprocess (this file with
+--worker). The memory cap is applied with resource.setrlimit where available
+(POSIX), and rhino_stub stands in for rhinoscriptsyntax when the real module
+cannot be imported. A script that runs past the timeout is killed.
+
+Inside Rhino the script needs the document, so it runs in-process on the
+calling thread. A watchdog thread aborts it on timeout or when Rhino's
+working set grows past the cap. On .NET Core, where Thread.Abort is not
+supported, a trace function stops it instead.
+
+    result = script_runner.run_script("script_3.py", timeout=30)
+    print(result.status, result.duration, result.peak_memory)
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import System
+    from System.Diagnostics import Process
+    from System.Threading import Thread
+    IS_IRONPYTHON = True
+except ImportError:
+    IS_IRONPYTHON = False
+
+# time.perf_counter is not available on IronPython 2.7
+_clock = getattr(time, "perf_counter", time.time)
+
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_MEMORY_LIMIT = 2 * 1024 * 1024 * 1024
+
+# Longest traceback (in lines) sent back to the model
+MAX_TRACEBACK_LINES = 20
+
+
+class RunResult(object):
+    """
+    Outcome of run_script. `status` is "ok", "error", "timeout" or "memory".
+    peak_memory is in bytes: the worker's peak resident set under CPython, or
+    the growth of Rhino's working set during the run; None if unknown.
+    """
+
+    def __init__(self, status, duration, stdout="", traceback=None, peak_memory=None,
+                 returncode=0):
+        self.status = status
+        self.duration = duration
+        self.stdout = stdout
+        self.traceback = traceback
+        self.peak_memory = peak_memory
+        self.returncode = returncode
+        self.profile_path = None
+        # Objects added to the rhino_stub document (worker runs with the stub only)
+        self.objects_created = None
+
+    @property
+    def ok(self):
+        return self.status == "ok"
+
+    def error_message(self):
+        """
+        Short description of the failure for the console and the model.
+        """
+        if self.status == "timeout":
+            return "The script did not finish within {:.0f} seconds (possible infinite loop).".format(
+                self.duration)
+        if self.status == "memory":
+            return "The script ran out of memory (limit reached)."
+        if self.traceback:
+            lines = self.traceback.strip().splitlines()
+            return "\n".join(lines[-MAX_TRACEBACK_LINES:])
+        if self.status == "error":
+            return "The script worker exited with code {}.".format(self.returncode)
+        return None
+
+    def to_record(self):
+        return {
+            "status": self.status,
+            "duration": round(self.duration, 4),
+            "peak_memory": self.peak_memory,
+            "stdout": self.stdout[-10000:],
+            "traceback": self.traceback,
+            "profile": self.profile_path,
+        }
+
+
+def _max_rss():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _format_script_traceback():
+    # Leave out the runner's own frame
+    etype, value, tb = sys.exc_info()
+    return "".join(traceback.format_exception(etype, value, tb.tb_next or tb))
+
+
+def _start_profiler(path, profile_path):
+    if not profile_path:
+        return None
+    import rs_profiler
+    profiler = rs_profiler.Profiler()
+    profiler.label = os.path.basename(path)
+    return profiler.install()
+
+
+def _save_profile(profiler, profile_path):
+    if profiler is not None:
+        profiler.uninstall()
+        profiler.save(profile_path)
+
+
+def _run_worker(path, result_path, memory_limit, use_stub, profile_path=None):
+    """
+    Body of the worker subprocess: runs the script and writes a JSON result.
+    """
+    if memory_limit and resource is not None and hasattr(resource, "RLIMIT_AS"):
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+        except (ValueError, OSError):
+            pass
+    doc = None
+    if use_stub:
+        try:
+            import rhinoscriptsyntax
+        except ImportError:
+            import rhino_stub
+            doc = rhino_stub.installed().__enter__()
+
+    script_dir = os.path.dirname(os.path.abspath(path))
+    if script_dir not in sys.path:
+        sys.path.insert(0, script_dir)
+    status = "ok"
+    tb = None
+    start = _clock()
+    try:
+        with open(path) as f:
+            code = compile(f.read(), path, "exec")
+        profiler = _start_profiler(path, profile_path)
+        try:
+            exec(code, {"__name__": "__main__", "__file__": path})
+        finally:
+            _save_profile(profiler, profile_path)
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            status = "error"
+            tb = "SystemExit: {}".format(e.code)
+    except MemoryError:
+        status = "memory"
+        tb = _format_script_traceback()
+    except BaseException:
+        status = "error"
+        tb = _format_script_traceback()
+    duration = _clock() - start
+    sys.stdout.flush()
+    with open(result_path, "w") as f:
+        json.dump({"status": status, "traceback": tb, "duration": duration,
+                   "peak_memory": _max_rss(),
+                   "objects_created": doc.created if doc is not None else None}, f)
+
+
+def _run_subprocess(path, timeout, memory_limit, use_stub, echo, profile_path):
+    fd, result_path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    command = [sys.executable, "-u", os.path.abspath(__file__), "--worker", path, result_path,
+               str(memory_limit or 0)]
+    if use_stub:
+        command.append("--stub")
+    if profile_path:
+        command.append("--profile=" + os.path.abspath(profile_path))
+    env = dict(os.environ)
+    # The worker imports rhino_stub from this folder
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.dirname(os.path.abspath(__file__))] + [p for p in [env.get("PYTHONPATH")] if p])
+
+    start = _clock()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               cwd=os.path.dirname(os.path.abspath(path)), env=env)
+    timed_out = []
+
+    def kill():
+        timed_out.append(True)
+        try:
+            process.kill()
+        except OSError:
+            pass
+
+    timer = threading.Timer(timeout, kill) if timeout else None
+    if timer:
+        timer.daemon = True
+        timer.start()
+    output = []
+    try:
+        for line in iter(process.stdout.readline, b""):
+            text = line.decode("utf-8", "replace")
+            output.append(text)
+            if echo:
+                sys.stdout.write(text)
+        process.wait()
+    finally:
+        if timer:
+            timer.cancel()
+    duration = _clock() - start
+
+    try:
+        with open(result_path) as f:
+            worker = json.load(f)
+    except (IOError, OSError, ValueError):
+        worker = None
+    try:
+        os.remove(result_path)
+    except OSError:
+        pass
+
+    stdout = "".join(output)
+    if timed_out:
+        return RunResult("timeout", duration, stdout, returncode=process.returncode)
+    if worker is None:
+        return RunResult("error", duration, stdout, returncode=process.returncode)
+    result = RunResult(worker["status"], worker["duration"], stdout, worker["traceback"],
+                       worker["peak_memory"], process.returncode)
+    result.objects_created = worker.get("objects_created")
+    return result
+
+
+class _Tee(object):
+    def __init__(self, stream):
+        self.stream = stream
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+        self.stream.write(text)
+
+    def flush(self):
+        if hasattr(self.stream, "flush"):
+            self.stream.flush()
+
+
+class _Cancelled(Exception):
+    pass
+
+
+def _run_in_process(path, timeout, memory_limit, echo, profile_path):
+    process = Process.GetCurrentProcess()
+    process.Refresh()
+    start_memory = process.WorkingSet64
+    target = Thread.CurrentThread
+    # Thread.Abort throws PlatformNotSupportedException on .NET Core (Rhino 8)
+    can_abort = System.Environment.Version.Major < 5
+    lock = threading.Lock()
+    state = {"finished": False, "stop": None, "peak": 0}
+
+    def stop(reason):
+        with lock:
+            if state["finished"] or state["stop"]:
+                return
+            state["stop"] = reason
+            if can_abort:
+                target.Abort()
+
+    def watchdog():
+        deadline = time.time() + timeout if timeout else None
+        while not state["finished"]:
+            process.Refresh()
+            state["peak"] = max(state["peak"], process.WorkingSet64 - start_memory)
+            if memory_limit and state["peak"] > memory_limit:
+                stop("memory")
+                return
+            if deadline and time.time() > deadline:
+                stop("timeout")
+                return
+            time.sleep(0.1)
+
+    def trace(frame, event, arg):
+        if state["stop"]:
+            raise _Cancelled(state["stop"])
+        return trace
+
+    script_dir = os.path.dirname(os.path.abspath(path))
+    if script_dir not in sys.path:
+        sys.path.append(script_dir)
+    old_stdout = sys.stdout
+    tee = _Tee(old_stdout) if echo else _Tee(open(os.devnull, "w"))
+    status = "ok"
+    tb = None
+    thread = threading.Thread(target=watchdog)
+    thread.daemon = True
+    start = _clock()
+    try:
+        sys.stdout = tee
+        if not can_abort:
+            sys.settrace(trace)
+        thread.start()
+        try:
+            with open(path) as f:
+                code = compile(f.read(), path, "exec")
+            profiler = _start_profiler(path, profile_path)
+            try:
+                exec(code, {"__name__": "__main__", "__file__": path})
+            finally:
+                _save_profile(profiler, profile_path)
+        finally:
+            with lock:
+                state["finished"] = True
+    except SystemExit:
+        pass
+    except BaseException:
+        # Also catches the ThreadAbortException raised by stop()
+        status = state["stop"] or "error"
+        tb = _format_script_traceback()
+        if state["stop"] and can_abort:
+            Thread.ResetAbort()
+    finally:
+        sys.settrace(None)
+        sys.stdout = old_stdout
+    duration = _clock() - start
+    if status != "error":
+        tb = None
+    return RunResult(status, duration, "".join(tee.parts), tb, max(state["peak"], 0) or None)
+
+
+def run_script(path, timeout=DEFAULT_TIMEOUT, memory_limit=DEFAULT_MEMORY_LIMIT, use_stub=True,
+               echo=True, profile_path=None):
+    """
+    Runs the script at `path` and returns a RunResult. Output is echoed to
+    the console as it is produced when echo=True. use_stub only applies to
+    the CPython worker. With a profile_path, rs calls are profiled with
+    rs_profiler and the JSON report is written there.
+    """
+    if IS_IRONPYTHON:
+        result = _run_in_process(path, timeout, memory_limit, echo, profile_path)
+    else:
+        result = _run_subprocess(path, timeout, memory_limit, use_stub, echo, profile_path)
+    if profile_path and os.path.exists(profile_path):
+        result.profile_path = profile_path
+    return result
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        flags = sys.argv[5:]
+        profile = [f.split("=", 1)[1] for f in flags if f.startswith("--profile=")]
+        _run_worker(sys.argv[2], sys.argv[3], int(sys.argv[4]), "--stub" in flags,
+                    profile[0] if profile else None)
+    else:
+        for script_path in sys.argv[1:]:
+            result = run_script(os.path.abspath(script_path))
+            print("{}: {} in {:.3f} s, peak memory {}".format(
+                script_path, result.status, result.duration, result.peak_memory))
+            if not result.ok:
+                print(result.error_message())
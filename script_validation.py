@@ -0,0 +1,215 @@
+"""
+Checks a generated script before it is offered to the user.
+
+Three stages, cheapest first:
+  compile   - the code is valid Python
+  imports   - every module alias the script uses (rs, sc, Rhino, math, ...)
+              is imported or defined in the script itself
+  dry_run   - the script runs to completion against rhino_stub, with prompts
+              answered by their defaults, in a script_runner worker process
+              with a timeout and the memory cap
+
+The dry run executes code the user has not agreed to run yet, so it only
+ever happens in that separate process. Where script_runner cannot isolate
+a script (inside Rhino it runs scripts in-process), or when a script
+imports modules able to touch the file system, processes or the network
+(os, shutil, subprocess, ...), there is no dry run: the script passes the
+first two stages as "unverified" and is only run when the user asks for it.
+"""
+import ast
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins
+
+import script_runner
+
+# Names scripts commonly use as modules, and the module each must come from
+KNOWN_MODULES = {
+    "rs": "rhinoscriptsyntax",
+    "rhinoscriptsyntax": "rhinoscriptsyntax",
+    "sc": "scriptcontext",
+    "scriptcontext": "scriptcontext",
+    "Rhino": "Rhino",
+    "System": "System",
+    "math": "math",
+    "random": "random",
+    "time": "time",
+}
+
+# Imports that keep a script from being dry-run
+UNSAFE_MODULES = ("os", "shutil", "subprocess", "socket", "urllib", "urllib2", "http",
+                  "requests", "ctypes", "multiprocessing", "threading", "io", "pathlib",
+                  "sys", "glob", "tempfile", "importlib", "builtins", "__builtin__", "pickle",
+                  "marshal", "codecs", "fileinput", "zipfile", "tarfile", "sqlite3", "webbrowser")
+
+# Builtins that reach the same things without an import
+UNSAFE_NAMES = ("open", "file", "__import__", "eval", "exec", "execfile", "compile", "getattr",
+                "globals", "vars", "__builtins__", "input", "raw_input")
+
+# Limits for the dry run (seconds, bytes)
+DRY_RUN_TIMEOUT = 10.0
+DRY_RUN_MEMORY_LIMIT = 512 * 1024 * 1024
+
+# Whether dry runs can happen in a separate process here
+CAN_DRY_RUN = not script_runner.IS_IRONPYTHON
+
+
+class ValidationResult(object):
+    """
+    Outcome of validate_script. `stage` is the last stage reached
+    ("compile", "imports" or "dry_run"); `verified` is False when the dry run
+    was skipped.
+    """
+
+    def __init__(self, ok, stage, error=None, verified=True, duration=0.0, objects_created=0,
+                 output=""):
+        self.ok = ok
+        self.stage = stage
+        self.error = error
+        self.verified = verified
+        self.duration = duration
+        self.objects_created = objects_created
+        self.output = output
+
+    def __repr__(self):
+        if self.ok:
+            state = "ok" if self.verified else "ok (not dry-run)"
+        else:
+            state = "failed at {}: {}".format(self.stage, self.error)
+        return "<ValidationResult {}>".format(state)
+
+
+def check_syntax(code, filename="<candidate>"):
+    """
+    Returns (tree, None) or (None, error message).
+    """
+    try:
+        return ast.parse(code, filename), None
+    except SyntaxError as e:
+        return None, "SyntaxError: {} (line {})".format(e.msg, e.lineno)
+
+
+def _bound_names(tree):
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                names.add(alias.asname or alias.name.split(".")[0])
+        elif isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            names.add(node.id)
+        elif getattr(ast, "arg", None) is not None and isinstance(node, ast.arg):
+            names.add(node.arg)
+    return names
+
+
+def imported_modules(tree):
+    modules = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.add(node.module)
+    return modules
+
+
+def missing_imports(tree):
+    """
+    Module aliases from KNOWN_MODULES that the script uses without binding,
+    as a sorted list of (alias, module) pairs.
+    """
+    bound = _bound_names(tree)
+    missing = set()
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)
+                and node.id in KNOWN_MODULES and node.id not in bound
+                and not hasattr(builtins, node.id)):
+            missing.add((node.id, KNOWN_MODULES[node.id]))
+    return sorted(missing)
+
+
+def is_unsafe(tree):
+    """
+    True if the script imports an UNSAFE_MODULES module, uses an UNSAFE_NAMES
+    builtin or any dunder attribute. This only narrows what is dry-run; the
+    worker process is what keeps the dry run away from Rhino.
+    """
+    for module in imported_modules(tree):
+        for unsafe in UNSAFE_MODULES:
+            if module == unsafe or module.startswith(unsafe + "."):
+                return True
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id in UNSAFE_NAMES:
+            return True
+        if isinstance(node, ast.Attribute) and node.attr.startswith("__"):
+            return True
+    return False
+
+
+def _short_error(result, path):
+    # Last traceback line, with the script line it was raised from
+    if result.status != "error" or not result.traceback:
+        return result.error_message()
+    lines = result.traceback.strip().splitlines()
+    where = ""
+    script_lines = re.findall(r'File "{}", line (\d+)'.format(re.escape(path)), result.traceback)
+    if script_lines:
+        where = " (line {})".format(script_lines[-1])
+    return lines[-1] + where
+
+
+def dry_run(code, timeout=DRY_RUN_TIMEOUT, memory_limit=DRY_RUN_MEMORY_LIMIT):
+    """
+    Executes the script against the Rhino stubs in a script_runner worker
+    process. Returns (error, objects_created, output) where error is None
+    when the script finished (or called sys.exit(0)).
+    """
+    folder = tempfile.mkdtemp(prefix="dry_run_")
+    path = os.path.join(folder, "candidate.py")
+    try:
+        with open(path, "w") as f:
+            f.write(code)
+        result = script_runner.run_script(path, timeout=timeout, memory_limit=memory_limit,
+                                          use_stub=True, echo=False)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    error = None if result.ok else _short_error(result, path)
+    return error, result.objects_created or 0, result.stdout
+
+
+def validate_script(code, run=True, timeout=DRY_RUN_TIMEOUT):
+    """
+    Runs the validation stages on `code` and returns a ValidationResult.
+    """
+    start = time.time()
+    tree, error = check_syntax(code)
+    if error:
+        return ValidationResult(False, "compile", error, duration=time.time() - start)
+
+    missing = missing_imports(tree)
+    if missing:
+        error = "Missing imports: " + ", ".join(
+            "{} (import {})".format(alias, module) for alias, module in missing)
+        return ValidationResult(False, "imports", error, duration=time.time() - start)
+
+    if not run or not CAN_DRY_RUN or is_unsafe(tree):
+        return ValidationResult(True, "imports", verified=False, duration=time.time() - start)
+
+    error, objects_created, output = dry_run(code, timeout)
+    return ValidationResult(error is None, "dry_run", error, duration=time.time() - start,
+                            objects_created=objects_created, output=output)
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        with open(path) as f:
+            print("{}: {}".format(path, validate_script(f.read())))
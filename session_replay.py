@@ -0,0 +1,348 @@
+"""
+Replays a session: runs its scripts again, in order, to rebuild the model.
+
+Turns whose script failed (an error record in session.jsonl, or an
+error_N.txt left by older versions) are skipped, and so are scripts that
+were saved but never run (no run record), unless include_unrun is set
+(--include-unrun). Sessions without any run records, written before runs
+were logged, replay every script without an error. The rest run in this
+process one after another with redraw turned off and inside a single undo
+record, so the view is redrawn once at the end and one Undo removes the
+whole replay. Unlike script_runner there is no timeout or memory cap.
+
+Compiled code objects are kept in a DiskCache ("code") as marshal data,
+keyed on a hash of the source, the file name and the Python version, so a
+replay of a long session spends its time on geometry rather than parsing.
+IronPython cannot marshal code objects, so in Rhino they are only kept in
+memory; get_code_cache keeps that cache in scriptcontext.sticky, so it
+lasts for the Rhino session and later replays reuse it.
+
+A report gives each step's load time (and whether the code came from the
+cache) and run time. It is printed and written to replay.json in the
+session folder.
+
+    python session_replay.py [SESSION] [--stop-on-error] [--include-unrun] [--report PATH]
+
+Without SESSION the latest session is replayed. Outside Rhino the scripts
+run against rhino_stub.
+"""
+import hashlib
+import json
+import marshal
+import os
+import platform
+import sys
+import time
+import traceback
+
+import disk_cache
+import session_store
+
+# time.perf_counter is not available on IronPython 2.7
+_clock = getattr(time, "perf_counter", time.time)
+
+CODE_CACHE_BYTES = 64 * 1024 * 1024
+
+REPORT_NAME = "replay.json"
+
+CODE_CACHE_STICKY_KEY = "session_replay.code_cache"
+
+# marshal data is only readable by the Python version that wrote it
+PYTHON_TAG = "{} {}".format(platform.python_implementation(), sys.version)
+
+
+def source_hash(source):
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+
+class CodeCache(object):
+    """
+    Compiled code objects by source, in memory and (where marshal supports
+    code objects) on disk.
+    """
+
+    def __init__(self, max_bytes=CODE_CACHE_BYTES, directory=None, use_disk=True):
+        self.store = None
+        if use_disk:
+            self.store = disk_cache.DiskCache("code", max_bytes=max_bytes, directory=directory)
+        self.memory = {}
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.compiles = 0
+
+    def get(self, source, filename):
+        """
+        Returns (code, origin) where origin is "memory", "disk" or "compiled".
+        Raises SyntaxError like compile().
+        """
+        key = disk_cache.cache_key(source_hash(source), filename, PYTHON_TAG)
+        code = self.memory.get(key)
+        if code is not None:
+            self.memory_hits += 1
+            return code, "memory"
+
+        if self.store is not None:
+            data = self.store.get(key)
+            if data is not None:
+                try:
+                    code = marshal.loads(data)
+                except (ValueError, EOFError, TypeError):
+                    # Truncated or foreign data: compile again and overwrite it
+                    code = None
+                if code is not None:
+                    self.memory[key] = code
+                    self.disk_hits += 1
+                    return code, "disk"
+
+        code = compile(source, filename, "exec")
+        self.compiles += 1
+        self.memory[key] = code
+        if self.store is not None:
+            try:
+                data = marshal.dumps(code)
+            except (ValueError, TypeError):
+                # IronPython: code objects are not marshallable
+                self.store = None
+            else:
+                self.store.put(key, data)
+        return code, "compiled"
+
+    def counts(self):
+        return self.compiles, self.disk_hits, self.memory_hits
+
+    def format_stats(self, since=(0, 0, 0)):
+        """
+        Counts since an earlier counts() (all of them by default).
+        """
+        compiles, disk_hits, memory_hits = [now - then for now, then in zip(self.counts(), since)]
+        return "Code cache: {} compiled, {} from disk, {} from memory".format(
+            compiles, disk_hits, memory_hits)
+
+
+def get_code_cache():
+    """
+    The CodeCache shared by replays in the current Rhino session (a new one
+    where there is no scriptcontext.sticky).
+    """
+    try:
+        import scriptcontext as sc
+        sticky = sc.sticky
+    except (ImportError, AttributeError):
+        return CodeCache()
+    cache = sticky.get(CODE_CACHE_STICKY_KEY)
+    if cache is None:
+        cache = sticky[CODE_CACHE_STICKY_KEY] = CodeCache()
+    return cache
+
+
+def replay_plan(session, include_unrun=False):
+    """
+    The session's turns in order, each with "skip" set to the reason it will
+    not be replayed (None for turns that will run).
+    """
+    turns = session.turns()
+    runs = session.runs()
+    ran = set(r.get("index") for r in runs)
+    for turn in turns:
+        legacy_error = os.path.join(session.folder, "error_{}.txt".format(turn["index"]))
+        if turn["error"] is not None or os.path.exists(legacy_error):
+            turn["skip"] = "error"
+        elif not turn["script"]:
+            turn["skip"] = "missing"
+        elif runs and not include_unrun and turn["index"] not in ran:
+            turn["skip"] = "not run"
+        else:
+            turn["skip"] = None
+    return turns
+
+
+class _Batch(object):
+    """
+    Turns redraw off and opens one undo record for the replay; both are
+    undone on exit and the view is redrawn once.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.rs = None
+        self.doc = None
+        self.record = None
+
+    def __enter__(self):
+        import rhinoscriptsyntax as rs
+        import scriptcontext as sc
+        self.rs = rs
+        self.doc = sc.doc
+        rs.EnableRedraw(False)
+        try:
+            self.record = self.doc.BeginUndoRecord(self.name)
+        except AttributeError:
+            self.record = None
+        return self
+
+    def suspend_redraw(self):
+        # Scripts often turn redraw back on when they finish
+        self.rs.EnableRedraw(False)
+
+    def __exit__(self, *exc):
+        if self.record is not None:
+            self.doc.EndUndoRecord(self.record)
+        self.rs.EnableRedraw(True)
+        self.rs.Redraw()
+
+
+def _run_code(code, path):
+    """
+    Runs one script; returns its traceback, or None if it succeeded.
+    """
+    try:
+        exec(code, {"__name__": "__main__", "__file__": path})
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            return "SystemExit: {}".format(e.code)
+    except Exception:
+        # Leave out this frame
+        etype, value, tb = sys.exc_info()
+        return "".join(traceback.format_exception(etype, value, tb.tb_next or tb))
+    return None
+
+
+def replay(session, cache=None, stop_on_error=False, on_step=None, include_unrun=False):
+    """
+    Replays `session` (a session_store.Session) in the current Rhino
+    document and returns a ReplayReport. on_step(step) is called after
+    every turn, including skipped ones. The cache defaults to get_code_cache().
+    """
+    if cache is None:
+        cache = get_code_cache()
+    counts = cache.counts()
+    if session.folder not in sys.path:
+        # Scripts may import modules saved next to them
+        sys.path.append(session.folder)
+
+    steps = []
+    start = _clock()
+    with _Batch("Replay " + session.name) as batch:
+        for turn in replay_plan(session, include_unrun):
+            step = {"index": turn["index"], "prompt": turn["prompt"], "status": "skipped",
+                    "reason": turn["skip"], "load": None, "load_seconds": 0.0,
+                    "run_seconds": 0.0, "error": None}
+            steps.append(step)
+            if turn["skip"] is None:
+                path = session.script_path(turn["index"])
+                load_start = _clock()
+                try:
+                    code, step["load"] = cache.get(turn["script"], path)
+                except (SyntaxError, ValueError, TypeError) as e:
+                    code = None
+                    step["error"] = "{}: {}".format(type(e).__name__, e)
+                step["load_seconds"] = _clock() - load_start
+                if code is not None:
+                    batch.suspend_redraw()
+                    run_start = _clock()
+                    step["error"] = _run_code(code, path)
+                    step["run_seconds"] = _clock() - run_start
+                step["status"] = "error" if step["error"] else "ok"
+            if on_step:
+                on_step(step)
+            if step["status"] == "error" and stop_on_error:
+                break
+    return ReplayReport(session.name, steps, _clock() - start, cache.format_stats(counts))
+
+
+class ReplayReport(object):
+    """
+    Per-step timings of one replay. `seconds` includes the final redraw.
+    """
+
+    def __init__(self, session_name, steps, seconds, cache_stats):
+        self.session_name = session_name
+        self.steps = steps
+        self.seconds = seconds
+        self.cache_stats = cache_stats
+
+    def count(self, status):
+        return len([s for s in self.steps if s["status"] == status])
+
+    def to_dict(self):
+        return {
+            "session": self.session_name,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "seconds": self.seconds,
+            "load_seconds": sum(s["load_seconds"] for s in self.steps),
+            "run_seconds": sum(s["run_seconds"] for s in self.steps),
+            "ok": self.count("ok"),
+            "errors": self.count("error"),
+            "skipped": self.count("skipped"),
+            "steps": self.steps,
+        }
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=1, sort_keys=True)
+
+    def format_report(self):
+        lines = ["{:>5}  {:<16} {:<9} {:>9} {:>9}  {}".format(
+            "index", "status", "load", "load ms", "run ms", "prompt")]
+        for s in self.steps:
+            status = "skipped: " + s["reason"] if s["status"] == "skipped" else s["status"]
+            lines.append("{:>5}  {:<16} {:<9} {:>9.2f} {:>9.2f}  {}".format(
+                s["index"], status, s["load"] or "-", s["load_seconds"] * 1000,
+                s["run_seconds"] * 1000, s["prompt"][:40]))
+        d = self.to_dict()
+        lines.append("{} run, {} failed, {} skipped in {:.2f} s ({:.2f} s loading, {:.2f} s running)".format(
+            d["ok"], d["errors"], d["skipped"], d["seconds"], d["load_seconds"], d["run_seconds"]))
+        lines.append(self.cache_stats)
+        return "\n".join(lines)
+
+
+def print_step(step):
+    if step["status"] == "error":
+        print("Script {} failed:\n{}".format(step["index"], step["error"]))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+
+    def option(name, default=None):
+        if name in args:
+            i = args.index(name)
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        return default
+
+    report_path = option("--report")
+    stop_on_error = "--stop-on-error" in args
+    include_unrun = "--include-unrun" in args
+    args = [a for a in args if a not in ("--stop-on-error", "--include-unrun")]
+
+    store = session_store.SessionStore()
+    try:
+        import Rhino
+        import rhinoscriptsyntax as rs
+        latest = store.latest_session()
+        name = rs.GetString("Session to replay", latest.name if latest else None)
+        stubs = None
+    except ImportError:
+        name = args[0] if args else None
+        # Outside Rhino the scripts draw into the stub document
+        import rhino_stub
+        stubs = rhino_stub.installed()
+        stubs.__enter__()
+
+    session = store.open_session(name) if name else store.latest_session()
+    if session is None:
+        print("No session to replay.")
+        sys.exit(1)
+    print("Replaying session " + session.name)
+    try:
+        report = replay(session, stop_on_error=stop_on_error, on_step=print_step,
+                        include_unrun=include_unrun)
+    finally:
+        if stubs is not None:
+            stubs.__exit__(None, None, None)
+    print(report.format_report())
+    report_path = report_path or os.path.join(session.folder, REPORT_NAME)
+    report.save(report_path)
+    print("Report written to " + report_path)
@@ -0,0 +1,378 @@
+"""
+Append-only session store for generate_rhino_script.py.
+
+Each session folder holds one session.jsonl log (one JSON record per line:
+turns, errors, runs and notes) plus the script_N.py files that are executed. A small sessions/index.json
+names the latest session, so opening it needs no directory scan, and the
+next turn index is kept in a counter file that is only updated under a lock,
+so concurrent writers never get the same index.
+
+Folders written by older versions (prompt_N.txt / script_N.py / error_N.txt)
+are migrated into a log the first time they are opened.
+
+With SessionStore(dedup=True) scripts are saved through a blob_store.BlobStore
+in sessions/.blobs: each distinct script is stored once, compressed and
+immutable, and the log records its digest instead of the text. The
+script_N.py files are ordinary copies, so editing one changes neither the
+log nor other sessions; link_scripts=True makes them hardlinks to one
+shared copy instead, to save space (they must then not be edited in place).
+"""
+import datetime
+import json
+import os
+import time
+
+LOG_NAME = "session.jsonl"
+COUNTER_NAME = "next_index"
+LOCK_NAME = "session.lock"
+INDEX_NAME = "index.json"
+BLOBS_NAME = ".blobs"
+
+
+def get_sessions_dir():
+    try:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+    except:
+        script_dir = os.getcwd()
+    sessions_dir = os.path.join(script_dir, "sessions")
+    if not os.path.exists(sessions_dir):
+        os.makedirs(sessions_dir)
+    return sessions_dir
+
+
+def _replace(tmp_path, path):
+    # os.rename does not overwrite on Windows and os.replace is missing on IronPython 2.7
+    if hasattr(os, "replace"):
+        os.replace(tmp_path, path)
+        return
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp_path, path)
+
+
+def _write_atomic(path, text):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    _replace(tmp_path, path)
+
+
+class FileLock(object):
+    """
+    Cross-process lock based on exclusive creation of a lock file. A lock
+    older than `stale_after` seconds is assumed to belong to a crashed writer.
+    """
+
+    def __init__(self, path, timeout=10.0, stale_after=30.0):
+        self.path = path
+        self.timeout = timeout
+        self.stale_after = stale_after
+
+    def __enter__(self):
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.close(fd)
+                return self
+            except OSError:
+                try:
+                    stale = time.time() - os.path.getmtime(self.path) > self.stale_after
+                except OSError:
+                    stale = False
+                if stale:
+                    try:
+                        os.remove(self.path)
+                    except OSError:
+                        pass
+                    continue
+                if time.time() > deadline:
+                    raise IOError("Timed out waiting for lock " + self.path)
+                time.sleep(0.01)
+
+    def __exit__(self, *exc):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class Session(object):
+    """
+    One session folder. Records are read from the log once and kept in
+    memory; appends go to both.
+    """
+
+    def __init__(self, folder, blobs=None, link_scripts=False):
+        self.folder = folder
+        self.blobs = blobs
+        self.link_scripts = link_scripts
+        self.name = os.path.basename(folder.rstrip("/\\"))
+        self.log_path = os.path.join(folder, LOG_NAME)
+        self._records = None
+        if not os.path.exists(self.log_path):
+            migrate_legacy_session(folder)
+
+    def _lock(self):
+        return FileLock(os.path.join(self.folder, LOCK_NAME))
+
+    def records(self):
+        if self._records is None:
+            records = []
+            if os.path.exists(self.log_path):
+                with open(self.log_path, "r") as f:
+                    for line in f:
+                        line = line.strip()
+                        if line:
+                            try:
+                                records.append(json.loads(line))
+                            except ValueError:
+                                # A torn final line from a crashed writer
+                                pass
+            self._records = records
+        return self._records
+
+    def append(self, record):
+        """
+        Appends one record as a single line under the session lock.
+        """
+        record = dict(record)
+        record.setdefault("time", time.time())
+        line = json.dumps(record) + "\n"
+        with self._lock():
+            with open(self.log_path, "a") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+        if self._records is not None:
+            self._records.append(record)
+        return record
+
+    def _read_counter(self):
+        try:
+            with open(os.path.join(self.folder, COUNTER_NAME), "r") as f:
+                return int(f.read().strip() or 0)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def next_index(self):
+        """
+        Index the next turn would get (without reserving it).
+        """
+        value = self._read_counter()
+        if value is None:
+            value = 1 + max([r["index"] for r in self.records() if "index" in r] or [-1])
+        return value
+
+    def allocate_index(self):
+        """
+        Reserves and returns the next turn index.
+        """
+        with self._lock():
+            index = self.next_index()
+            _write_atomic(os.path.join(self.folder, COUNTER_NAME), str(index + 1))
+        return index
+
+    def script_path(self, index):
+        return os.path.join(self.folder, "script_{}.py".format(index))
+
+    def add_turn(self, index, prompt, script):
+        """
+        Records a prompt and the generated script; returns the script path.
+        """
+        path = self.script_path(index)
+        if self.blobs is not None:
+            # The compressed object is the record of the turn; the file is a working copy
+            digest = self.blobs.put(script)
+            if self.link_scripts:
+                self.blobs.write_file(path, script)
+            else:
+                with open(path, "w") as f:
+                    f.write(script)
+            self.append({"type": "turn", "index": index, "prompt": prompt, "script_blob": digest})
+            return path
+        with open(path, "w") as f:
+            f.write(script)
+        self.append({"type": "turn", "index": index, "prompt": prompt, "script": script})
+        return path
+
+    def _script_text(self, record):
+        if "script_blob" not in record:
+            return record.get("script")
+        if self.blobs is not None:
+            try:
+                return self.blobs.get(record["script_blob"]).decode("utf-8")
+            except (KeyError, ValueError):
+                pass
+        # Sessions saved before scripts were stored as objects: the file,
+        # if it still has the recorded content
+        try:
+            with open(self.script_path(record["index"]), "rb") as f:
+                data = f.read()
+        except (IOError, OSError):
+            return None
+        import blob_store
+        if blob_store.digest_of(data) != record["script_blob"]:
+            return None
+        return data.decode("utf-8")
+
+    def add_error(self, index, error):
+        self.append({"type": "error", "index": index, "error": error})
+
+    def add_run(self, index, result):
+        """
+        Records one execution of a script (a script_runner.RunResult, or
+        the dict its to_record() returns).
+        """
+        record = {"type": "run", "index": index}
+        record.update(result if isinstance(result, dict) else result.to_record())
+        self.append(record)
+
+    def add_note(self, index, note):
+        self.append({"type": "note", "index": index, "note": note})
+
+    def runs(self, min_duration=None):
+        """
+        The session's run records, optionally only those that took at least
+        `min_duration` seconds.
+        """
+        return [r for r in self.records() if r.get("type") == "run"
+                and (min_duration is None or r.get("duration", 0) >= min_duration)]
+
+    def turns(self):
+        """
+        The session's turns in order as dicts with index, prompt, script,
+        error (None if the script ran cleanly or was never run) and note.
+        """
+        turns = []
+        by_index = {}
+        for record in self.records():
+            kind = record.get("type")
+            if kind == "turn":
+                turn = {"index": record["index"], "prompt": record["prompt"],
+                        "script": self._script_text(record), "error": None, "note": None}
+                by_index[turn["index"]] = turn
+                turns.append(turn)
+            elif kind == "error" and record.get("index") in by_index:
+                by_index[record["index"]]["error"] = record["error"]
+            elif kind == "note" and record.get("index") in by_index:
+                by_index[record["index"]]["note"] = record["note"]
+        return turns
+
+
+def migrate_legacy_session(folder):
+    """
+    Converts a folder of prompt_N.txt / script_N.py / error_N.txt files into a
+    session.jsonl log. The old files are left in place. Returns the number of
+    turns migrated.
+    """
+    records = []
+    index = 0
+    while True:
+        prompt_file = os.path.join(folder, "prompt_{}.txt".format(index))
+        if not os.path.exists(prompt_file):
+            break
+        with open(prompt_file, "r") as f:
+            prompt_text = f.read()
+        script_file = os.path.join(folder, "script_{}.py".format(index))
+        script_code = None
+        if os.path.exists(script_file):
+            with open(script_file, "r") as f:
+                script_code = f.read()
+        records.append({"type": "turn", "index": index, "prompt": prompt_text, "script": script_code,
+                        "time": os.path.getmtime(prompt_file), "migrated": True})
+        error_file = os.path.join(folder, "error_{}.txt".format(index))
+        if os.path.exists(error_file):
+            with open(error_file, "r") as f:
+                records.append({"type": "error", "index": index, "error": f.read(),
+                                "time": os.path.getmtime(error_file), "migrated": True})
+        index += 1
+    _write_atomic(os.path.join(folder, LOG_NAME), "".join(json.dumps(r) + "\n" for r in records))
+    _write_atomic(os.path.join(folder, COUNTER_NAME), str(index))
+    return index
+
+
+class SessionStore(object):
+    """
+    The sessions directory and its index.json ({"latest": name, "sessions": [...]}).
+    """
+
+    def __init__(self, sessions_dir=None, dedup=False, link_scripts=False):
+        self.sessions_dir = sessions_dir or get_sessions_dir()
+        if not os.path.exists(self.sessions_dir):
+            os.makedirs(self.sessions_dir)
+        self.index_path = os.path.join(self.sessions_dir, INDEX_NAME)
+        self.blobs = None
+        self.link_scripts = link_scripts
+        if dedup:
+            import blob_store
+            self.blobs = blob_store.BlobStore(os.path.join(self.sessions_dir, BLOBS_NAME))
+
+    def _session_dirs(self):
+        return sorted(d for d in os.listdir(self.sessions_dir)
+                      if not d.startswith(".") and os.path.isdir(os.path.join(self.sessions_dir, d)))
+
+    def _lock(self):
+        return FileLock(os.path.join(self.sessions_dir, LOCK_NAME))
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, "r") as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def rebuild_index(self):
+        """
+        Builds index.json by scanning the folder (needed once for session
+        directories created before the index existed).
+        """
+        names = self._session_dirs()
+        index = {"latest": names[-1] if names else None, "sessions": names}
+        with self._lock():
+            _write_atomic(self.index_path, json.dumps(index))
+        return index
+
+    def session_names(self):
+        index = self._read_index() or self.rebuild_index()
+        return list(index["sessions"])
+
+    def latest_session(self):
+        """
+        The most recently created session, or None.
+        """
+        index = self._read_index() or self.rebuild_index()
+        if not index["latest"]:
+            return None
+        folder = os.path.join(self.sessions_dir, index["latest"])
+        if not os.path.isdir(folder):
+            index = self.rebuild_index()
+            if not index["latest"]:
+                return None
+            folder = os.path.join(self.sessions_dir, index["latest"])
+        return Session(folder, self.blobs, self.link_scripts)
+
+    def create_session(self):
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        with self._lock():
+            name = timestamp
+            suffix = 1
+            while os.path.exists(os.path.join(self.sessions_dir, name)):
+                name = "{}_{}".format(timestamp, suffix)
+                suffix += 1
+            folder = os.path.join(self.sessions_dir, name)
+            os.makedirs(folder)
+            index = self._read_index()
+            if index is None:
+                index = {"sessions": self._session_dirs()}
+            elif name not in index["sessions"]:
+                index["sessions"].append(name)
+            index["latest"] = name
+            _write_atomic(self.index_path, json.dumps(index))
+        return Session(folder, self.blobs, self.link_scripts)
+
+    def open_session(self, name_or_folder):
+        folder = name_or_folder
+        if not os.path.isabs(folder):
+            folder = os.path.join(self.sessions_dir, name_or_folder)
+        return Session(folder, self.blobs, self.link_scripts)